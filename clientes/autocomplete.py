@@ -0,0 +1,63 @@
+import re
+
+from django.db import transaction
+from django.db.models import Q
+
+from core.indice_prefixos import IndicePrefixos, chaves_por_palavra
+from core.texto import normalizar_busca, filtro_prefixo
+from .models import Cliente
+
+
+def _digitos(texto):
+    return re.sub(r'\D', '', texto or '')
+
+
+def chaves_cliente(nome, cpf_cnpj):
+    chaves = chaves_por_palavra(normalizar_busca(nome))
+    if _digitos(cpf_cnpj):
+        chaves.add(_digitos(cpf_cnpj))
+    return chaves
+
+
+def _carregar_clientes():
+    campos = Cliente.objects.values_list('pk', 'nome', 'cpf_cnpj').iterator(chunk_size=2000)
+    for pk, nome, cpf_cnpj in campos:
+        yield pk, chaves_cliente(nome, cpf_cnpj), {'id': pk, 'nome': nome, 'cpf_cnpj': cpf_cnpj}
+
+
+indice_clientes = IndicePrefixos(_carregar_clientes)
+
+
+def termo_cliente(termo):
+    """CPF/CNPJ digitado com ou sem pontuação vira só dígitos; nomes são normalizados."""
+    if re.search(r'[^\d.\-/\s]', termo):
+        return normalizar_busca(termo)
+    return _digitos(termo)
+
+
+def buscar_clientes(termo, limite=10):
+    """Clientes com nome (ou palavra do nome) ou CPF/CNPJ começando por `termo`; None se o índice estiver frio."""
+    return indice_clientes.buscar(termo_cliente(termo), limite)
+
+
+def filtro_clientes(termo):
+    """
+    Q do autocomplete pelo banco (índice frio, desligado ou acima de maximo_itens):
+    só faixas indexadas, pelo começo do nome normalizado ou do CPF/CNPJ. As
+    palavras do meio do nome ("silva" em "joao silva") só o índice em memória
+    acha; um LIKE '% termo%' percorreria a tabela inteira a cada tecla.
+    """
+    prefixo = termo_cliente(termo)
+    if not prefixo:
+        return Q(pk__in=[])
+    return Q(**filtro_prefixo('nome_busca', prefixo)) | Q(**filtro_prefixo('documento_busca', prefixo))
+
+
+def cliente_alterado(cliente):
+    chaves = chaves_cliente(cliente.nome, cliente.cpf_cnpj)
+    dados = {'id': cliente.pk, 'nome': cliente.nome, 'cpf_cnpj': cliente.cpf_cnpj}
+    transaction.on_commit(lambda: indice_clientes.atualizar(cliente.pk, chaves, dados))
+
+
+def cliente_removido(cliente_id):
+    transaction.on_commit(lambda: indice_clientes.remover(cliente_id))
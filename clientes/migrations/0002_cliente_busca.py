@@ -0,0 +1,37 @@
+# Generated by Django 5.1 on 2026-10-18 13:43
+
+import re
+
+from django.db import migrations, models
+
+from core.texto import normalizar_busca
+
+
+def preencher_campos_busca(apps, schema_editor):
+    Cliente = apps.get_model('clientes', 'Cliente')
+    clientes = list(Cliente.objects.only('pk', 'nome', 'cpf_cnpj'))
+    for cliente in clientes:
+        cliente.nome_busca = normalizar_busca(cliente.nome)
+        cliente.documento_busca = re.sub(r'\D', '', cliente.cpf_cnpj or '')
+    Cliente.objects.bulk_update(clientes, ['nome_busca', 'documento_busca'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='documento_busca',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=14),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='nome_busca',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(preencher_campos_busca, migrations.RunPython.noop),
+    ]
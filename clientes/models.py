@@ -1,6 +1,10 @@
+import re
+
 from django.db import models
 from django.core.validators import RegexValidator
 
+from core.texto import normalizar_busca
+
 
 class Cliente(models.Model):
     nome = models.CharField(max_length=200, verbose_name="Nome Completo")
@@ -30,10 +34,19 @@ class Cliente(models.Model):
     data_cadastro = models.DateTimeField(auto_now_add=True)
     ativo = models.BooleanField(default=True)
     
+    # Formas normalizadas para o autocomplete pelo banco (mesma regra do índice de prefixos)
+    nome_busca = models.CharField(max_length=200, editable=False, db_index=True, default='')
+    documento_busca = models.CharField(max_length=14, editable=False, db_index=True, default='')
+    
     class Meta:
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
         ordering = ['nome']
     
     def __str__(self):
-        return f"{self.nome} - {self.telefone_principal}"
\ No newline at end of file
+        return f"{self.nome} - {self.telefone_principal}"
+    
+    def save(self, *args, **kwargs):
+        self.nome_busca = normalizar_busca(self.nome)
+        self.documento_busca = re.sub(r'\D', '', self.cpf_cnpj or '')
+        super().save(*args, **kwargs)
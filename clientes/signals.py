@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Cliente
+from .autocomplete import cliente_alterado, cliente_removido
+
+
+@receiver(post_save, sender=Cliente)
+def atualizar_autocomplete_cliente(sender, instance, **kwargs):
+    cliente_alterado(instance)
+
+
+@receiver(post_delete, sender=Cliente)
+def remover_autocomplete_cliente(sender, instance, **kwargs):
+    cliente_removido(instance.pk)
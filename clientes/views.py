@@ -30,7 +30,7 @@ def cliente_lista(request):
 @login_required
 def cliente_detalhe(request, pk):
     cliente = get_object_or_404(Cliente, pk=pk)
-    ordens_servico = cliente.ordens_servico.all().order_by('-data_entrada')[:10]
+    ordens_servico = cliente.ordens.all().order_by('-data_entrada')[:10]
     
     context = {
         'cliente': cliente,
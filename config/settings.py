@@ -143,3 +143,11 @@ MEDIA_ROOT = BASE_DIR / 'media'
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
+
+# Índice de prefixos em memória dos autocompletes de peças e clientes
+# (False: as buscas vão sempre ao banco)
+INDICE_PREFIXOS_ATIVO = True
+
+# Meses de movimentações de estoque mantidos na tabela principal; os anteriores
+# vão para o arquivo mensal (comando arquivar_movimentacoes)
+ESTOQUE_MESES_ATIVOS = 24
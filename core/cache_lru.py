@@ -0,0 +1,39 @@
+import threading
+from collections import OrderedDict
+
+
+class CacheLRU:
+    """
+    Cache pequeno em memória (por processo) que descarta o item usado há mais
+    tempo quando passa de `maximo_itens`. Seguro entre threads.
+    """
+
+    def __init__(self, maximo_itens=256):
+        self.maximo_itens = maximo_itens
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._itens)
+
+    def get(self, chave, padrao=None):
+        with self._lock:
+            if chave not in self._itens:
+                return padrao
+            self._itens.move_to_end(chave)
+            return self._itens[chave]
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.maximo_itens:
+                self._itens.popitem(last=False)
+
+    def remover(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+
+from .texto import FIM_PREFIXO
+
+logger = logging.getLogger(__name__)
+
+
+class IndicePrefixos:
+    """
+    Índice de prefixos em memória (por processo) para os autocompletes.
+
+    Guarda as chaves normalizadas em uma lista ordenada de (chave, id): é uma trie
+    "achatada", em que todas as chaves com um prefixo ficam em uma faixa contígua
+    encontrada com busca binária. Ocupa uma fração da memória de uma trie de dicts
+    e a busca é O(log n) mais o tamanho do resultado.
+
+    - Carrega sob demanda: a primeira busca num índice frio devolve None (quem
+      chamou responde pelo banco) e dispara a carga em uma thread.
+    - Recebe atualizações incrementais (atualizar/remover) dos signals dos modelos.
+    - Tem limite de tamanho: se a fonte tiver mais de `maximo_itens` registros o
+      índice não é montado e as buscas continuam indo ao banco. O limite conta
+      registros, não chaves nem bytes: cada registro entra na lista com uma chave
+      por palavra do nome (mais código ou documento), então com nomes de até 5
+      ou 6 palavras o padrão de 100 mil registros dá perto de 600 mil chaves,
+      algo na casa de 100 MB por processo.
+    - Expira após `tempo_vida` segundos, como rede de segurança para alterações
+      feitas em outros processos ou sem passar pelos signals.
+
+    carregar: função sem argumentos que devolve um iterável de (id, chaves, dados).
+    """
+
+    def __init__(self, carregar, maximo_itens=100000, tempo_vida=600):
+        self._carregar = carregar
+        self.maximo_itens = maximo_itens
+        self.tempo_vida = tempo_vida
+        self._lock = threading.Lock()
+        self._limpar()
+        self._tentar_apos = 0   # após estourar o limite, só tenta de novo depois do tempo_vida
+
+    def _limpar(self):
+        self._chaves = []       # [(chave, id)] em ordem
+        self._itens = {}        # id -> (chaves, dados)
+        self._pronto = False
+        self._carregando = False
+        self._pendentes = []    # alterações recebidas durante a carga
+        self._carregado_em = 0
+
+    @property
+    def pronto(self):
+        return self._pronto and time.monotonic() - self._carregado_em < self.tempo_vida
+
+    def buscar(self, prefixo, limite=20):
+        """Dados dos itens com alguma chave começando por `prefixo`, ou None se o índice estiver frio."""
+        if not getattr(settings, 'INDICE_PREFIXOS_ATIVO', True):
+            return None
+        if not self.pronto:
+            self.aquecer()
+            return None
+        if not prefixo:
+            return []
+
+        with self._lock:
+            chaves = self._chaves
+            inicio = bisect_left(chaves, (prefixo,))
+            fim = bisect_left(chaves, (prefixo + FIM_PREFIXO,), inicio)
+            resultado = []
+            vistos = set()
+            for posicao in range(inicio, fim):
+                item_id = chaves[posicao][1]
+                if item_id not in vistos:
+                    vistos.add(item_id)
+                    resultado.append(self._itens[item_id][1])
+                    if len(resultado) >= limite:
+                        break
+        return resultado
+
+    def aquecer(self):
+        """Dispara a carga em segundo plano, se ainda não houver uma em andamento."""
+        with self._lock:
+            if self._carregando or time.monotonic() < self._tentar_apos:
+                return
+            self._carregando = True
+        threading.Thread(target=self.carregar, daemon=True).start()
+
+    def carregar(self):
+        """Monta o índice a partir da fonte (bloqueante)."""
+        with self._lock:
+            self._carregando = True
+            self._pendentes = []
+        try:
+            itens = {}
+            for item_id, chaves, dados in self._carregar():
+                if len(itens) >= self.maximo_itens:
+                    logger.warning('Índice de prefixos não montado: mais de %s itens.', self.maximo_itens)
+                    with self._lock:
+                        self._limpar()
+                        self._tentar_apos = time.monotonic() + self.tempo_vida
+                    return
+                itens[item_id] = (chaves, dados)
+        except Exception:
+            logger.exception('Falha ao carregar o índice de prefixos.')
+            with self._lock:
+                self._limpar()
+                self._tentar_apos = time.monotonic() + self.tempo_vida
+            return
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
+
+        with self._lock:
+            self._itens = itens
+            self._chaves = sorted(
+                (chave, item_id) for item_id, (chaves, _) in itens.items() for chave in chaves
+            )
+            # Aplica o que mudou enquanto a fonte era lida
+            pendentes, self._pendentes = self._pendentes, []
+            for alteracao in pendentes:
+                alteracao()
+            if time.monotonic() < self._tentar_apos:
+                return  # uma das alterações estourou o limite
+            self._pronto = True
+            self._carregando = False
+            self._carregado_em = time.monotonic()
+
+    def atualizar(self, item_id, chaves, dados):
+        with self._lock:
+            if self._carregando:
+                self._pendentes.append(lambda: self._atualizar(item_id, chaves, dados))
+            elif self._pronto:
+                self._atualizar(item_id, chaves, dados)
+
+    def remover(self, item_id):
+        with self._lock:
+            if self._carregando:
+                self._pendentes.append(lambda: self._remover(item_id))
+            elif self._pronto:
+                self._remover(item_id)
+
+    def invalidar(self):
+        """Descarta o índice; a próxima busca volta ao banco e recarrega."""
+        with self._lock:
+            self._limpar()
+
+    def _atualizar(self, item_id, chaves, dados):
+        self._remover(item_id)
+        if len(self._itens) >= self.maximo_itens:
+            self._limpar()
+            self._tentar_apos = time.monotonic() + self.tempo_vida
+            return
+        self._itens[item_id] = (chaves, dados)
+        for chave in chaves:
+            insort(self._chaves, (chave, item_id))
+
+    def _remover(self, item_id):
+        antigo = self._itens.pop(item_id, None)
+        if antigo:
+            for chave in antigo[0]:
+                posicao = bisect_left(self._chaves, (chave, item_id))
+                if posicao < len(self._chaves) and self._chaves[posicao] == (chave, item_id):
+                    del self._chaves[posicao]
+
+
+def chaves_por_palavra(texto):
+    """O texto normalizado e cada sufixo que começa numa palavra, para achar "silva" em "joao silva"."""
+    palavras = texto.split()
+    return {' '.join(palavras[i:]) for i in range(len(palavras))}
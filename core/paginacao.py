@@ -0,0 +1,64 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def codificar_cursor(data, pk):
+    """Gera um cursor opaco a partir da chave (data, id) do último registro da página."""
+    bruto = f"{data.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+class CursorInvalido(ValueError):
+    """Cursor malformado ou adulterado (não foi gerado por codificar_cursor)."""
+
+
+# Maior id aceito no cursor (BIGINT); acima disso o banco recusaria o parâmetro
+MAIOR_ID = 2 ** 63 - 1
+
+
+def decodificar_cursor(cursor):
+    """Retorna a tupla (data, id) do cursor, None sem cursor ou CursorInvalido se ele for inválido."""
+    if not cursor:
+        return None
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        bruto = base64.urlsafe_b64decode(cursor + preenchimento).decode()
+        data, pk = bruto.rsplit('|', 1)
+        data, pk = datetime.fromisoformat(data), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise CursorInvalido('Cursor de paginação inválido.')
+    if data.tzinfo is None or not 0 < pk <= MAIOR_ID:
+        raise CursorInvalido('Cursor de paginação inválido.')
+    return data, pk
+
+
+def paginar_por_cursor(queryset, cursor, tamanho, campo_data):
+    """
+    Paginação por chave (keyset) em ordem decrescente de (campo_data, id).
+
+    Ao contrário do OFFSET, o banco não precisa percorrer as linhas das páginas
+    anteriores: a condição sobre a chave do último item usa o índice composto,
+    então o custo de cada página é o mesmo na primeira ou na milésima página.
+    Retorna (itens, proximo_cursor); proximo_cursor é None na última página.
+    Levanta CursorInvalido se o cursor recebido não for um cursor válido.
+    """
+    chave = decodificar_cursor(cursor)
+    if chave:
+        data, pk = chave
+        queryset = queryset.filter(
+            Q(**{f'{campo_data}__lt': data}) |
+            Q(**{campo_data: data, 'pk__lt': pk})
+        )
+
+    # Busca um item a mais só para saber se existe próxima página
+    itens = list(queryset.order_by(f'-{campo_data}', '-pk')[:tamanho + 1])
+    proximo_cursor = None
+    if len(itens) > tamanho:
+        itens = itens[:tamanho]
+        ultimo = itens[-1]
+        proximo_cursor = codificar_cursor(getattr(ultimo, campo_data), ultimo.pk)
+
+    return itens, proximo_cursor
@@ -0,0 +1,30 @@
+import re
+import unicodedata
+
+# Maior caractere possível: "prefixo + FIM_PREFIXO" fica depois de qualquer texto que comece com o prefixo
+FIM_PREFIXO = '\U0010ffff'
+
+
+def normalizar_busca(texto):
+    """Forma usada nos índices de busca: minúsculas, sem acentos e com espaços simples."""
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    sem_acentos = ''.join(c for c in decomposto if not unicodedata.combining(c))
+    return ' '.join(sem_acentos.lower().split())
+
+
+def normalizar_codigo(texto):
+    """
+    Forma usada na leitura de códigos (part number, etiqueta): só letras e dígitos,
+    em maiúsculas. "ssd-240 ", "SSD 240" e "SSD.240" viram "SSD240".
+    """
+    return re.sub(r'[^0-9A-Z]', '', normalizar_busca(texto).upper())
+
+
+def filtro_prefixo(campo, prefixo):
+    """
+    Kwargs de um filtro "começa com" escrito como faixa (campo >= prefixo e < prefixo + FIM_PREFIXO).
+    Ao contrário do LIKE 'x%', a faixa usa um índice B-tree comum em qualquer banco,
+    sem depender de collation ou de operator class específica.
+    """
+    return {f'{campo}__gte': prefixo, f'{campo}__lt': prefixo + FIM_PREFIXO}
+
@@ -1,5 +1,8 @@
 from django.contrib import admin
+from django.db.models import F, Q
 from django.utils.html import format_html
+
+from core.texto import normalizar_busca, normalizar_codigo, filtro_prefixo
 from .models import CategoriaPeca, Peca, MovimentacaoEstoque
 
 
@@ -13,48 +16,83 @@ class CategoriaPecaAdmin(admin.ModelAdmin):
 class PecaAdmin(admin.ModelAdmin):
     list_display = [
         'codigo_interno', 
-        'descricao', 
+        'nome', 
         'categoria', 
-        'quantidade_estoque', 
+        'saldo_atual', 
         'status_estoque',
         'preco_venda', 
         'fornecedor_principal',
         'ativo'
     ]
-    list_filter = ['categoria', 'ativo', 'fornecedor_principal']
-    search_fields = ['codigo_interno', 'descricao']
+    list_filter = ['ativo', 'saldo__estoque_baixo', 'categoria']
+    search_fields = ['codigo_interno', 'nome_busca', 'part_number']
+    list_select_related = ['categoria', 'fornecedor_principal']
+    autocomplete_fields = ['categoria', 'fornecedor_principal']
     list_per_page = 25
+    # Sem o COUNT(*) da tabela inteira a cada página da listagem
+    show_full_result_count = False
     
     fieldsets = (
         ('Identificação', {
-            'fields': ('codigo_interno', 'descricao', 'categoria')
+            'fields': ('codigo_interno', 'nome', 'part_number', 'descricao', 'categoria')
         }),
         ('Estoque', {
-            'fields': ('quantidade_estoque', 'estoque_minimo', 'localizacao')
+            'fields': ('saldo_atual', 'quantidade_minima', 'localizacao')
         }),
         ('Valores', {
-            'fields': ('preco_custo', 'preco_venda')
+            'fields': ('ultimo_preco_compra', 'margem_lucro', 'preco_venda')
         }),
         ('Fornecedor', {
             'fields': ('fornecedor_principal',)
         }),
         ('Observações', {
-            'fields': ('observacoes', 'ativo'),
+            'fields': ('observacoes', 'ativo', 'data_cadastro'),
             'classes': ('collapse',)
         }),
     )
     
-    readonly_fields = ['data_cadastro']
+    readonly_fields = ['codigo_interno', 'saldo_atual', 'data_cadastro']
+    
+    def get_queryset(self, request):
+        # Saldo e flag de estoque baixo vêm no mesmo SELECT, pelo JOIN com SaldoEstoque
+        return super().get_queryset(request).annotate(
+            _saldo=F('saldo__quantidade'),
+            _estoque_baixo=F('saldo__estoque_baixo'),
+        )
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Busca por prefixo nas colunas indexadas, como o autocomplete da aplicação
+        # (um LIKE '%termo%' percorreria a tabela inteira)
+        termo = search_term.strip()
+        if not termo:
+            return queryset, False
+        filtro = (
+            Q(**filtro_prefixo('nome_busca', normalizar_busca(termo))) |
+            Q(**filtro_prefixo('codigo_interno', termo.upper()))
+        )
+        part_number = normalizar_codigo(termo)
+        if part_number:
+            filtro |= Q(part_number_normalizado=part_number)
+        queryset = queryset.filter(filtro)
+        return queryset, False
+    
+    @admin.display(description='Saldo', ordering='_saldo')
+    def saldo_atual(self, obj):
+        return getattr(obj, '_saldo', None) or 0
     
+    @admin.display(description='Status', ordering='_estoque_baixo')
     def status_estoque(self, obj):
-        if obj.estoque_baixo:
+        estoque_baixo = getattr(obj, '_estoque_baixo', None)
+        if estoque_baixo is None:
+            # Peça sem linha em SaldoEstoque (ex: gravada por bulk_create): sem status até o reconstruir_saldos
+            return '—'
+        if estoque_baixo:
             return format_html(
                 '<span style="color: red; font-weight: bold;">⚠️ BAIXO</span>'
             )
         return format_html(
             '<span style="color: green;">✓ OK</span>'
         )
-    status_estoque.short_description = 'Status'
 
 
 @admin.register(MovimentacaoEstoque)
@@ -68,16 +106,20 @@ class MovimentacaoEstoqueAdmin(admin.ModelAdmin):
         'ordem_servico'
     ]
     list_filter = ['tipo', 'data_movimentacao']
-    search_fields = ['peca__descricao', 'peca__codigo_interno']
+    search_fields = ['=peca__codigo_interno', '^peca__nome']
     date_hierarchy = 'data_movimentacao'
+    list_select_related = ['peca', 'usuario', 'ordem_servico__cliente']
+    # Selects com milhares de peças/OS/notas viram buscas sob demanda
+    autocomplete_fields = ['peca', 'ordem_servico', 'nota_fiscal', 'fornecedor']
     list_per_page = 30
+    show_full_result_count = False
     
     fieldsets = (
         ('Movimentação', {
             'fields': ('peca', 'tipo', 'quantidade', 'valor_unitario')
         }),
         ('Relacionamentos', {
-            'fields': ('ordem_servico', 'fornecedor', 'usuario')
+            'fields': ('ordem_servico', 'nota_fiscal', 'fornecedor', 'usuario')
         }),
         ('Observações', {
             'fields': ('observacoes',),
@@ -0,0 +1,98 @@
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import MovimentacaoEstoque, MovimentacaoArquivada
+from .servicos import proximo_mes, horizonte_arquivo
+from .snapshots import gerar_snapshots, inicio_do_dia
+
+# Colunas copiadas da tabela quente para o arquivo (o id é mantido)
+COLUNAS = [
+    'id', 'peca_id', 'tipo', 'quantidade', 'valor_unitario', 'data_movimentacao',
+    'usuario_id', 'nota_fiscal_id', 'ordem_servico_id', 'fornecedor_id', 'observacoes',
+]
+TAMANHO_LOTE_SNAPSHOT = 500
+
+
+def _em_lotes(ids, tamanho=TAMANHO_LOTE_SNAPSHOT):
+    ids = sorted(ids)
+    for inicio in range(0, len(ids), tamanho):
+        yield ids[inicio:inicio + tamanho]
+
+
+def meses_a_arquivar(limite):
+    """Meses (date do dia 1) com movimentações na tabela quente anteriores a `limite` (date do dia 1)."""
+    primeira = MovimentacaoEstoque.objects.aggregate(data=Min('data_movimentacao'))['data']
+    if primeira is None:
+        return []
+    meses = []
+    mes = timezone.localtime(primeira).date().replace(day=1)
+    while mes < limite:
+        meses.append(mes)
+        mes = proximo_mes(mes)
+    return meses
+
+
+def arquivar_mes(mes):
+    """
+    Move as movimentações de um mês (date do dia 1) para MovimentacaoArquivada.
+
+    Antes da cópia, o saldo de abertura do mês seguinte das peças movimentadas
+    é gravado em SnapshotEstoque. A cópia (INSERT ... SELECT) e a remoção são
+    feitas em SQL direto, na mesma transação: a exclusão não pode passar pelos
+    signals, que estornariam o saldo materializado das peças.
+    Retorna o número de movimentações arquivadas.
+    """
+    inicio, fim = inicio_do_dia(mes), inicio_do_dia(proximo_mes(mes))
+    tabela = MovimentacaoEstoque._meta.db_table
+    arquivo = MovimentacaoArquivada._meta.db_table
+    colunas = ', '.join(connection.ops.quote_name(coluna) for coluna in COLUNAS)
+    periodo = [
+        connection.ops.adapt_datetimefield_value(inicio),
+        connection.ops.adapt_datetimefield_value(fim),
+    ]
+
+    with transaction.atomic():
+        peca_ids = set(
+            MovimentacaoEstoque.objects.filter(
+                data_movimentacao__gte=inicio, data_movimentacao__lt=fim
+            ).values_list('peca_id', flat=True).distinct()
+        )
+        if not peca_ids:
+            return 0
+        for ids in _em_lotes(peca_ids):
+            gerar_snapshots(ids, fim)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {arquivo} ({colunas}, mes) "
+                f"SELECT {colunas}, %s FROM {tabela} "
+                f"WHERE data_movimentacao >= %s AND data_movimentacao < %s",
+                [connection.ops.adapt_datefield_value(mes)] + periodo
+            )
+            arquivadas = cursor.rowcount
+            cursor.execute(
+                f"DELETE FROM {tabela} WHERE data_movimentacao >= %s AND data_movimentacao < %s",
+                periodo
+            )
+            if cursor.rowcount != arquivadas:
+                raise RuntimeError(f"Arquivamento de {mes:%m/%Y} inconsistente: copiadas {arquivadas}, removidas {cursor.rowcount}")
+    return arquivadas
+
+
+def gravar_abertura(peca_ids=None):
+    """
+    Grava, no horizonte do arquivo, o saldo de abertura de todas as peças com
+    movimentações arquivadas. Assim o saldo de qualquer data a partir do
+    horizonte parte de um snapshot que já está nele e não precisa ler o arquivo.
+    """
+    horizonte = horizonte_arquivo()
+    if horizonte is None:
+        return 0
+    if peca_ids is None:
+        peca_ids = MovimentacaoArquivada.objects.values_list('peca_id', flat=True).distinct()
+    gravados = 0
+    for ids in _em_lotes(set(peca_ids)):
+        with transaction.atomic():
+            gravados += len(gerar_snapshots(ids, horizonte))
+    return gravados
@@ -0,0 +1,57 @@
+from django.db import transaction
+from django.db.models import Q
+
+from core.indice_prefixos import IndicePrefixos, chaves_por_palavra
+from core.texto import normalizar_busca, filtro_prefixo
+from .models import Peca
+
+
+def chaves_peca(nome, codigo_interno):
+    return chaves_por_palavra(normalizar_busca(nome)) | {codigo_interno.lower()}
+
+
+def dados_peca(peca_id, codigo_interno, nome, preco_venda):
+    return {'id': peca_id, 'codigo': codigo_interno, 'nome': nome, 'preco': str(preco_venda)}
+
+
+def _carregar_pecas():
+    campos = Peca.objects.filter(ativo=True).values_list(
+        'pk', 'codigo_interno', 'nome', 'preco_venda'
+    ).iterator(chunk_size=2000)
+    for pk, codigo, nome, preco in campos:
+        yield pk, chaves_peca(nome, codigo), dados_peca(pk, codigo, nome, preco)
+
+
+indice_pecas = IndicePrefixos(_carregar_pecas)
+
+
+def buscar_pecas(termo, limite=20):
+    """Peças ativas com nome (ou palavra do nome) ou código começando por `termo`; None se o índice estiver frio."""
+    return indice_pecas.buscar(normalizar_busca(termo), limite)
+
+
+def filtro_pecas(termo):
+    """
+    Q do autocomplete pelo banco (índice frio, desligado ou acima de maximo_itens):
+    só faixas indexadas, pelo começo do nome normalizado ou do código interno. As
+    palavras do meio do nome ("silva" em "joao silva") só o índice em memória
+    acha; um LIKE '% termo%' percorreria a tabela inteira a cada tecla.
+    """
+    prefixo = normalizar_busca(termo)
+    if not prefixo:
+        return Q(pk__in=[])
+    return Q(**filtro_prefixo('nome_busca', prefixo)) | Q(**filtro_prefixo('codigo_interno', prefixo.upper()))
+
+
+def peca_alterada(peca):
+    """Atualiza o índice após o commit (uma transação desfeita não deixa a peça no índice)."""
+    if peca.ativo:
+        chaves = chaves_peca(peca.nome, peca.codigo_interno)
+        dados = dados_peca(peca.pk, peca.codigo_interno, peca.nome, peca.preco_venda)
+        transaction.on_commit(lambda: indice_pecas.atualizar(peca.pk, chaves, dados))
+    else:
+        peca_removida(peca.pk)
+
+
+def peca_removida(peca_id):
+    transaction.on_commit(lambda: indice_pecas.remover(peca_id))
@@ -142,4 +142,15 @@ class MovimentacaoEstoqueForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Torna o fornecedor não obrigatório
-        self.fields['fornecedor'].required = False
\ No newline at end of file
+        self.fields['fornecedor'].required = False
+
+class ImportarPecasForm(forms.Form):
+    arquivo = forms.FileField(
+        label='Arquivo (.csv ou .xlsx)',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'})
+    )
+    simular = forms.BooleanField(
+        label='Apenas validar (não gravar)',
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
@@ -0,0 +1,299 @@
+import codecs
+import csv
+import io
+import re
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from core.texto import normalizar_busca, normalizar_codigo
+from fornecedores.models import Fornecedor
+from .models import CategoriaPeca, Peca, SaldoEstoque
+from .autocomplete import indice_pecas
+
+TAMANHO_LOTE = 1000
+
+# Cabeçalhos aceitos no arquivo (já normalizados) -> campo
+COLUNAS = {
+    'nome': 'nome',
+    'descricao': 'descricao',
+    'categoria': 'categoria',
+    'part number': 'part_number',
+    'part_number': 'part_number',
+    'fornecedor': 'fornecedor',
+    'preco compra': 'ultimo_preco_compra',
+    'preco_compra': 'ultimo_preco_compra',
+    'custo': 'ultimo_preco_compra',
+    'margem': 'margem_lucro',
+    'margem_lucro': 'margem_lucro',
+    'preco venda': 'preco_venda',
+    'preco_venda': 'preco_venda',
+    'quantidade minima': 'quantidade_minima',
+    'quantidade_minima': 'quantidade_minima',
+    'localizacao': 'localizacao',
+    'observacoes': 'observacoes',
+    'ativo': 'ativo',
+}
+
+
+class ArquivoInvalido(Exception):
+    """O arquivo inteiro não pode ser lido (formato, cabeçalho, dependência ausente)."""
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.importadas = 0
+        self.categorias_criadas = 0
+        self.erros = []  # [(número da linha, mensagem)]
+
+    @property
+    def linhas_com_erro(self):
+        return len(self.erros)
+
+
+def _codificacao(arquivo):
+    """UTF-8 (com ou sem BOM) se o início do arquivo for UTF-8 válido; senão cp1252, o CSV do Excel no Windows."""
+    amostra = arquivo.read(65536)
+    arquivo.seek(0)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+    except UnicodeDecodeError:
+        return 'cp1252'
+    return 'utf-8-sig'
+
+
+def _linhas_csv(arquivo):
+    codificacao = _codificacao(arquivo)
+    texto = io.TextIOWrapper(arquivo, encoding=codificacao, newline='')
+    lidas = 0
+    try:
+        amostra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=';,\t')
+        except csv.Error:
+            dialeto = csv.excel
+        for lidas, valores in enumerate(csv.reader(texto, dialeto), start=1):
+            yield valores
+    except UnicodeDecodeError:
+        raise ArquivoInvalido(
+            f'Caractere inválido para a codificação {codificacao} depois da linha {lidas}: '
+            'salve o arquivo como CSV UTF-8.'
+        )
+
+
+def _linhas_xlsx(arquivo):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ArquivoInvalido('Para importar planilhas .xlsx instale o pacote openpyxl (ou envie um .csv).')
+    planilha = openpyxl.load_workbook(arquivo, read_only=True, data_only=True).active
+    for valores in planilha.iter_rows(values_only=True):
+        yield ['' if valor is None else str(valor) for valor in valores]
+
+
+def ler_linhas(arquivo, nome_arquivo):
+    """
+    Lê o arquivo aos poucos e devolve (número da linha, dict campo -> texto) por linha.
+    Aceita .csv (separado por ; , ou tab) e .xlsx (requer openpyxl).
+    """
+    if nome_arquivo.lower().endswith('.xlsx'):
+        linhas = _linhas_xlsx(arquivo)
+    elif nome_arquivo.lower().endswith('.csv'):
+        linhas = _linhas_csv(arquivo)
+    else:
+        raise ArquivoInvalido('Formato não suportado: envie um arquivo .csv ou .xlsx.')
+
+    cabecalho = next(linhas, None)
+    if not cabecalho:
+        raise ArquivoInvalido('Arquivo vazio.')
+    campos = [COLUNAS.get(normalizar_busca(coluna)) for coluna in cabecalho]
+    for obrigatorio in ('nome', 'categoria'):
+        if obrigatorio not in campos:
+            raise ArquivoInvalido(f'Coluna obrigatória ausente: {obrigatorio}.')
+
+    for numero, valores in enumerate(linhas, start=2):
+        if not any(valor.strip() for valor in valores):
+            continue
+        yield numero, {
+            campo: valor.strip() for campo, valor in zip(campos, valores) if campo
+        }
+
+
+def _decimal(texto, campo):
+    if not texto:
+        return Decimal('0.00')
+    # Aceita 1.234,56 e 1234.56
+    if ',' in texto:
+        texto = texto.replace('.', '').replace(',', '.')
+    try:
+        valor = Decimal(re.sub(r'[^\d.\-]', '', texto)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'{campo} inválido: {texto}')
+    if valor < 0:
+        raise ValueError(f'{campo} não pode ser negativo')
+    return valor
+
+
+def _inteiro(texto, campo, padrao):
+    if not texto:
+        return padrao
+    try:
+        return int(Decimal(texto.replace(',', '.')))
+    except (InvalidOperation, OverflowError, ValueError):
+        # ValueError/OverflowError: "NaN" e "Infinity" são decimais válidos, mas não inteiros
+        raise ValueError(f'{campo} inválido: {texto}')
+
+
+def _validar(campo, valor, rotulo):
+    """Confere o valor com o campo do modelo (max_digits, faixa do inteiro no banco...), como o form faria."""
+    try:
+        return Peca._meta.get_field(campo).clean(valor, None)
+    except ValidationError as erro:
+        raise ValueError(f'{rotulo} inválido: {" ".join(erro.messages)}')
+
+
+class _Mapas:
+    """Categorias e fornecedores em memória, carregados uma vez por importação."""
+
+    def __init__(self):
+        self.categorias = {
+            normalizar_busca(categoria.nome): categoria for categoria in CategoriaPeca.objects.only('pk', 'nome')
+        }
+        self.fornecedores = {}
+        for pk, razao, fantasia, cnpj in Fornecedor.objects.values_list('pk', 'razao_social', 'nome_fantasia', 'cnpj'):
+            self.fornecedores[re.sub(r'\D', '', cnpj)] = pk
+            self.fornecedores[normalizar_busca(razao)] = pk
+            if fantasia:
+                self.fornecedores.setdefault(normalizar_busca(fantasia), pk)
+        self.categorias_criadas = 0
+
+    def categoria(self, nome):
+        """
+        CategoriaPeca do nome informado. Uma categoria nova do catálogo do fornecedor
+        só existe em memória até o _gravar_lote da primeira peça válida dela.
+        """
+        chave = normalizar_busca(nome)
+        if chave not in self.categorias:
+            self.categorias[chave] = CategoriaPeca(nome=nome[:100])
+            self.categorias_criadas += 1
+        return self.categorias[chave]
+
+    def fornecedor(self, texto):
+        if not texto:
+            return None
+        digitos = re.sub(r'\D', '', texto)
+        pk = self.fornecedores.get(digitos) if len(digitos) == 14 else None
+        pk = pk or self.fornecedores.get(normalizar_busca(texto))
+        if pk is None:
+            raise ValueError(f'Fornecedor não encontrado: {texto}')
+        return pk
+
+
+def _montar_peca(dados, mapas):
+    """Valida uma linha e monta a Peca (sem gravar), com a mesma regra de preço do Peca.save()."""
+    nome = dados.get('nome', '')
+    if not nome:
+        raise ValueError('nome é obrigatório')
+    if len(nome) > 200:
+        raise ValueError('nome com mais de 200 caracteres')
+    if not dados.get('categoria'):
+        raise ValueError('categoria é obrigatória')
+
+    custo = _validar('ultimo_preco_compra', _decimal(dados.get('ultimo_preco_compra'), 'preço de compra'),
+                     'preço de compra')
+    margem = _validar('margem_lucro', _decimal(dados.get('margem_lucro'), 'margem'), 'margem')
+    preco_venda = _decimal(dados.get('preco_venda'), 'preço de venda')
+    if custo > 0 and margem > 0:
+        preco_venda = (custo * (1 + margem / 100)).quantize(Decimal('0.01'))
+    preco_venda = _validar('preco_venda', preco_venda, 'preço de venda')
+    quantidade_minima = _validar(
+        'quantidade_minima', _inteiro(dados.get('quantidade_minima'), 'quantidade mínima', 5), 'quantidade mínima'
+    )
+    fornecedor_id = mapas.fornecedor(dados.get('fornecedor'))
+
+    part_number = (dados.get('part_number') or None) and dados['part_number'][:100]
+    return Peca(
+        nome=nome,
+        nome_busca=normalizar_busca(nome),
+        descricao=dados.get('descricao') or None,
+        part_number=part_number,
+        part_number_normalizado=normalizar_codigo(part_number),
+        # Por último: a linha já foi validada, então uma categoria nova só surge para peça válida
+        categoria=mapas.categoria(dados['categoria']),
+        fornecedor_principal_id=fornecedor_id,
+        ultimo_preco_compra=custo,
+        margem_lucro=margem,
+        preco_venda=preco_venda,
+        quantidade_minima=quantidade_minima,
+        localizacao=(dados.get('localizacao') or None) and dados['localizacao'][:100],
+        observacoes=dados.get('observacoes') or None,
+        ativo=normalizar_busca(dados.get('ativo', '')) not in ('0', 'nao', 'n', 'false', 'inativo'),
+    )
+
+
+def _gerar_codigos(quantidade):
+    """Gera `quantidade` códigos internos no formato do Peca.save(), sem colisão com o banco."""
+    codigos = set()
+    while len(codigos) < quantidade:
+        novos = {f"PC-{uuid.uuid4().hex[:8].upper()}" for _ in range(quantidade - len(codigos))}
+        novos -= set(Peca.objects.filter(codigo_interno__in=novos).values_list('codigo_interno', flat=True))
+        codigos |= novos
+    return list(codigos)
+
+
+def _gravar_lote(pecas):
+    for peca, codigo in zip(pecas, _gerar_codigos(len(pecas))):
+        peca.codigo_interno = codigo
+    with transaction.atomic():
+        # Categorias novas do lote, gravadas junto com as peças que as usam
+        novas = {id(peca.categoria): peca.categoria for peca in pecas if peca.categoria.pk is None}
+        CategoriaPeca.objects.bulk_create(novas.values())
+        Peca.objects.bulk_create(pecas)
+        # bulk_create não dispara signals: o saldo zerado de cada peça nova é criado aqui
+        SaldoEstoque.objects.bulk_create([
+            SaldoEstoque(peca_id=peca.pk, quantidade_minima=peca.quantidade_minima,
+                         estoque_baixo=0 <= peca.quantidade_minima)
+            for peca in pecas
+        ])
+
+
+def importar_pecas(arquivo, nome_arquivo, lote=TAMANHO_LOTE, simular=False):
+    """
+    Importa peças de um arquivo CSV/XLSX em lotes.
+
+    Categorias e fornecedores são resolvidos por mapas em memória (categorias
+    desconhecidas são criadas junto com a primeira peça válida delas), os
+    códigos internos são gerados por lote e as peças válidas são gravadas com
+    bulk_create a cada `lote` linhas. Linhas inválidas não interrompem a
+    importação: ficam em resultado.erros com o número da linha. Um CSV que não
+    é UTF-8 é lido como cp1252. Com simular=True só valida, sem gravar nada.
+    """
+    resultado = ResultadoImportacao()
+    mapas = _Mapas()
+    pendentes = []
+
+    for numero, dados in ler_linhas(arquivo, nome_arquivo):
+        try:
+            pendentes.append(_montar_peca(dados, mapas))
+        except ValueError as erro:
+            resultado.erros.append((numero, str(erro)))
+            continue
+
+        if len(pendentes) >= lote:
+            if not simular:
+                _gravar_lote(pendentes)
+            resultado.importadas += len(pendentes)
+            pendentes = []
+
+    if pendentes:
+        if not simular:
+            _gravar_lote(pendentes)
+        resultado.importadas += len(pendentes)
+
+    resultado.categorias_criadas = mapas.categorias_criadas
+    if resultado.importadas and not simular:
+        transaction.on_commit(indice_pecas.invalidar)
+    return resultado
@@ -0,0 +1,64 @@
+from django.db.models import Q
+
+from core.cache_lru import CacheLRU
+from core.texto import normalizar_codigo
+from .models import Peca
+
+# Código lido -> id da peça, das leituras mais recentes deste processo
+leituras_recentes = CacheLRU(maximo_itens=512)
+
+
+class CodigoAmbiguo(Exception):
+    """O part number lido pertence a mais de uma peça."""
+
+    def __init__(self, codigo, pecas):
+        self.codigo = codigo
+        self.pecas = pecas
+        super().__init__(f"O código {codigo} corresponde a {len(pecas)} peças")
+
+
+def _corresponde(peca, codigo_interno, part_number):
+    return peca.codigo_interno == codigo_interno or bool(part_number) and peca.part_number_normalizado == part_number
+
+
+def ler_codigo(codigo):
+    """
+    Peça (com o saldo) de um código lido no balcão: código interno ou part number.
+
+    As duas buscas são por igualdade em colunas indexadas (codigo_interno e
+    part_number_normalizado) no mesmo SELECT, com o saldo pelo JOIN, nunca por
+    LIKE. O cache LRU guarda só o id da peça de cada código lido: a leitura
+    repetida vai direto pela chave primária e o saldo vem sempre atual. Se a
+    peça do cache não corresponder mais ao código (part number alterado), a
+    entrada é descartada e a busca é refeita pelas colunas.
+
+    Retorna a Peca ou None; levanta CodigoAmbiguo se o part number for de
+    mais de uma peça (o código interno tem prioridade).
+    """
+    codigo_interno = codigo.strip().upper()
+    part_number = normalizar_codigo(codigo)
+    if not codigo_interno:
+        return None
+    pecas = Peca.objects.select_related('saldo')
+
+    peca_id = leituras_recentes.get(codigo_interno)
+    if peca_id is not None:
+        peca = pecas.filter(pk=peca_id).first()
+        if peca and _corresponde(peca, codigo_interno, part_number):
+            return peca
+        leituras_recentes.remover(codigo_interno)
+
+    filtro = Q(codigo_interno=codigo_interno)
+    if part_number:
+        filtro |= Q(part_number_normalizado=part_number)
+    encontradas = list(pecas.filter(filtro).order_by('pk')[:10])
+    peca = next((p for p in encontradas if p.codigo_interno == codigo_interno), None)
+    if peca is None:
+        if len(encontradas) > 1:
+            raise CodigoAmbiguo(codigo.strip(), encontradas)
+        if not encontradas:
+            return None
+        peca = encontradas[0]
+
+    leituras_recentes.set(codigo_interno, peca.pk)
+    return peca
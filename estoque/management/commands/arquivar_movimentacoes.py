@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from estoque.arquivo import meses_a_arquivar, arquivar_mes, gravar_abertura
+
+
+class Command(BaseCommand):
+    help = (
+        'Move as movimentações de estoque mais antigas que o horizonte para o arquivo mensal, '
+        'gravando o saldo de abertura de cada mês em SnapshotEstoque'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses', type=int, default=getattr(settings, 'ESTOQUE_MESES_ATIVOS', 24),
+            help='Meses mantidos na tabela principal, contando o mês atual (padrão: ESTOQUE_MESES_ATIVOS)'
+        )
+        parser.add_argument('--simular', action='store_true', help='Só lista os meses que seriam arquivados')
+
+    def handle(self, *args, **options):
+        if options['meses'] < 1:
+            raise CommandError('Mantenha pelo menos o mês atual (--meses 1).')
+
+        limite = timezone.localdate().replace(day=1)
+        for _ in range(options['meses'] - 1):
+            limite = (limite - timedelta(days=1)).replace(day=1)
+
+        meses = meses_a_arquivar(limite)
+        if options['simular']:
+            for mes in meses:
+                self.stdout.write(f'{mes:%m/%Y}')
+            self.stdout.write(self.style.SUCCESS(f'{len(meses)} meses anteriores a {limite:%m/%Y} seriam arquivados.'))
+            return
+
+        total = 0
+        for mes in meses:
+            # Um mês por transação: o arquivamento pode ser interrompido e retomado
+            arquivadas = arquivar_mes(mes)
+            total += arquivadas
+            self.stdout.write(f'{mes:%m/%Y}: {arquivadas} movimentações arquivadas')
+
+        aberturas = gravar_abertura() if meses else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} movimentações arquivadas em {len(meses)} meses; {aberturas} saldos de abertura gravados.'
+        ))
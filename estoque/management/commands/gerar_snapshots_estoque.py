@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from estoque.models import Peca
+from estoque.snapshots import gerar_snapshots, inicio_do_dia
+
+
+class Command(BaseCommand):
+    help = 'Gera os snapshots de saldo das peças em uma data de corte (padrão: virada do mês atual), em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--data', type=date.fromisoformat,
+            help='Data de corte AAAA-MM-DD (considera as movimentações anteriores a este dia)'
+        )
+        parser.add_argument('--lote', type=int, default=500, help='Quantidade de peças por lote')
+
+    def handle(self, *args, **options):
+        hoje = timezone.localdate()
+        data = options['data'] or hoje.replace(day=1)
+        if data > hoje:
+            raise CommandError('A data de corte não pode estar no futuro.')
+        corte = inicio_do_dia(data)
+
+        lote = options['lote']
+        ultimo_id = 0
+        gerados = 0
+
+        while True:
+            ids = list(
+                Peca.objects.filter(pk__gt=ultimo_id)
+                .order_by('pk').values_list('pk', flat=True)[:lote]
+            )
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+            with transaction.atomic():
+                gerados += len(gerar_snapshots(ids, corte))
+
+        self.stdout.write(self.style.SUCCESS(f'{gerados} snapshots gerados com corte em {data:%d/%m/%Y}.'))
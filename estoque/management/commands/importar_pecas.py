@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from estoque.importacao import importar_pecas, ArquivoInvalido, TAMANHO_LOTE
+
+
+class Command(BaseCommand):
+    help = 'Importa peças de um arquivo CSV ou XLSX (colunas: nome, categoria, part number, fornecedor, custo, margem...)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Caminho do arquivo .csv ou .xlsx')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Peças gravadas por bulk_create')
+        parser.add_argument('--simular', action='store_true', help='Só valida o arquivo, sem gravar')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        try:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resultado = importar_pecas(
+                    arquivo, options['arquivo'], lote=options['lote'], simular=options['simular']
+                )
+        except (OSError, ArquivoInvalido) as erro:
+            raise CommandError(str(erro))
+
+        for numero, mensagem in resultado.erros:
+            self.stderr.write(f'Linha {numero}: {mensagem}')
+
+        acao = 'validadas' if options['simular'] else 'importadas'
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado.importadas} peças {acao}, {resultado.categorias_criadas} categorias novas, '
+            f'{resultado.linhas_com_erro} linhas com erro ({time.perf_counter() - inicio:.1f}s).'
+        ))
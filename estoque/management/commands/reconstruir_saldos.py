@@ -0,0 +1,95 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from estoque.models import Peca, SaldoEstoque
+from estoque.servicos import saldos_do_livro, travar_pecas
+
+
+CAMPOS = ['quantidade', 'quantidade_minima', 'estoque_baixo']
+CAMPOS_CUSTO = ['custo_medio', 'valor_estoque']
+# Arredondamentos do banco (ex: SQLite calcula decimais em ponto flutuante) não contam como divergência
+TOLERANCIA_CUSTO = Decimal('0.01')
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula e confere a tabela SaldoEstoque (saldo, estoque baixo e custo médio) '
+        'a partir do livro de movimentações, em lotes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Quantidade de peças por lote')
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Apenas lista as peças com saldo divergente, sem corrigir'
+        )
+
+    @staticmethod
+    def _diverge(correto, gravado):
+        return (
+            any(getattr(correto, campo) != getattr(gravado, campo) for campo in CAMPOS) or
+            any(abs(getattr(correto, campo) - getattr(gravado, campo)) > TOLERANCIA_CUSTO for campo in CAMPOS_CUSTO)
+        )
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        verificar = options['verificar']
+        ultimo_id = 0
+        conferidas = 0
+        divergentes = 0
+
+        while True:
+            ids = list(
+                Peca.objects.filter(pk__gt=ultimo_id)
+                .order_by('pk').values_list('pk', flat=True)[:lote]
+            )
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+            conferidas += len(ids)
+
+            with transaction.atomic():
+                # Com as peças travadas nenhuma movimentação do lote muda entre a
+                # leitura do livro e a gravação do saldo
+                if not verificar:
+                    travar_pecas(ids)
+                minimas = dict(Peca.objects.filter(pk__in=ids).values_list('pk', 'quantidade_minima'))
+                corretos = {
+                    peca_id: SaldoEstoque(
+                        peca_id=peca_id, quantidade=saldo,
+                        quantidade_minima=minimas[peca_id], estoque_baixo=saldo <= minimas[peca_id],
+                        custo_medio=custo, valor_estoque=valor
+                    )
+                    for peca_id, (saldo, custo, valor) in saldos_do_livro(ids).items()
+                }
+                gravados = {
+                    saldo.peca_id: saldo for saldo in SaldoEstoque.objects.filter(peca_id__in=ids)
+                }
+                erradas = [
+                    saldo for peca_id, saldo in corretos.items()
+                    if peca_id not in gravados or self._diverge(saldo, gravados[peca_id])
+                ]
+                divergentes += len(erradas)
+
+                if verificar:
+                    for saldo in erradas:
+                        self.stdout.write(
+                            f"Peça #{saldo.peca_id}: gravado "
+                            f"{gravados[saldo.peca_id].quantidade if saldo.peca_id in gravados else '-'} / "
+                            f"livro {saldo.quantidade}"
+                        )
+                elif erradas:
+                    SaldoEstoque.objects.bulk_create(
+                        erradas,
+                        update_conflicts=True,
+                        unique_fields=['peca'],
+                        update_fields=CAMPOS + CAMPOS_CUSTO
+                    )
+
+        if verificar:
+            estilo = self.style.WARNING if divergentes else self.style.SUCCESS
+            self.stdout.write(estilo(f'{conferidas} peças conferidas, {divergentes} com saldo divergente.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{conferidas} peças conferidas, {divergentes} corrigidas.'))
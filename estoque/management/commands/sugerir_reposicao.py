@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from estoque.models import Peca
+from estoque.reposicao import (
+    calcular_reposicao, ReposicaoIndisponivel,
+    JANELA_DIAS, PRAZO_ENTREGA_DIAS, COBERTURA_DIAS, NIVEL_SERVICO,
+)
+
+
+class Command(BaseCommand):
+    help = 'Calcula ponto de pedido e quantidade sugerida de reposição a partir do consumo real das peças'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--janela', type=int, default=JANELA_DIAS, help='Dias de histórico de consumo')
+        parser.add_argument('--prazo', type=int, default=PRAZO_ENTREGA_DIAS, help='Prazo de entrega do fornecedor em dias')
+        parser.add_argument('--cobertura', type=int, default=COBERTURA_DIAS, help='Dias de consumo que cada pedido deve cobrir')
+        parser.add_argument('--nivel-servico', type=float, default=NIVEL_SERVICO, help='Probabilidade de não faltar no prazo (0 a 1)')
+        parser.add_argument('--todas', action='store_true', help='Lista também as peças que ainda não precisam de pedido')
+
+    def handle(self, *args, **options):
+        if not 0 < options['nivel_servico'] < 1:
+            raise CommandError('O nível de serviço deve estar entre 0 e 1.')
+
+        inicio = time.perf_counter()
+        try:
+            sugestoes = calcular_reposicao(
+                janela_dias=options['janela'],
+                prazo_entrega_dias=options['prazo'],
+                cobertura_dias=options['cobertura'],
+                nivel_servico=options['nivel_servico'],
+            )
+        except ReposicaoIndisponivel as erro:
+            raise CommandError(str(erro))
+        duracao = time.perf_counter() - inicio
+
+        if not options['todas']:
+            sugestoes = [s for s in sugestoes if s['quantidade_sugerida'] > 0]
+        codigos = dict(
+            Peca.objects.filter(pk__in=[s['peca_id'] for s in sugestoes]).values_list('pk', 'codigo_interno')
+        )
+        for s in sugestoes:
+            self.stdout.write(
+                f"{codigos[s['peca_id']]:<12} saldo {s['saldo']:>6}  consumo/dia {s['consumo_diario']:>8.3f}  "
+                f"ponto de pedido {s['ponto_pedido']:>6}  sugerido {s['quantidade_sugerida']:>6}"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'{len(sugestoes)} peças listadas ({duracao:.2f}s).'))
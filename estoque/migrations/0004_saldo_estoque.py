@@ -0,0 +1,46 @@
+# Generated by Django 5.1 on 2026-10-18 12:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def preencher_saldos(apps, schema_editor):
+    Peca = apps.get_model('estoque', 'Peca')
+    MovimentacaoEstoque = apps.get_model('estoque', 'MovimentacaoEstoque')
+    SaldoEstoque = apps.get_model('estoque', 'SaldoEstoque')
+
+    saldos = dict(
+        MovimentacaoEstoque.objects.order_by().values('peca_id').annotate(
+            saldo=Coalesce(Sum('quantidade', filter=Q(tipo='entrada')), 0) -
+                  Coalesce(Sum('quantidade', filter=Q(tipo='saida')), 0)
+        ).values_list('peca_id', 'saldo')
+    )
+    SaldoEstoque.objects.bulk_create(
+        [SaldoEstoque(peca_id=peca_id, quantidade=saldos.get(peca_id, 0))
+         for peca_id in Peca.objects.values_list('pk', flat=True)],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0003_alter_peca_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoEstoque',
+            fields=[
+                ('peca', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='saldo', serialize=False, to='estoque.peca')),
+                ('quantidade', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Saldo de Estoque',
+                'verbose_name_plural': 'Saldos de Estoque',
+            },
+        ),
+        migrations.RunPython(preencher_saldos, migrations.RunPython.noop),
+    ]
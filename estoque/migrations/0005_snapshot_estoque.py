@@ -0,0 +1,47 @@
+# Generated by Django 5.1 on 2026-10-18 12:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0004_saldo_estoque'),
+        ('financeiro', '0001_initial'),
+        ('fornecedores', '0001_initial'),
+        ('ordem_servico', '0006_indice_busca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateTimeField(verbose_name='Data de Corte')),
+                ('quantidade', models.IntegerField(default=0)),
+                ('custo_unitario', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Último Custo de Entrada')),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Estoque',
+                'verbose_name_plural': 'Snapshots de Estoque',
+                'ordering': ['-data'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='movimentacaoestoque',
+            index=models.Index(fields=['peca', 'data_movimentacao'], name='mov_peca_data_idx'),
+        ),
+        migrations.AddField(
+            model_name='snapshotestoque',
+            name='peca',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='estoque.peca'),
+        ),
+        migrations.AddConstraint(
+            model_name='snapshotestoque',
+            constraint=models.UniqueConstraint(fields=('peca', 'data'), name='snapshot_peca_data_unico'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1 on 2026-10-18 12:25
+
+from django.db import migrations, models
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+
+
+def preencher_estoque_baixo(apps, schema_editor):
+    Peca = apps.get_model('estoque', 'Peca')
+    SaldoEstoque = apps.get_model('estoque', 'SaldoEstoque')
+
+    SaldoEstoque.objects.update(
+        quantidade_minima=Subquery(Peca.objects.filter(pk=OuterRef('peca')).values('quantidade_minima')[:1])
+    )
+    SaldoEstoque.objects.update(
+        estoque_baixo=Case(When(quantidade__lte=F('quantidade_minima'), then=Value(True)), default=Value(False))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0005_snapshot_estoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saldoestoque',
+            name='estoque_baixo',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='saldoestoque',
+            name='quantidade_minima',
+            field=models.IntegerField(default=5),
+        ),
+        migrations.AddIndex(
+            model_name='saldoestoque',
+            index=models.Index(condition=models.Q(('estoque_baixo', True)), fields=['peca'], name='saldo_estoque_baixo_idx'),
+        ),
+        migrations.RunPython(preencher_estoque_baixo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 12:26
+
+from django.db import migrations, models
+
+from core.texto import normalizar_busca
+
+
+def preencher_nome_busca(apps, schema_editor):
+    Peca = apps.get_model('estoque', 'Peca')
+    pecas = list(Peca.objects.only('pk', 'nome'))
+    for peca in pecas:
+        peca.nome_busca = normalizar_busca(peca.nome)
+    Peca.objects.bulk_update(pecas, ['nome_busca'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0006_estoque_baixo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='peca',
+            name='nome_busca',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(preencher_nome_busca, migrations.RunPython.noop),
+    ]
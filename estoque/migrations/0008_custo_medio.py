@@ -0,0 +1,76 @@
+# Generated by Django 5.1 on 2026-10-18 12:31
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def preencher_custo_medio(apps, schema_editor):
+    """Percorre o livro em ordem cronológica calculando o custo médio ponderado móvel."""
+    MovimentacaoEstoque = apps.get_model('estoque', 'MovimentacaoEstoque')
+    SaldoEstoque = apps.get_model('estoque', 'SaldoEstoque')
+    SnapshotEstoque = apps.get_model('estoque', 'SnapshotEstoque')
+    casas = Decimal('0.0001')
+
+    estado = {}
+    movimentacoes = MovimentacaoEstoque.objects.order_by('peca_id', 'data_movimentacao', 'pk').values_list(
+        'peca_id', 'tipo', 'quantidade', 'valor_unitario', 'ordem_servico_id'
+    )
+    for peca_id, tipo, quantidade, valor_unitario, ordem_servico_id in movimentacoes.iterator(chunk_size=2000):
+        saldo, custo, valor = estado.get(peca_id, (0, Decimal('0'), Decimal('0')))
+        if tipo == 'entrada' and ordem_servico_id is None:
+            saldo += quantidade
+            valor += quantidade * valor_unitario
+            if saldo > 0:
+                custo = (valor / saldo).quantize(casas)
+        elif tipo in ('entrada', 'saida'):
+            movido = quantidade if tipo == 'entrada' else -quantidade
+            saldo += movido
+            valor += movido * custo
+        if saldo <= 0:
+            valor = Decimal('0')
+        estado[peca_id] = (saldo, custo, valor.quantize(casas))
+
+    saldos = list(SaldoEstoque.objects.filter(peca_id__in=estado))
+    for saldo in saldos:
+        _, saldo.custo_medio, saldo.valor_estoque = estado[saldo.peca_id]
+    SaldoEstoque.objects.bulk_update(saldos, ['custo_medio', 'valor_estoque'], batch_size=1000)
+
+    # Os snapshots antigos foram valorizados pelo último custo de entrada; o comando
+    # gerar_snapshots_estoque os recria pelo custo médio
+    SnapshotEstoque.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0007_peca_nome_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saldoestoque',
+            name='custo_medio',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='saldoestoque',
+            name='valor_estoque',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=16),
+        ),
+        migrations.AlterField(
+            model_name='snapshotestoque',
+            name='custo_unitario',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=16, verbose_name='Custo Médio'),
+        ),
+        migrations.AlterField(
+            model_name='snapshotestoque',
+            name='valor',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=16),
+        ),
+        migrations.AddIndex(
+            model_name='saldoestoque',
+            index=models.Index(condition=models.Q(('quantidade__gt', 0)), fields=['-valor_estoque'], name='saldo_valor_estoque_idx'),
+        ),
+        migrations.RunPython(preencher_custo_medio, migrations.RunPython.noop),
+    ]
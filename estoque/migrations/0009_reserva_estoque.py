@@ -0,0 +1,55 @@
+# Generated by Django 5.1 on 2026-10-18 13:16
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0008_custo_medio'),
+        ('ordem_servico', '0006_indice_busca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaEstoque',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('data_reserva', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Reserva de Estoque',
+                'verbose_name_plural': 'Reservas de Estoque',
+                'ordering': ['-data_reserva'],
+            },
+        ),
+        migrations.AddField(
+            model_name='saldoestoque',
+            name='reservado',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='saldoestoque',
+            constraint=models.CheckConstraint(condition=models.Q(('reservado__gte', 0)), name='saldo_reservado_positivo'),
+        ),
+        migrations.AddField(
+            model_name='reservaestoque',
+            name='ordem_servico',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reservas_estoque', to='ordem_servico.ordemservico', verbose_name='Ordem de Serviço'),
+        ),
+        migrations.AddField(
+            model_name='reservaestoque',
+            name='peca',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='estoque.peca'),
+        ),
+        migrations.AddField(
+            model_name='reservaestoque',
+            name='usuario',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
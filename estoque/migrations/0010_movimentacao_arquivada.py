@@ -0,0 +1,42 @@
+# Generated by Django 5.1 on 2026-10-18 13:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0009_reserva_estoque'),
+        ('financeiro', '0001_initial'),
+        ('fornecedores', '0001_initial'),
+        ('ordem_servico', '0006_indice_busca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimentacaoArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('tipo', models.CharField(choices=[('entrada', 'Entrada'), ('saida', 'Saída'), ('ajuste', 'Ajuste')], max_length=10)),
+                ('quantidade', models.IntegerField()),
+                ('valor_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('data_movimentacao', models.DateTimeField()),
+                ('observacoes', models.TextField(blank=True, null=True)),
+                ('fornecedor', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='fornecedores.fornecedor')),
+                ('nota_fiscal', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='financeiro.notafiscal')),
+                ('ordem_servico', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='ordem_servico.ordemservico')),
+                ('peca', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='movimentacoes_arquivadas', to='estoque.peca')),
+                ('usuario', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Movimentação Arquivada',
+                'verbose_name_plural': 'Movimentações Arquivadas',
+                'ordering': ['-data_movimentacao'],
+                'indexes': [models.Index(fields=['mes', 'peca'], name='arq_mes_peca_idx'), models.Index(fields=['peca', 'data_movimentacao'], name='arq_peca_data_idx')],
+            },
+        ),
+    ]
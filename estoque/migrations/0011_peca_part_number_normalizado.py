@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-18 13:26
+
+from django.db import migrations, models
+
+from core.texto import normalizar_codigo
+
+
+def preencher_part_number_normalizado(apps, schema_editor):
+    Peca = apps.get_model('estoque', 'Peca')
+    pecas = list(Peca.objects.exclude(part_number__isnull=True).exclude(part_number='').only('pk', 'part_number'))
+    for peca in pecas:
+        peca.part_number_normalizado = normalizar_codigo(peca.part_number)
+    Peca.objects.bulk_update(pecas, ['part_number_normalizado'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('estoque', '0010_movimentacao_arquivada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='peca',
+            name='part_number_normalizado',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(preencher_part_number_normalizado, migrations.RunPython.noop),
+    ]
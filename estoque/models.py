@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 import uuid
+from decimal import Decimal
+
+from core.texto import normalizar_busca, normalizar_codigo
 
 
 class CategoriaPeca(models.Model):
@@ -23,7 +26,11 @@ class Peca(models.Model):
     part_number = models.CharField(
         max_length=100, blank=True, null=True, verbose_name="Part Number"
     )
+    # Part number só com letras e dígitos, para a leitura exata (e indexada) de etiquetas
+    part_number_normalizado = models.CharField(max_length=100, editable=False, db_index=True, default='')
     nome = models.CharField(max_length=200, verbose_name="Nome da Peça")
+    # Nome normalizado (minúsculas, sem acentos) para a busca por prefixo do autocomplete
+    nome_busca = models.CharField(max_length=200, editable=False, db_index=True, default='')
     descricao = models.TextField(blank=True, null=True)
     categoria = models.ForeignKey(CategoriaPeca, on_delete=models.PROTECT, related_name='pecas')
     
@@ -60,6 +67,9 @@ class Peca(models.Model):
         if not self.codigo_interno:
             self.codigo_interno = f"PC-{uuid.uuid4().hex[:8].upper()}"
         
+        self.nome_busca = normalizar_busca(self.nome)
+        self.part_number_normalizado = normalizar_codigo(self.part_number)
+        
         # Calcula preço de venda baseado na margem se houver custo
         if self.ultimo_preco_compra > 0 and self.margem_lucro > 0:
             self.preco_venda = self.ultimo_preco_compra * (1 + (self.margem_lucro / 100))
@@ -68,24 +78,43 @@ class Peca(models.Model):
 
     @property
     def quantidade_estoque(self):
-        """Calcula o saldo atual baseado nas movimentações"""
-        from .models import MovimentacaoEstoque
-        from django.db.models import Sum, Q
-        
-        entradas = MovimentacaoEstoque.objects.filter(
-            peca=self, tipo='entrada'
-        ).aggregate(total=Sum('quantidade'))['total'] or 0
-        
-        saidas = MovimentacaoEstoque.objects.filter(
-            peca=self, tipo='saida'
-        ).aggregate(total=Sum('quantidade'))['total'] or 0
-        
-        return entradas - saidas
+        """Saldo atual, lido da tabela materializada SaldoEstoque (use select_related('saldo') em listas)"""
+        try:
+            return self.saldo.quantidade
+        except SaldoEstoque.DoesNotExist:
+            return 0
+
+    @property
+    def quantidade_disponivel(self):
+        """Saldo menos o que está reservado para ordens de serviço"""
+        try:
+            return self.saldo.quantidade - self.saldo.reservado
+        except SaldoEstoque.DoesNotExist:
+            return 0
+
+    @property
+    def estoque_baixo(self):
+        """Saldo igual ou abaixo da quantidade mínima (flag mantida em SaldoEstoque)"""
+        try:
+            return self.saldo.estoque_baixo
+        except SaldoEstoque.DoesNotExist:
+            return self.quantidade_minima >= 0
+
+    @property
+    def custo_medio(self):
+        """Custo médio ponderado das unidades em estoque (mantido em SaldoEstoque)"""
+        try:
+            return self.saldo.custo_medio
+        except SaldoEstoque.DoesNotExist:
+            return Decimal('0')
 
     @property
     def valor_total_estoque(self):
-        """Calcula o valor financeiro total da peça no estoque"""
-        return float(self.quantidade_estoque) * float(self.preco_venda)
+        """Valor do estoque da peça pelo custo médio (não pelo preço de venda)"""
+        try:
+            return self.saldo.valor_estoque
+        except SaldoEstoque.DoesNotExist:
+            return Decimal('0')
 
 
 class MovimentacaoEstoque(models.Model):
@@ -148,19 +177,175 @@ class MovimentacaoEstoque(models.Model):
         verbose_name = "Movimentação de Estoque"
         verbose_name_plural = "Movimentações de Estoque"
         ordering = ['-data_movimentacao']
+        indexes = [
+            # Cauda de movimentações de uma peça a partir de um snapshot
+            models.Index(fields=['peca', 'data_movimentacao'], name='mov_peca_data_idx'),
+        ]
     
     def __str__(self):
         return f"{self.tipo.upper()} - {self.peca.codigo_interno} - {self.quantidade}un"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Guarda o efeito original no saldo, para que uma edição aplique só a diferença
+        instancia._saldo_original = (
+            instancia.peca_id, instancia.tipo, instancia.quantidade,
+            instancia.valor_unitario, instancia.ordem_servico_id
+        )
+        return instancia
+    
     def save(self, *args, **kwargs):
-        # Atualiza o último preço de compra da peça se for ENTRADA
-        if self.tipo == 'entrada' and self.valor_unitario > 0:
-            self.peca.ultimo_preco_compra = self.valor_unitario
-            self.peca.save()
-        
-        super().save(*args, **kwargs)
+        # O saldo materializado é atualizado no post_save, dentro desta mesma transação
+        with transaction.atomic():
+            # Atualiza o último preço de compra da peça se for ENTRADA, só nas
+            # colunas de preço (sem carregar nem regravar a peça inteira)
+            if self.tipo == 'entrada' and self.valor_unitario > 0:
+                from .servicos import atualizar_precos_compra
+                custo, preco_venda = atualizar_precos_compra({self.peca_id: self.valor_unitario})[self.peca_id]
+                if MovimentacaoEstoque.peca.is_cached(self):
+                    self.peca.ultimo_preco_compra, self.peca.preco_venda = custo, preco_venda
+            
+            super().save(*args, **kwargs)
     
     @property
     def valor_total(self):
         """Calcula o valor total da movimentação"""
-        return self.quantidade * self.valor_unitario
\ No newline at end of file
+        return self.quantidade * self.valor_unitario
+
+
+class SaldoEstoque(models.Model):
+    """
+    Saldo materializado de cada peça (entradas - saídas do livro de movimentações).
+    Mantido pelos signals de MovimentacaoEstoque e por estoque.servicos.aplicar_saldos;
+    o comando reconstruir_saldos recalcula a tabela a partir do livro.
+    """
+    peca = models.OneToOneField(
+        Peca, on_delete=models.CASCADE, primary_key=True, related_name='saldo'
+    )
+    quantidade = models.IntegerField(default=0)
+    # Cópia de Peca.quantidade_minima, para o UPDATE do saldo decidir o estoque_baixo sem JOIN
+    quantidade_minima = models.IntegerField(default=5)
+    estoque_baixo = models.BooleanField(default=True)
+    # Custo médio ponderado móvel e valor do estoque por ele
+    custo_medio = models.DecimalField(max_digits=16, decimal_places=4, default=0)
+    valor_estoque = models.DecimalField(max_digits=16, decimal_places=4, default=0)
+    # Unidades reservadas (ReservaEstoque) e ainda não baixadas; disponível = quantidade - reservado
+    reservado = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Saldo de Estoque"
+        verbose_name_plural = "Saldos de Estoque"
+        indexes = [
+            # Índice parcial: só as (poucas) peças abaixo do mínimo entram nele
+            models.Index(
+                fields=['peca'], condition=models.Q(estoque_baixo=True), name='saldo_estoque_baixo_idx'
+            ),
+            # Relatório de valorização: só as peças com saldo, já na ordem do relatório
+            models.Index(
+                fields=['-valor_estoque'], condition=models.Q(quantidade__gt=0), name='saldo_valor_estoque_idx'
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(reservado__gte=0), name='saldo_reservado_positivo'),
+        ]
+
+    def __str__(self):
+        return f"{self.peca_id}: {self.quantidade}un"
+
+
+class SnapshotEstoque(models.Model):
+    """
+    Foto do saldo de uma peça em uma virada de período (ex: fim de mês).
+    Considera todas as movimentações com data anterior a `data`; o saldo em
+    qualquer data posterior é o snapshot mais a cauda de movimentações desde ele.
+    """
+    peca = models.ForeignKey(Peca, on_delete=models.CASCADE, related_name='snapshots')
+    data = models.DateTimeField(verbose_name="Data de Corte")
+    quantidade = models.IntegerField(default=0)
+    custo_unitario = models.DecimalField(
+        max_digits=16, decimal_places=4, default=0, verbose_name="Custo Médio"
+    )
+    valor = models.DecimalField(max_digits=16, decimal_places=4, default=0)
+
+    class Meta:
+        verbose_name = "Snapshot de Estoque"
+        verbose_name_plural = "Snapshots de Estoque"
+        ordering = ['-data']
+        constraints = [
+            models.UniqueConstraint(fields=['peca', 'data'], name='snapshot_peca_data_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.peca_id} em {self.data:%d/%m/%Y}: {self.quantidade}un"
+
+
+class ReservaEstoque(models.Model):
+    """
+    Unidades de uma peça separadas para uma OS antes da baixa.
+    Criada e desfeita só por estoque.reservas, que mantém SaldoEstoque.reservado.
+    """
+    peca = models.ForeignKey(Peca, on_delete=models.CASCADE, related_name='reservas')
+    ordem_servico = models.ForeignKey(
+        'ordem_servico.OrdemServico',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='reservas_estoque',
+        verbose_name="Ordem de Serviço"
+    )
+    quantidade = models.IntegerField(validators=[MinValueValidator(1)])
+    usuario = models.ForeignKey('auth.User', on_delete=models.PROTECT)
+    data_reserva = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Reserva de Estoque"
+        verbose_name_plural = "Reservas de Estoque"
+        ordering = ['-data_reserva']
+
+    def __str__(self):
+        return f"Reserva {self.peca_id} - {self.quantidade}un"
+
+
+class MovimentacaoArquivada(models.Model):
+    """
+    Movimentações antigas retiradas de MovimentacaoEstoque pelo comando
+    arquivar_movimentacoes, com o mesmo id e os mesmos campos.
+
+    O saldo de abertura de cada mês arquivado fica em SnapshotEstoque, então as
+    consultas de saldo a partir do horizonte do arquivo não leem esta tabela.
+    A coluna `mes` (primeiro dia do mês) particiona o arquivo: cada mês é
+    gravado de uma vez e as consultas por período usam os índices por mês/peça.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    mes = models.DateField(verbose_name="Mês")
+    peca = models.ForeignKey(
+        Peca, on_delete=models.PROTECT, related_name='movimentacoes_arquivadas', db_index=False
+    )
+    tipo = models.CharField(max_length=10, choices=MovimentacaoEstoque.TIPO_CHOICES)
+    quantidade = models.IntegerField()
+    valor_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+    data_movimentacao = models.DateTimeField()
+    usuario = models.ForeignKey('auth.User', on_delete=models.PROTECT, db_index=False, related_name='+')
+    nota_fiscal = models.ForeignKey(
+        'financeiro.NotaFiscal', on_delete=models.SET_NULL, null=True, db_index=False, related_name='+'
+    )
+    ordem_servico = models.ForeignKey(
+        'ordem_servico.OrdemServico', on_delete=models.SET_NULL, null=True, db_index=False, related_name='+'
+    )
+    fornecedor = models.ForeignKey(
+        'fornecedores.Fornecedor', on_delete=models.SET_NULL, null=True, db_index=False, related_name='+'
+    )
+    observacoes = models.TextField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Movimentação Arquivada"
+        verbose_name_plural = "Movimentações Arquivadas"
+        ordering = ['-data_movimentacao']
+        indexes = [
+            models.Index(fields=['mes', 'peca'], name='arq_mes_peca_idx'),
+            models.Index(fields=['peca', 'data_movimentacao'], name='arq_peca_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo.upper()} - {self.peca_id} - {self.quantidade}un ({self.mes:%m/%Y})"
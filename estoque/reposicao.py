@@ -0,0 +1,133 @@
+from datetime import timedelta
+from statistics import NormalDist
+
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from .models import SaldoEstoque
+from .servicos import livros_do_periodo
+from .snapshots import inicio_do_dia
+
+try:
+    import numpy as np
+except ImportError:  # dependência opcional: sem ela só a sugestão de reposição fica indisponível
+    np = None
+
+JANELA_DIAS = 180
+PRAZO_ENTREGA_DIAS = 7
+COBERTURA_DIAS = 30
+NIVEL_SERVICO = 0.95
+
+
+class ReposicaoIndisponivel(Exception):
+    """O cálculo de reposição depende do pacote numpy."""
+
+
+def _carregar_consumo(inicio, fim):
+    """
+    Movimentações de consumo do período em um array numpy (peça, instante, quantidade):
+    saídas contam positivo e devoluções de OS (entradas vinculadas a uma
+    ordem de serviço) negativo. Janelas que começam antes do horizonte do
+    arquivo também leem as movimentações arquivadas.
+    """
+    def linhas():
+        for modelo in livros_do_periodo(inicio):
+            movimentacoes = (
+                modelo.objects
+                .filter(data_movimentacao__gte=inicio, data_movimentacao__lt=fim)
+                .filter(Q(tipo='saida') | Q(tipo='entrada', ordem_servico__isnull=False))
+                .annotate(consumo=Case(When(tipo='saida', then=F('quantidade')), default=-F('quantidade')))
+                .values_list('peca_id', 'data_movimentacao', 'consumo')
+            )
+            for peca_id, data, consumo in movimentacoes.iterator(chunk_size=10000):
+                yield peca_id, data.timestamp(), consumo
+
+    return np.fromiter(
+        linhas(), dtype=[('peca', np.int64), ('instante', np.float64), ('consumo', np.float64)]
+    )
+
+
+def calcular_reposicao(janela_dias=JANELA_DIAS, prazo_entrega_dias=PRAZO_ENTREGA_DIAS,
+                       cobertura_dias=COBERTURA_DIAS, nivel_servico=NIVEL_SERVICO):
+    """
+    Ponto de pedido e quantidade sugerida de todas as peças ativas a partir do
+    consumo real dos últimos `janela_dias`.
+
+    O histórico é lido uma vez para arrays numpy; o agrupamento por (peça, dia)
+    e a média e o desvio padrão do consumo diário de todas as peças saem de
+    operações vetorizadas (dias sem consumo contam como zero). Peças
+    cadastradas dentro da janela usam só os dias desde o cadastro.
+
+        estoque de segurança = z * desvio * sqrt(prazo de entrega)
+        ponto de pedido      = consumo médio * prazo de entrega + estoque de segurança
+        quantidade sugerida  = ponto de pedido + consumo médio * cobertura - saldo
+                               (só quando o saldo já está no ponto de pedido ou abaixo)
+
+    Retorna uma lista de dicts das peças com consumo no período, das que acabam
+    primeiro (menos dias de cobertura) para as que acabam por último.
+    """
+    if np is None:
+        raise ReposicaoIndisponivel('A sugestão de reposição requer o pacote numpy.')
+
+    hoje = timezone.localdate()
+    dias_janela = [hoje - timedelta(days=n) for n in range(janela_dias - 1, -2, -1)]
+    # Meia-noite local de cada dia da janela (e do dia seguinte ao último), respeitando horário de verão
+    meias_noites = np.array([inicio_do_dia(dia).timestamp() for dia in dias_janela])
+    inicio, fim = inicio_do_dia(dias_janela[0]), inicio_do_dia(dias_janela[-1])
+
+    pecas = list(
+        SaldoEstoque.objects.filter(peca__ativo=True)
+        .order_by('peca_id')
+        .values_list('peca_id', 'quantidade', 'peca__data_cadastro')
+    )
+    if not pecas:
+        return []
+    peca_ids = np.fromiter((linha[0] for linha in pecas), dtype=np.int64, count=len(pecas))
+    saldos = np.fromiter((linha[1] for linha in pecas), dtype=np.float64, count=len(pecas))
+    cadastro = np.fromiter(
+        (timezone.localtime(linha[2]).date().toordinal() for linha in pecas), dtype=np.int64, count=len(pecas)
+    )
+
+    movimentacoes = _carregar_consumo(inicio, fim)
+    posicao = np.searchsorted(peca_ids, movimentacoes['peca'])
+    # Descarta movimentações de peças inativas (fora de peca_ids)
+    posicao = np.minimum(posicao, len(peca_ids) - 1)
+    validos = peca_ids[posicao] == movimentacoes['peca']
+    posicao, movimentacoes = posicao[validos], movimentacoes[validos]
+
+    # Consumo por (peça, dia): cada par vira uma chave inteira e as repetidas são somadas
+    dia = np.searchsorted(meias_noites, movimentacoes['instante'], side='right') - 1
+    chaves, grupo = np.unique(posicao * janela_dias + dia, return_inverse=True)
+    diario = np.bincount(grupo, weights=movimentacoes['consumo'], minlength=len(chaves))
+    peca_do_dia = chaves // janela_dias
+
+    soma = np.bincount(peca_do_dia, weights=diario, minlength=len(peca_ids))
+    soma_quadrados = np.bincount(peca_do_dia, weights=diario ** 2, minlength=len(peca_ids))
+    dias = np.clip(hoje.toordinal() - cadastro + 1, 1, janela_dias)
+
+    media = np.maximum(soma / dias, 0)
+    desvio = np.sqrt(np.maximum(soma_quadrados / dias - (soma / dias) ** 2, 0))
+
+    z = NormalDist().inv_cdf(nivel_servico)
+    seguranca = np.ceil(z * desvio * np.sqrt(prazo_entrega_dias))
+    ponto_pedido = np.ceil(media * prazo_entrega_dias) + seguranca
+    alvo = ponto_pedido + np.ceil(media * cobertura_dias)
+    sugerida = np.where(saldos <= ponto_pedido, np.maximum(alvo - saldos, 0), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cobertura = np.where(media > 0, np.maximum(saldos, 0) / media, np.inf)
+
+    com_consumo = np.flatnonzero(media > 0)
+    ordem = com_consumo[np.argsort(cobertura[com_consumo], kind='stable')]
+    return [
+        {
+            'peca_id': int(peca_ids[i]),
+            'saldo': int(saldos[i]),
+            'consumo_diario': round(float(media[i]), 3),
+            'desvio_diario': round(float(desvio[i]), 3),
+            'dias_cobertura': round(float(cobertura[i]), 1),
+            'estoque_seguranca': int(seguranca[i]),
+            'ponto_pedido': int(ponto_pedido[i]),
+            'quantidade_sugerida': int(sugerida[i]),
+        }
+        for i in ordem
+    ]
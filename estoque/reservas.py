@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models import F
+
+from .models import Peca, SaldoEstoque, ReservaEstoque
+from .servicos import EstoqueInsuficiente, registrar_saidas
+
+
+def _reservar_peca(peca_id, quantidade):
+    """
+    Reserva `quantidade` unidades com um UPDATE condicional (compare-and-set):
+    o banco só incrementa o reservado se o disponível ainda cobrir o pedido,
+    então duas reservas simultâneas nunca levam a mesma unidade. Só a linha de
+    saldo da peça é travada, e só durante o UPDATE; quem perde a disputa recebe
+    EstoqueInsuficiente na hora, sem fila.
+    """
+    reservadas = SaldoEstoque.objects.filter(
+        peca_id=peca_id, quantidade__gte=F('reservado') + quantidade
+    ).update(reservado=F('reservado') + quantidade)
+    if not reservadas:
+        peca = Peca.objects.select_related('saldo').get(pk=peca_id)
+        raise EstoqueInsuficiente(peca, max(peca.quantidade_disponivel, 0), quantidade)
+
+
+def reservar(itens, usuario, ordem_servico=None):
+    """
+    Reserva várias peças de uma vez (tudo ou nada).
+
+    itens: lista de (peca_id, quantidade). As peças são reservadas em ordem de
+    id, então dois pedidos que disputam as mesmas peças não entram em deadlock;
+    se alguma não tiver disponível, a transação é desfeita e nada fica reservado.
+    """
+    quantidades = {}
+    for peca_id, quantidade in itens:
+        if quantidade < 1:
+            raise ValueError(f"Quantidade inválida: {quantidade}")
+        quantidades[peca_id] = quantidades.get(peca_id, 0) + quantidade
+
+    with transaction.atomic():
+        for peca_id in sorted(quantidades):
+            _reservar_peca(peca_id, quantidades[peca_id])
+        return ReservaEstoque.objects.bulk_create([
+            ReservaEstoque(peca_id=peca_id, quantidade=quantidade, ordem_servico=ordem_servico, usuario=usuario)
+            for peca_id, quantidade in quantidades.items()
+        ])
+
+
+def liberar(reservas):
+    """Desfaz as reservas; o signal de exclusão devolve as unidades ao disponível."""
+    with transaction.atomic():
+        for reserva in reservas:
+            reserva.delete()
+
+
+def baixar(reservas, usuario, observacoes=''):
+    """
+    Converte as reservas em saídas do estoque, pelo preço de venda atual.
+    A reserva é desfeita e a saída gravada na mesma transação, então as
+    unidades passam de reservadas a baixadas sem ficar disponíveis no meio.
+    """
+    reservas = list(reservas)
+    with transaction.atomic():
+        liberar(reservas)
+        por_os = {}
+        for reserva in reservas:
+            por_os.setdefault(reserva.ordem_servico, []).append(
+                (reserva.peca_id, reserva.quantidade, reserva.peca.preco_venda)
+            )
+        for ordem_servico, itens in por_os.items():
+            registrar_saidas(
+                itens,
+                usuario,
+                ordem_servico=ordem_servico,
+                observacoes=observacoes or (f"Baixa de reserva da OS {ordem_servico.pk}" if ordem_servico else "Baixa de reserva")
+            )
@@ -0,0 +1,421 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Case, When, Value, IntegerField, DecimalField, FloatField, Max
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from .models import Peca, MovimentacaoEstoque, MovimentacaoArquivada, SaldoEstoque
+from .autocomplete import peca_alterada
+
+# Precisão do custo médio e do valor em estoque (as colunas têm 4 casas)
+CASAS_CUSTO = Decimal('0.0001')
+
+
+class EstoqueInsuficiente(Exception):
+    """Saída maior que o saldo disponível da peça."""
+
+    def __init__(self, peca, saldo, solicitado):
+        self.peca = peca
+        self.saldo = saldo
+        self.solicitado = solicitado
+        super().__init__(
+            f"Estoque insuficiente para {peca.codigo_interno} - {peca.nome}: "
+            f"saldo {saldo}, solicitado {solicitado}"
+        )
+
+
+class PecaNaoEncontrada(EstoqueInsuficiente):
+    """Peça do lote que não existe mais (ex: excluída enquanto a OS era editada); não tem saldo algum."""
+
+    def __init__(self, peca_id, solicitado):
+        self.peca = None
+        self.peca_id = peca_id
+        self.saldo = 0
+        self.solicitado = solicitado
+        Exception.__init__(self, f"Peça #{peca_id} não encontrada: ela pode ter sido excluída")
+
+
+def travar_pecas(peca_ids):
+    """
+    Trava (SELECT ... FOR UPDATE) as peças informadas e as retorna em um dict por id.
+    As linhas são sempre travadas em ordem de id, assim duas transações que
+    disputam as mesmas peças esperam uma pela outra em vez de entrar em deadlock.
+    """
+    pecas = Peca.objects.select_for_update().filter(pk__in=set(peca_ids)).order_by('pk')
+    return {peca.pk: peca for peca in pecas}
+
+
+def delta_saldo(tipo, quantidade):
+    """Efeito de uma movimentação no saldo: entrada soma, saída subtrai, ajuste não altera."""
+    if tipo == 'entrada':
+        return quantidade
+    if tipo == 'saida':
+        return -quantidade
+    return 0
+
+
+def efeito_movimento(tipo, quantidade, valor_unitario, ordem_servico_id=None):
+    """
+    Efeito de uma movimentação no saldo e no custo médio, como a tupla
+    (quantidade_compra, valor_compra, quantidade_ao_custo):
+
+    - entrada de compra: soma quantidade e valor, e recalcula o custo médio;
+    - saída: retira a quantidade pelo custo médio (o valor_unitario dela é o preço de venda);
+    - entrada ligada a uma OS é devolução: volta pelo custo médio, não pelo preço de venda;
+    - ajuste: não altera o estoque.
+    """
+    if tipo == 'entrada' and ordem_servico_id is None:
+        return (quantidade, quantidade * Decimal(valor_unitario), 0)
+    return (0, Decimal('0'), delta_saldo(tipo, quantidade))
+
+
+def somar_efeito(efeitos, peca_id, efeito, sinal=1):
+    """Acumula um efeito_movimento (ou o seu estorno, com sinal=-1) no dict {peca_id: efeito}."""
+    atual = efeitos.get(peca_id, (0, Decimal('0'), 0))
+    efeitos[peca_id] = tuple(total + sinal * parcela for total, parcela in zip(atual, efeito))
+    return efeitos
+
+
+def saldos_pecas(peca_ids):
+    """Saldo atual de várias peças, lido da tabela SaldoEstoque por chave primária."""
+    resultado = {peca_id: 0 for peca_id in peca_ids}
+    resultado.update(
+        SaldoEstoque.objects.filter(peca_id__in=set(peca_ids)).values_list('peca_id', 'quantidade')
+    )
+    return resultado
+
+
+def disponiveis_pecas(peca_ids):
+    """Saldo menos as unidades reservadas de várias peças, por chave primária."""
+    resultado = {peca_id: 0 for peca_id in peca_ids}
+    resultado.update(
+        SaldoEstoque.objects.filter(peca_id__in=set(peca_ids)).values_list(
+            'peca_id', F('quantidade') - F('reservado')
+        )
+    )
+    return resultado
+
+
+def proximo_mes(mes):
+    """Primeiro dia do mês seguinte ao da data informada."""
+    return (mes.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def horizonte_arquivo():
+    """
+    Início (datetime) do período que ainda está em MovimentacaoEstoque; tudo o
+    que é anterior foi para MovimentacaoArquivada. None se nada foi arquivado.
+    """
+    ultimo_mes = MovimentacaoArquivada.objects.aggregate(mes=Max('mes'))['mes']
+    if ultimo_mes is None:
+        return None
+    return timezone.make_aware(datetime.combine(proximo_mes(ultimo_mes), time.min))
+
+
+def livros_do_periodo(inicio=None):
+    """Tabelas com movimentações a partir de `inicio`: o arquivo só entra se o período começa antes do horizonte."""
+    horizonte = horizonte_arquivo()
+    if horizonte is not None and (inicio is None or inicio < horizonte):
+        return [MovimentacaoArquivada, MovimentacaoEstoque]
+    return [MovimentacaoEstoque]
+
+
+def movimentacoes_do_livro(peca_ids, inicio=None, fim=None):
+    """
+    (peca_id, tipo, quantidade, valor_unitario, ordem_servico_id) das movimentações
+    das peças em [inicio, fim), em ordem cronológica dentro de cada peça.
+    Períodos anteriores ao horizonte do arquivo também leem MovimentacaoArquivada
+    (as arquivadas de uma peça vêm sempre antes das que estão na tabela quente).
+    """
+    for modelo in livros_do_periodo(inicio):
+        movimentacoes = modelo.objects.filter(peca_id__in=set(peca_ids))
+        if inicio is not None:
+            movimentacoes = movimentacoes.filter(data_movimentacao__gte=inicio)
+        if fim is not None:
+            movimentacoes = movimentacoes.filter(data_movimentacao__lt=fim)
+        yield from movimentacoes.order_by('peca_id', 'data_movimentacao', 'pk').values_list(
+            'peca_id', 'tipo', 'quantidade', 'valor_unitario', 'ordem_servico_id'
+        ).iterator(chunk_size=2000)
+
+
+def saldos_do_livro(peca_ids):
+    """
+    Saldo, custo médio e valor recalculados a partir do livro de movimentações
+    (arquivo incluído), em {peca_id: (quantidade, custo_medio, valor_estoque)}.
+    O custo médio depende da ordem das movimentações, então o livro é percorrido
+    em ordem cronológica, aplicando a mesma regra de aplicar_saldos.
+    """
+    resultado = {peca_id: (0, Decimal('0'), Decimal('0')) for peca_id in peca_ids}
+    for peca_id, tipo, quantidade, valor_unitario, ordem_servico_id in movimentacoes_do_livro(peca_ids):
+        resultado[peca_id] = acumular_custo(
+            *resultado[peca_id], *efeito_movimento(tipo, quantidade, valor_unitario, ordem_servico_id)
+        )
+    return resultado
+
+
+def acumular_custo(quantidade, custo, valor, quantidade_compra, valor_compra, quantidade_ao_custo):
+    """
+    Aplica um efeito ao (quantidade, custo_medio, valor_estoque) de uma peça.
+    Compras primeiro (recalculando o custo médio), depois o que se move pelo custo
+    médio; com o saldo zerado ou negativo o valor em estoque é zero.
+    """
+    base = quantidade + quantidade_compra
+    if quantidade_compra and base > 0:
+        custo = ((valor + valor_compra) / base).quantize(CASAS_CUSTO)
+    quantidade = base + quantidade_ao_custo
+    if quantidade > 0:
+        valor = (valor + valor_compra + quantidade_ao_custo * custo).quantize(CASAS_CUSTO)
+    else:
+        valor = Decimal('0')
+    return quantidade, custo, valor
+
+
+def criar_saldos(peca_ids):
+    """Cria as linhas de SaldoEstoque que faltarem (ex: peças gravadas com bulk_create), zeradas."""
+    SaldoEstoque.objects.bulk_create(
+        [
+            SaldoEstoque(peca_id=peca_id, quantidade_minima=minima, estoque_baixo=0 <= minima)
+            for peca_id, minima in Peca.objects.filter(pk__in=set(peca_ids)).values_list('pk', 'quantidade_minima')
+        ],
+        ignore_conflicts=True
+    )
+
+
+def _por_peca(efeitos, indice, campo):
+    return Case(
+        *[When(peca_id=peca_id, then=Value(efeito[indice])) for peca_id, efeito in efeitos.items()],
+        default=Value(0),
+        output_field=campo
+    )
+
+
+def _saidas(efeitos):
+    """Unidades que cada peça perde com os efeitos (só as de saldo líquido negativo)."""
+    return {
+        peca_id: -(compra + ao_custo)
+        for peca_id, (compra, _, ao_custo) in efeitos.items() if compra + ao_custo < 0
+    }
+
+
+def _somar_saldos(efeitos, saidas=None):
+    # No UPDATE todas as colunas à direita ainda têm o valor antigo, então cada
+    # expressão abaixo parte do estado anterior da linha. O Round deixa o valor
+    # gravado igual em qualquer banco (o SQLite calcula decimais em ponto flutuante)
+    decimal = DecimalField(max_digits=16, decimal_places=4)
+    delta = _por_peca(
+        {peca_id: (compra + ao_custo,) for peca_id, (compra, _, ao_custo) in efeitos.items()},
+        0, IntegerField()
+    )
+    ao_custo = _por_peca(efeitos, 2, IntegerField())
+
+    custos = []
+    valores = []
+    for peca_id, (quantidade_compra, valor_compra, quantidade_ao_custo) in efeitos.items():
+        custo = F('custo_medio')
+        if quantidade_compra:
+            base = F('quantidade') + Value(quantidade_compra)
+            if connection.vendor == 'sqlite':
+                # O SQLite guarda decimais sem fração (30.0000) como inteiros e dividiria inteiro por inteiro (30 / 12 = 2)
+                base = Cast(base, FloatField())
+            custo = Case(
+                When(
+                    quantidade__gt=-quantidade_compra,
+                    then=Round(
+                        (F('valor_estoque') + Value(valor_compra)) / base,
+                        4, output_field=decimal
+                    )
+                ),
+                default=F('custo_medio'),
+                output_field=decimal
+            )
+            custos.append(When(peca_id=peca_id, then=custo))
+        valores.append(When(
+            peca_id=peca_id,
+            quantidade__gt=-(quantidade_compra + quantidade_ao_custo),
+            then=Round(
+                F('valor_estoque') + Value(valor_compra) + Value(quantidade_ao_custo) * custo,
+                4, output_field=decimal
+            )
+        ))
+
+    campos = {
+        'quantidade': F('quantidade') + delta,
+        'estoque_baixo': Case(
+            When(quantidade__lte=F('quantidade_minima') - delta, then=Value(True)),
+            default=Value(False)
+        ),
+        # Saldo zerado (ou negativo) não tem valor em estoque
+        'valor_estoque': Case(*valores, default=Value(Decimal('0')), output_field=decimal),
+    }
+    if custos:
+        campos['custo_medio'] = Case(*custos, default=F('custo_medio'), output_field=decimal)
+    saldos = SaldoEstoque.objects.filter(peca_id__in=efeitos)
+    if saidas:
+        # Compare-and-set: a linha só muda se quantidade - reservado ainda cobrir a saída
+        minimos = _por_peca({peca_id: (n,) for peca_id, n in saidas.items()}, 0, IntegerField())
+        saldos = saldos.filter(quantidade__gte=F('reservado') + minimos)
+    return saldos.update(**campos)
+
+
+def aplicar_saldos(efeitos, conferir_disponivel=False):
+    """
+    Aplica os efeitos {peca_id: efeito_movimento} à tabela SaldoEstoque.
+
+    Um único UPDATE com quantidade = quantidade + CASE peca_id ..., calculado pelo
+    próprio banco, então gravações concorrentes não perdem incrementos. O mesmo
+    UPDATE recalcula o custo médio ponderado e o valor em estoque (em Decimal) e
+    liga ou desliga o estoque_baixo quando o saldo cruza o mínimo. Peças ainda
+    sem linha de saldo têm a linha criada e recebem o efeito em seguida.
+
+    Com conferir_disponivel=True (saídas) o UPDATE é também um compare-and-set,
+    como o de reservas._reservar_peca: as peças que perdem unidades só são
+    atualizadas se quantidade - reservado ainda cobrir a saída. Se alguma não
+    cobrir, levanta EstoqueInsuficiente e nada do lote é aplicado; uma reserva
+    concorrente nunca fica com a mesma unidade de uma baixa.
+    """
+    efeitos = {peca_id: efeito for peca_id, efeito in efeitos.items() if any(efeito)}
+    if not efeitos:
+        return
+    saidas = _saidas(efeitos) if conferir_disponivel else {}
+
+    with transaction.atomic():
+        atualizadas = _somar_saldos(efeitos, saidas)
+        if atualizadas < len(efeitos):
+            existentes = set(
+                SaldoEstoque.objects.filter(peca_id__in=efeitos).values_list('peca_id', flat=True)
+            )
+            faltando = {peca_id: efeito for peca_id, efeito in efeitos.items() if peca_id not in existentes}
+            if faltando:
+                criar_saldos(faltando)
+                atualizadas += _somar_saldos(faltando, saidas)
+        if saidas and atualizadas < len(efeitos):
+            # Alguma saída foi recusada pelo UPDATE: aponta a peça mais apertada (o
+            # disponível pode ter mudado de novo desde então) e desfaz o lote inteiro
+            disponiveis = disponiveis_pecas(saidas)
+            peca_id = min(sorted(saidas), key=lambda peca_id: disponiveis[peca_id] - saidas[peca_id])
+            raise EstoqueInsuficiente(
+                Peca.objects.get(pk=peca_id), max(disponiveis[peca_id], 0), saidas[peca_id]
+            )
+
+
+def atualizar_precos_compra(precos, pecas=None):
+    """
+    Aplica o último preço de compra {peca_id: valor_unitario} de várias peças
+    com um único UPDATE ... CASE, recalculando o preço de venda pela margem com
+    a mesma regra do Peca.save(), sem regravar a linha inteira da peça.
+
+    pecas: dict {peca_id: Peca} já travado pelo chamador (evita ler as margens
+    de novo). Retorna {peca_id: (ultimo_preco_compra, preco_venda)}.
+    """
+    precos = {peca_id: Decimal(valor) for peca_id, valor in precos.items() if valor > 0}
+    if not precos:
+        return {}
+
+    with transaction.atomic():
+        if pecas is None:
+            pecas = {
+                peca.pk: peca for peca in Peca.objects.select_for_update().filter(pk__in=precos).only(
+                    'pk', 'codigo_interno', 'nome', 'margem_lucro', 'preco_venda', 'ativo'
+                )
+            }
+        novos = {}
+        for peca_id, custo in precos.items():
+            peca = pecas[peca_id]
+            preco_venda = peca.preco_venda
+            if peca.margem_lucro > 0:
+                preco_venda = (custo * (1 + (peca.margem_lucro / 100))).quantize(Decimal('0.01'))
+            novos[peca_id] = (custo, preco_venda)
+
+        decimal = DecimalField(max_digits=10, decimal_places=2)
+        Peca.objects.filter(pk__in=novos).update(
+            ultimo_preco_compra=Case(
+                *[When(pk=peca_id, then=Value(custo)) for peca_id, (custo, _) in novos.items()],
+                output_field=decimal
+            ),
+            preco_venda=Case(
+                *[When(pk=peca_id, then=Value(venda)) for peca_id, (_, venda) in novos.items()],
+                output_field=decimal
+            ),
+        )
+
+        # O UPDATE não dispara signals: o preço mostrado no autocomplete é atualizado aqui
+        for peca_id, (custo, preco_venda) in novos.items():
+            peca = pecas[peca_id]
+            peca.ultimo_preco_compra, peca.preco_venda = custo, preco_venda
+            peca_alterada(peca)
+    return novos
+
+
+def registrar_movimentos(movimentos, usuario, ordem_servico=None, observacoes='',
+                         nota_fiscal=None, fornecedor=None, atualizar_precos=False):
+    """
+    Grava um lote de movimentações com um único bulk_create.
+
+    movimentos: lista de (peca_id, tipo, quantidade, valor_unitario).
+    Trava as peças envolvidas e confere, em uma consulta, se o saldo disponível
+    (fora o reservado) cobre as saídas líquidas do lote. Levanta
+    EstoqueInsuficiente (desfazendo a transação) se alguma peça não tiver saldo,
+    ou PecaNaoEncontrada (subclasse dela) se alguma peça não existir mais.
+    O saldo materializado é atualizado aqui mesmo, já que o bulk_create não
+    dispara signals, com o compare-and-set de aplicar_saldos: a trava das peças
+    não segura as reservas (que só mexem no saldo), então a conferência vale de
+    novo no próprio UPDATE. Com atualizar_precos=True (entrada de NF) as entradas
+    também atualizam o último preço de compra, em um UPDATE para o lote todo;
+    sem ele (baixas e devoluções de OS) os preços das peças não mudam.
+    """
+    if not movimentos:
+        return []
+
+    deltas = {}
+    efeitos = {}
+    precos = {}
+    ordem_servico_id = ordem_servico.pk if ordem_servico else None
+    for peca_id, tipo, quantidade, valor_unitario in movimentos:
+        deltas[peca_id] = deltas.get(peca_id, 0) + delta_saldo(tipo, quantidade)
+        somar_efeito(efeitos, peca_id, efeito_movimento(tipo, quantidade, valor_unitario, ordem_servico_id))
+        if atualizar_precos and tipo == 'entrada' and valor_unitario > 0:
+            precos[peca_id] = valor_unitario  # vale a última entrada da peça no lote
+
+    with transaction.atomic():
+        pecas = travar_pecas(deltas)
+        ausentes = sorted(deltas.keys() - pecas.keys())
+        if ausentes:
+            raise PecaNaoEncontrada(ausentes[0], abs(deltas[ausentes[0]]))
+        # Unidades reservadas para outras OS não podem sair
+        disponiveis = disponiveis_pecas(deltas)
+        for peca_id, delta in deltas.items():
+            if delta < 0 and -delta > disponiveis[peca_id]:
+                raise EstoqueInsuficiente(pecas[peca_id], max(disponiveis[peca_id], 0), -delta)
+
+        criadas = MovimentacaoEstoque.objects.bulk_create([
+            MovimentacaoEstoque(
+                peca_id=peca_id,
+                tipo=tipo,
+                quantidade=quantidade,
+                valor_unitario=valor_unitario,
+                ordem_servico=ordem_servico,
+                nota_fiscal=nota_fiscal,
+                fornecedor=fornecedor,
+                usuario=usuario,
+                observacoes=observacoes
+            )
+            for peca_id, tipo, quantidade, valor_unitario in movimentos
+        ])
+        aplicar_saldos(efeitos, conferir_disponivel=True)
+        atualizar_precos_compra(precos, pecas)
+        return criadas
+
+
+def registrar_saidas(itens, usuario, ordem_servico=None, observacoes=''):
+    """
+    Dá baixa em várias peças de uma vez.
+    itens: lista de (peca_id, quantidade, valor_unitario).
+    """
+    return registrar_movimentos(
+        [(peca_id, 'saida', quantidade, valor) for peca_id, quantidade, valor in itens],
+        usuario,
+        ordem_servico=ordem_servico,
+        observacoes=observacoes
+    )
@@ -0,0 +1,75 @@
+from django.db.models import Case, When, Value, F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Peca, MovimentacaoEstoque, SaldoEstoque, ReservaEstoque
+from .servicos import aplicar_saldos, criar_saldos, efeito_movimento, somar_efeito
+from .snapshots import invalidar_snapshots
+from .autocomplete import peca_alterada, peca_removida
+
+
+@receiver(post_save, sender=Peca)
+def sincronizar_saldo_peca(sender, instance, created, **kwargs):
+    """Cria o saldo da peça nova e acompanha mudanças na quantidade mínima."""
+    if created:
+        criar_saldos([instance.pk])
+        return
+    SaldoEstoque.objects.filter(peca=instance).exclude(
+        quantidade_minima=instance.quantidade_minima
+    ).update(
+        quantidade_minima=instance.quantidade_minima,
+        estoque_baixo=Case(
+            When(quantidade__lte=instance.quantidade_minima, then=Value(True)),
+            default=Value(False)
+        )
+    )
+
+
+def _dados_saldo(movimentacao):
+    return (
+        movimentacao.peca_id, movimentacao.tipo, movimentacao.quantidade,
+        movimentacao.valor_unitario, movimentacao.ordem_servico_id
+    )
+
+
+@receiver(post_save, sender=MovimentacaoEstoque)
+def atualizar_saldo_movimentacao(sender, instance, **kwargs):
+    """Aplica a movimentação no saldo; numa edição, estorna antes o efeito original."""
+    efeitos = {}
+    original = getattr(instance, '_saldo_original', None)
+    if original:
+        peca_id, *dados = original
+        somar_efeito(efeitos, peca_id, efeito_movimento(*dados), sinal=-1)
+        # Edição de movimentação antiga: os snapshots posteriores deixam de valer
+        invalidar_snapshots(peca_id, instance.data_movimentacao)
+        invalidar_snapshots(instance.peca_id, instance.data_movimentacao)
+    peca_id, *dados = _dados_saldo(instance)
+    somar_efeito(efeitos, peca_id, efeito_movimento(*dados))
+    # Saída (nova ou editada) só baixa o que está disponível, fora o reservado
+    aplicar_saldos(efeitos, conferir_disponivel=instance.tipo == 'saida')
+    instance._saldo_original = _dados_saldo(instance)
+
+
+@receiver(post_delete, sender=MovimentacaoEstoque)
+def estornar_saldo_movimentacao(sender, instance, **kwargs):
+    peca_id, *dados = getattr(instance, '_saldo_original', None) or _dados_saldo(instance)
+    aplicar_saldos(somar_efeito({}, peca_id, efeito_movimento(*dados), sinal=-1))
+    invalidar_snapshots(peca_id, instance.data_movimentacao)
+
+
+@receiver(post_save, sender=Peca)
+def atualizar_autocomplete_peca(sender, instance, **kwargs):
+    peca_alterada(instance)
+
+
+@receiver(post_delete, sender=Peca)
+def remover_autocomplete_peca(sender, instance, **kwargs):
+    peca_removida(instance.pk)
+
+
+@receiver(post_delete, sender=ReservaEstoque)
+def devolver_reserva(sender, instance, **kwargs):
+    """Reserva desfeita (inclusive pela exclusão da OS): as unidades voltam ao disponível."""
+    SaldoEstoque.objects.filter(peca_id=instance.peca_id).update(
+        reservado=F('reservado') - instance.quantidade
+    )
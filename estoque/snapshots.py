@@ -0,0 +1,156 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import SnapshotEstoque
+from .servicos import acumular_custo, efeito_movimento, livros_do_periodo, movimentacoes_do_livro
+
+# Limites de uma série diária (uma consulta só, mas a resposta cresce com peças x dias)
+MAX_DIAS_SERIE = 366
+MAX_PECAS_SERIE = 50
+
+
+def inicio_do_dia(data):
+    """Converte uma date no datetime (com fuso) da meia-noite local, usado como data de corte."""
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def ultimos_snapshots(peca_ids, data):
+    """Snapshot mais recente com corte até `data` de cada peça, em um dict por peca_id."""
+    mais_recente = SnapshotEstoque.objects.filter(
+        peca=OuterRef('peca'), data__lte=data
+    ).order_by('-data').values('data')[:1]
+    snapshots = SnapshotEstoque.objects.filter(
+        peca_id__in=set(peca_ids), data=Subquery(mais_recente)
+    )
+    return {snapshot.peca_id: snapshot for snapshot in snapshots}
+
+
+def saldos_em(peca_ids, data=None):
+    """
+    Saldo, custo médio e valor de várias peças considerando as movimentações
+    anteriores a `data` (agora, se não informada).
+
+    Parte do último snapshot de cada peça e percorre só a cauda de movimentações
+    desde ele, usando o índice (peca, data_movimentacao); peças sem snapshot
+    percorrem o histórico inteiro. O arquivo de movimentações só é lido quando
+    a cauda começa antes do horizonte dele. O custo médio segue a mesma regra do saldo
+    materializado (estoque.servicos.acumular_custo).
+    Retorna {peca_id: {'quantidade', 'custo_unitario', 'valor'}}.
+    """
+    data = data or timezone.now()
+    snapshots = ultimos_snapshots(peca_ids, data)
+
+    estado = {}
+    por_corte = {}
+    for peca_id in set(peca_ids):
+        snapshot = snapshots.get(peca_id)
+        estado[peca_id] = (
+            (snapshot.quantidade, snapshot.custo_unitario, snapshot.valor) if snapshot
+            else (0, Decimal('0'), Decimal('0'))
+        )
+        # Peças com o mesmo corte (o caso comum: todas no fim do mês) leem a cauda juntas
+        por_corte.setdefault(snapshot.data if snapshot else None, []).append(peca_id)
+
+    for corte, ids in por_corte.items():
+        cauda = movimentacoes_do_livro(ids, inicio=corte, fim=data)
+        for peca_id, tipo, quantidade, valor_unitario, ordem_servico_id in cauda:
+            estado[peca_id] = acumular_custo(
+                *estado[peca_id], *efeito_movimento(tipo, quantidade, valor_unitario, ordem_servico_id)
+            )
+
+    return {
+        peca_id: {'quantidade': quantidade, 'custo_unitario': custo, 'valor': valor}
+        for peca_id, (quantidade, custo, valor) in estado.items()
+    }
+
+
+def saldos_diarios(peca_ids, inicio, fim):
+    """
+    Saldo de fechamento de cada dia de `inicio` a `fim` (dates, inclusive) de
+    várias peças, em {peca_id: [saldo do dia inicio, ..., saldo do dia fim]}.
+
+    O saldo de abertura vem de saldos_em (snapshot + cauda). O resto sai de uma
+    única consulta: as movimentações do período são somadas por (peça, dia
+    local) e um SUM() OVER (PARTITION BY peça ORDER BY dia) devolve o
+    acumulado de cada dia com movimento, então o Python só recebe uma linha
+    por peça e dia movimentado e repete o saldo nos dias sem movimento.
+    Períodos anteriores ao horizonte do arquivo somam também as arquivadas.
+    """
+    peca_ids = set(peca_ids)
+    if not peca_ids:
+        return {}
+    corte, limite = inicio_do_dia(inicio), inicio_do_dia(fim + timedelta(days=1))
+    dias = (fim - inicio).days + 1
+    indice = {(inicio + timedelta(days=n)).isoformat(): n for n in range(dias)}
+    abertura = saldos_em(peca_ids, corte)
+
+    consultas = []
+    parametros = []
+    for modelo in livros_do_periodo(corte):
+        por_dia = (
+            modelo.objects
+            .filter(peca_id__in=peca_ids, data_movimentacao__gte=corte, data_movimentacao__lt=limite)
+            .annotate(dia=TruncDate('data_movimentacao'))
+            .values('peca_id', 'dia')
+            .annotate(delta=Sum(Case(
+                When(tipo='entrada', then=F('quantidade')),
+                When(tipo='saida', then=-F('quantidade')),
+                default=Value(0)
+            )))
+            .order_by()
+        )
+        sql, params = por_dia.query.sql_with_params()
+        consultas.append(sql)
+        parametros.extend(params)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT peca_id, dia, SUM(SUM(delta)) OVER (PARTITION BY peca_id ORDER BY dia) "
+            f"FROM ({' UNION ALL '.join(consultas)}) AS movimento "
+            "GROUP BY peca_id, dia",
+            parametros
+        )
+        acumulados = {}
+        for peca_id, dia, acumulado in cursor.fetchall():
+            # O dia vem como texto no SQLite e como date no PostgreSQL
+            acumulados.setdefault(peca_id, {})[indice[str(dia)]] = acumulado
+
+    series = {}
+    for peca_id in peca_ids:
+        do_dia = acumulados.get(peca_id, {})
+        saldo = abertura[peca_id]['quantidade']
+        acumulado = 0
+        serie = []
+        for n in range(dias):
+            acumulado = do_dia.get(n, acumulado)
+            serie.append(saldo + acumulado)
+        series[peca_id] = serie
+    return series
+
+
+def gerar_snapshots(peca_ids, data):
+    """
+    Grava (ou regrava) o snapshot das peças na data de corte informada.
+    Como saldos_em parte do snapshot anterior, cada período só soma as
+    movimentações do próprio período.
+    """
+    saldos = saldos_em(peca_ids, data)
+    return SnapshotEstoque.objects.bulk_create(
+        [
+            SnapshotEstoque(peca_id=peca_id, data=data, **saldo)
+            for peca_id, saldo in saldos.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['peca', 'data'],
+        update_fields=['quantidade', 'custo_unitario', 'valor']
+    )
+
+
+def invalidar_snapshots(peca_id, desde):
+    """Remove os snapshots que já contavam uma movimentação alterada ou excluída retroativamente."""
+    SnapshotEstoque.objects.filter(peca_id=peca_id, data__gt=desde).delete()
@@ -1,3 +1,573 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import CategoriaPeca, Peca, MovimentacaoEstoque, SaldoEstoque, SnapshotEstoque, ReservaEstoque
+from .servicos import registrar_movimentos, EstoqueInsuficiente, PecaNaoEncontrada
+from .snapshots import saldos_em, saldos_diarios, inicio_do_dia
+from .importacao import importar_pecas, ArquivoInvalido
+from .leitura import ler_codigo, leituras_recentes, CodigoAmbiguo
+from . import reposicao, reservas, servicos
+
+
+class SaldoEstoqueTest(TestCase):
+    """A tabela SaldoEstoque acompanha o livro de movimentações."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('estoquista', password='senha')
+        cls.categoria = CategoriaPeca.objects.create(nome='Baterias')
+
+    def setUp(self):
+        self.peca = Peca.objects.create(nome='Bateria', categoria=self.categoria)
+
+    def _movimentar(self, tipo, quantidade):
+        return MovimentacaoEstoque.objects.create(
+            peca=self.peca, tipo=tipo, quantidade=quantidade,
+            valor_unitario=Decimal('10.00'), usuario=self.usuario
+        )
+
+    def _saldo(self):
+        return SaldoEstoque.objects.get(peca=self.peca).quantidade
+
+    def test_saldo_criado_com_a_peca(self):
+        self.assertEqual(self._saldo(), 0)
+
+    def test_movimentacoes_atualizam_saldo(self):
+        self._movimentar('entrada', 10)
+        saida = self._movimentar('saida', 3)
+        self._movimentar('ajuste', 4)
+        self.assertEqual(self._saldo(), 7)
+
+        saida = MovimentacaoEstoque.objects.get(pk=saida.pk)
+        saida.quantidade = 5
+        saida.save()
+        self.assertEqual(self._saldo(), 5)
+
+        saida.delete()
+        self.assertEqual(self._saldo(), 10)
+
+    def test_lote_atualiza_saldo_e_bloqueia_saida_sem_saldo(self):
+        registrar_movimentos([(self.peca.pk, 'entrada', 4, Decimal('1.00'))], self.usuario)
+        with self.assertRaises(EstoqueInsuficiente):
+            registrar_movimentos([(self.peca.pk, 'saida', 5, Decimal('1.00'))], self.usuario)
+        registrar_movimentos([(self.peca.pk, 'saida', 4, Decimal('1.00'))], self.usuario)
+        self.assertEqual(self._saldo(), 0)
+
+    def test_estoque_baixo_acompanha_saldo_e_minimo(self):
+        self.assertTrue(SaldoEstoque.objects.get(peca=self.peca).estoque_baixo)
+        self._movimentar('entrada', 6)
+        self.assertFalse(SaldoEstoque.objects.get(peca=self.peca).estoque_baixo)
+        self._movimentar('saida', 1)
+        self.assertTrue(SaldoEstoque.objects.get(peca=self.peca).estoque_baixo)
+
+        self.peca.quantidade_minima = 2
+        self.peca.save()
+        self.assertFalse(SaldoEstoque.objects.get(peca=self.peca).estoque_baixo)
+        self.assertFalse(Peca.objects.filter(saldo__estoque_baixo=True).exists())
+
+    def test_custo_medio_ponderado(self):
+        MovimentacaoEstoque.objects.create(
+            peca=self.peca, tipo='entrada', quantidade=10, valor_unitario=Decimal('10.00'), usuario=self.usuario
+        )
+        MovimentacaoEstoque.objects.create(
+            peca=self.peca, tipo='entrada', quantidade=10, valor_unitario=Decimal('20.00'), usuario=self.usuario
+        )
+        # Saída pelo preço de venda: o estoque baixa pelo custo médio
+        MovimentacaoEstoque.objects.create(
+            peca=self.peca, tipo='saida', quantidade=5, valor_unitario=Decimal('99.00'), usuario=self.usuario
+        )
+        saldo = SaldoEstoque.objects.get(peca=self.peca)
+        self.assertEqual((saldo.quantidade, saldo.custo_medio, saldo.valor_estoque), (15, Decimal('15'), Decimal('225')))
+
+        # Livro e tabela concordam
+        saida = StringIO()
+        call_command('reconstruir_saldos', '--verificar', stdout=saida)
+        self.assertIn('0 com saldo divergente', saida.getvalue())
+
+    def test_custo_medio_com_valores_inteiros(self):
+        # Quantidades e valores sem fração: a divisão não pode ser inteira (30 / 12 = 2)
+        for tipo, quantidade, valor in [('entrada', 10, '2.00'), ('saida', 4, '5.00'), ('entrada', 6, '3.00')]:
+            MovimentacaoEstoque.objects.create(
+                peca=self.peca, tipo=tipo, quantidade=quantidade, valor_unitario=Decimal(valor), usuario=self.usuario
+            )
+        saldo = SaldoEstoque.objects.get(peca=self.peca)
+        self.assertEqual((saldo.quantidade, saldo.custo_medio, saldo.valor_estoque), (12, Decimal('2.5'), Decimal('30')))
+
+    def test_comando_reconstroi_saldo_divergente(self):
+        self._movimentar('entrada', 8)
+        SaldoEstoque.objects.filter(peca=self.peca).update(quantidade=99)
+
+        saida = StringIO()
+        call_command('reconstruir_saldos', '--verificar', stdout=saida)
+        self.assertIn('1 com saldo divergente', saida.getvalue())
+        self.assertEqual(self._saldo(), 99)
+
+        call_command('reconstruir_saldos', stdout=StringIO())
+        self.assertEqual(self._saldo(), 8)
+
+
+class PrecoCompraTest(TestCase):
+    """Entradas atualizam os preços da peça só nas colunas de preço, em lote."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('comprador', password='senha')
+        cls.categoria = CategoriaPeca.objects.create(nome='Cabos')
+
+    def _pecas(self, quantidade):
+        return [
+            Peca.objects.create(nome=f'Cabo {n}', categoria=self.categoria, margem_lucro=Decimal('50'))
+            for n in range(quantidade)
+        ]
+
+    def test_entrada_atualiza_preco_pela_margem(self):
+        peca = self._pecas(1)[0]
+        movimentacao = MovimentacaoEstoque(
+            peca_id=peca.pk, tipo='entrada', quantidade=1, valor_unitario=Decimal('10.01'), usuario=self.usuario
+        )
+        movimentacao.save()
+        peca.refresh_from_db()
+        self.assertEqual((peca.ultimo_preco_compra, peca.preco_venda), (Decimal('10.01'), Decimal('15.02')))
+
+    def test_lote_usa_um_update_de_preco(self):
+        def consultas(pecas):
+            with CaptureQueriesContext(connection) as contexto:
+                registrar_movimentos(
+                    [(peca.pk, 'entrada', 2, Decimal('8.00')) for peca in pecas] +
+                    [(pecas[0].pk, 'entrada', 1, Decimal('12.00'))],
+                    self.usuario, atualizar_precos=True
+                )
+            return len(contexto)
+
+        pecas = self._pecas(5)
+        self.assertEqual(consultas(pecas[:2]), consultas(pecas[2:]))
+        self.assertEqual(
+            list(Peca.objects.filter(pk__in=[p.pk for p in pecas]).order_by('pk').values_list('ultimo_preco_compra', 'preco_venda')),
+            [(Decimal('12.00'), Decimal('18.00')), (Decimal('8.00'), Decimal('12.00'))] * 2 + [(Decimal('8.00'), Decimal('12.00'))]
+        )
+
+
+class PecaAdminTest(TestCase):
+    def test_listagem_nao_consulta_por_linha(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@djtech.com', 'senha'))
+        categoria = CategoriaPeca.objects.create(nome='Teclados')
+
+        def consultas(quantidade):
+            for n in range(quantidade):
+                Peca.objects.create(nome=f'Teclado {n}', categoria=categoria)
+            with CaptureQueriesContext(connection) as contexto:
+                resposta = self.client.get(reverse('admin:estoque_peca_changelist'))
+            self.assertEqual(resposta.status_code, 200)
+            return len(contexto)
+
+        self.assertEqual(consultas(2), consultas(10))
+
+    def test_status_sem_linha_de_saldo(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@djtech.com', 'senha'))
+        categoria = CategoriaPeca.objects.create(nome='Mouses')
+        baixa = Peca.objects.create(nome='Mouse USB', categoria=categoria)
+        sem_saldo = Peca.objects.create(nome='Mouse sem fio', categoria=categoria)
+        SaldoEstoque.objects.filter(peca=sem_saldo).delete()
+
+        resposta = self.client.get(reverse('admin:estoque_peca_changelist'))
+        self.assertContains(resposta, 'BAIXO', count=1)
+        self.assertContains(resposta, '—')
+        self.assertTrue(SaldoEstoque.objects.get(peca=baixa).estoque_baixo)
+
+
+class SnapshotEstoqueTest(TestCase):
+    """Saldo em uma data = snapshot anterior + cauda de movimentações."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('estoquista', password='senha')
+        categoria = CategoriaPeca.objects.create(nome='Conectores')
+        cls.peca = Peca.objects.create(nome='Conector de carga', categoria=categoria)
+        cls.hoje = timezone.localdate()
+        # Movimentações em 40, 20 e 5 dias atrás
+        for dias, tipo, quantidade, valor in [
+            (40, 'entrada', 10, '2.00'), (20, 'saida', 4, '5.00'), (5, 'entrada', 6, '3.00')
+        ]:
+            movimentacao = MovimentacaoEstoque.objects.create(
+                peca=cls.peca, tipo=tipo, quantidade=quantidade,
+                valor_unitario=Decimal(valor), usuario=cls.usuario
+            )
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(
+                data_movimentacao=timezone.now() - timedelta(days=dias)
+            )
+
+    def test_saldo_historico_com_e_sem_snapshot(self):
+        corte = self.hoje - timedelta(days=30)
+        sem_snapshot = saldos_em([self.peca.pk], inicio_do_dia(self.hoje - timedelta(days=10)))
+
+        call_command('gerar_snapshots_estoque', '--data', corte.isoformat(), stdout=StringIO())
+        snapshot = SnapshotEstoque.objects.get(peca=self.peca)
+        self.assertEqual((snapshot.quantidade, snapshot.valor), (10, Decimal('20.00')))
+
+        com_snapshot = saldos_em([self.peca.pk], inicio_do_dia(self.hoje - timedelta(days=10)))
+        self.assertEqual(com_snapshot, sem_snapshot)
+        self.assertEqual(com_snapshot[self.peca.pk]['quantidade'], 6)
+
+        atual = saldos_em([self.peca.pk])[self.peca.pk]
+        # 6 restantes a 2,00 + 6 comprados a 3,00: custo médio 2,50
+        self.assertEqual((atual['quantidade'], atual['custo_unitario'], atual['valor']), (12, Decimal('2.5'), Decimal('30')))
+
+    def test_exclusao_retroativa_invalida_snapshot(self):
+        call_command('gerar_snapshots_estoque', '--data', (self.hoje - timedelta(days=30)).isoformat(), stdout=StringIO())
+        self.peca.movimentacoes.order_by('data_movimentacao').first().delete()
+        self.assertFalse(SnapshotEstoque.objects.filter(peca=self.peca).exists())
+
+
+class ArquivoMovimentacoesTest(TestCase):
+    def setUp(self):
+        usuario = User.objects.create_user('estoquista', password='senha')
+        self.peca = Peca.objects.create(nome='Fonte ATX', categoria=CategoriaPeca.objects.create(nome='Fontes'))
+        for dias, tipo, quantidade, valor in [
+            (400, 'entrada', 10, '2.55'), (200, 'saida', 4, '5.00'), (3, 'entrada', 6, '3.30')
+        ]:
+            movimentacao = MovimentacaoEstoque.objects.create(
+                peca=self.peca, tipo=tipo, quantidade=quantidade,
+                valor_unitario=Decimal(valor), usuario=usuario
+            )
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(
+                data_movimentacao=timezone.now() - timedelta(days=dias)
+            )
+
+    def test_arquiva_sem_alterar_saldos(self):
+        antigo = inicio_do_dia(timezone.localdate() - timedelta(days=100))
+        antes = saldos_em([self.peca.pk], antigo)
+
+        call_command('arquivar_movimentacoes', '--meses', '2', stdout=StringIO())
+
+        self.assertEqual(self.peca.movimentacoes.count(), 1)
+        self.assertEqual(self.peca.movimentacoes_arquivadas.count(), 2)
+        self.assertEqual(SaldoEstoque.objects.get(peca=self.peca).quantidade, 12)
+        self.assertEqual(saldos_em([self.peca.pk], antigo), antes)
+
+        # Saldo atual: parte do saldo de abertura, sem ler linhas do arquivo
+        with CaptureQueriesContext(connection) as contexto:
+            atual = saldos_em([self.peca.pk])[self.peca.pk]
+        self.assertEqual((atual['quantidade'], atual['valor']), (12, Decimal('35.1')))
+        self.assertFalse([
+            consulta for consulta in contexto.captured_queries
+            if 'movimentacaoarquivada' in consulta['sql'] and 'MAX(' not in consulta['sql']
+        ])
+
+        saida = StringIO()
+        call_command('reconstruir_saldos', '--verificar', stdout=saida)
+        self.assertIn('0 com saldo divergente', saida.getvalue())
+
+
+class SaldosDiariosTest(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user('estoquista', password='senha')
+        self.peca = Peca.objects.create(nome='SSD 480GB', categoria=CategoriaPeca.objects.create(nome='Armazenamento'))
+        self.hoje = timezone.localdate()
+        for dias, tipo, quantidade in [
+            (100, 'entrada', 5), (10, 'entrada', 10), (5, 'saida', 3), (5, 'entrada', 2), (1, 'saida', 1)
+        ]:
+            movimentacao = MovimentacaoEstoque.objects.create(
+                peca=self.peca, tipo=tipo, quantidade=quantidade,
+                valor_unitario=Decimal('100.00'), usuario=self.usuario
+            )
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(
+                data_movimentacao=inicio_do_dia(self.hoje - timedelta(days=dias)) + timedelta(hours=12)
+            )
+
+    def test_fechamento_diario(self):
+        inicio = self.hoje - timedelta(days=12)
+        serie = saldos_diarios([self.peca.pk], inicio, self.hoje)[self.peca.pk]
+        self.assertEqual(serie, [5, 5] + [15] * 5 + [14] * 4 + [13] * 2)
+
+    def test_serie_igual_ao_saldo_historico_com_arquivo(self):
+        inicio = self.hoje - timedelta(days=120)
+        esperado = [
+            saldos_em([self.peca.pk], inicio_do_dia(inicio + timedelta(days=n + 1)))[self.peca.pk]['quantidade']
+            for n in range(121)
+        ]
+        self.assertEqual(saldos_diarios([self.peca.pk], inicio, self.hoje)[self.peca.pk], esperado)
+
+        call_command('arquivar_movimentacoes', '--meses', '2', stdout=StringIO())
+        self.assertTrue(self.peca.movimentacoes_arquivadas.exists())
+        self.assertEqual(saldos_diarios([self.peca.pk], inicio, self.hoje)[self.peca.pk], esperado)
+
+    def test_api(self):
+        self.client.force_login(self.usuario)
+        url = reverse('api_saldos_diarios')
+        resposta = self.client.get(url, {
+            'pecas': str(self.peca.pk), 'inicio': (self.hoje - timedelta(days=2)).isoformat()
+        })
+        self.assertEqual(resposta.status_code, 200)
+        dados = resposta.json()
+        self.assertEqual(len(dados['dias']), 3)
+        self.assertEqual(dados['pecas'][0]['saldos'], [14, 13, 13])
+        self.assertEqual(self.client.get(url, {'pecas': 'x'}).status_code, 400)
+
+
+class LeituraCodigoTest(TestCase):
+    def setUp(self):
+        leituras_recentes.limpar()
+        self.usuario = User.objects.create_user('balcao', password='senha')
+        categoria = CategoriaPeca.objects.create(nome='Armazenamento')
+        self.ssd = Peca.objects.create(nome='SSD 240GB', part_number='SSD-240', categoria=categoria)
+        for nome in ('Memória 8GB', 'Memória 8GB (kit)'):
+            Peca.objects.create(nome=nome, part_number='MEM-8', categoria=categoria)
+
+    def test_leitura_exata_em_uma_consulta(self):
+        with CaptureQueriesContext(connection) as contexto:
+            self.assertEqual(ler_codigo(' ssd.240 '), self.ssd)
+            self.assertEqual(ler_codigo(self.ssd.codigo_interno.lower()), self.ssd)
+            self.assertEqual(ler_codigo(' ssd.240 '), self.ssd)   # do cache, pela chave primária
+        self.assertEqual(len(contexto.captured_queries), 3)
+        self.assertFalse([c for c in contexto.captured_queries if 'LIKE' in c['sql']])
+        self.assertEqual(ler_codigo(' ssd.240 ').quantidade_estoque, 0)
+        self.assertIsNone(ler_codigo('XYZ-999'))
+        with self.assertRaises(CodigoAmbiguo):
+            ler_codigo('mem8')
+
+    def test_cache_descarta_part_number_alterado(self):
+        ler_codigo('SSD-240')
+        self.ssd.part_number = 'SSD-240-V2'
+        self.ssd.save()
+        self.assertIsNone(ler_codigo('SSD-240'))
+        self.assertEqual(ler_codigo('ssd240v2'), self.ssd)
+
+    def test_api(self):
+        self.client.force_login(self.usuario)
+        url = reverse('api_ler_codigo')
+        resposta = self.client.get(url, {'codigo': 'SSD-240'})
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['id'], self.ssd.pk)
+        self.assertEqual(self.client.get(url, {'codigo': 'MEM-8'}).status_code, 409)
+        self.assertEqual(self.client.get(url, {'codigo': 'nada'}).status_code, 404)
+
+
+class ImportacaoPecasTest(TestCase):
+    def test_importa_csv_em_lotes_e_reporta_erros(self):
+        CategoriaPeca.objects.create(nome='Memória')
+        conteudo = (
+            'Nome;Categoria;Part Number;Preço Compra;Margem;Quantidade Mínima\n'
+            'SSD 240GB;Armazenamento;SSD-240;100,00;50;2\n'
+            'Memória DDR4 8GB;memoria;DDR4-8;150.00;;\n'
+            ';Memória;;;;\n'
+            'Cabo SATA;Cabos;;abc;;\n'
+        ).encode('utf-8')
+
+        resultado = importar_pecas(BytesIO(conteudo), 'catalogo.csv', lote=1)
+
+        self.assertEqual(resultado.importadas, 2)
+        self.assertEqual(resultado.erros, [(4, 'nome é obrigatório'), (5, 'preço de compra inválido: abc')])
+        # "Armazenamento" é criada; "Cabos" não, porque a única linha dela é inválida
+        self.assertEqual(resultado.categorias_criadas, 1)
+        self.assertEqual(CategoriaPeca.objects.count(), 2)
+
+        ssd = Peca.objects.get(part_number='SSD-240')
+        self.assertEqual(ssd.preco_venda, Decimal('150.00'))
+        self.assertTrue(ssd.codigo_interno.startswith('PC-'))
+        self.assertEqual(ssd.nome_busca, 'ssd 240gb')
+        self.assertEqual(ssd.part_number_normalizado, 'SSD240')
+        self.assertEqual(Peca.objects.get(part_number='DDR4-8').categoria.nome, 'Memória')
+        self.assertEqual(SaldoEstoque.objects.filter(quantidade=0).count(), 2)
+
+    def test_valida_limites_dos_campos_por_linha(self):
+        conteudo = (
+            'Nome;Categoria;Fornecedor;Preço Compra;Margem;Quantidade Mínima\n'
+            'Placa-mãe;Placas;;123.456.789,00;;\n'
+            'Fonte;Fontes;;10,00;1000;\n'
+            'Gabinete;Gabinetes;;99.999.999,00;50;\n'
+            'Cooler;Coolers;;;;1e30\n'
+            'Pasta térmica;Coolers;;;;Infinity\n'
+            'Cabo SATA;Cabos;Fornecedor Inexistente;;;\n'
+            'Cooler Box;Coolers;;20,00;;3\n'
+        ).encode('utf-8')
+
+        resultado = importar_pecas(BytesIO(conteudo), 'catalogo.csv', lote=1)
+
+        self.assertEqual(resultado.importadas, 1)
+        self.assertEqual([(numero, mensagem.split(':')[0]) for numero, mensagem in resultado.erros], [
+            (2, 'preço de compra inválido'), (3, 'margem inválido'), (4, 'preço de venda inválido'),
+            (5, 'quantidade mínima inválido'), (6, 'quantidade mínima inválido'), (7, 'Fornecedor não encontrado'),
+        ])
+        # Só a categoria da linha válida é criada, junto com a peça
+        self.assertEqual(resultado.categorias_criadas, 1)
+        self.assertEqual(list(CategoriaPeca.objects.values_list('nome', flat=True)), ['Coolers'])
+        self.assertEqual(Peca.objects.get().categoria.nome, 'Coolers')
+
+    def test_csv_do_excel_em_cp1252(self):
+        conteudo = 'Nome;Categoria\nMemória DDR3;Memórias\n'.encode('cp1252')
+        resultado = importar_pecas(BytesIO(conteudo), 'catalogo.csv')
+        self.assertEqual(resultado.importadas, 1)
+        self.assertEqual(Peca.objects.get().nome, 'Memória DDR3')
+
+        # 0x81 não existe nem em UTF-8 nem em cp1252
+        with self.assertRaises(ArquivoInvalido):
+            importar_pecas(BytesIO(b'Nome;Categoria\nCabo \x81;Cabos\n'), 'catalogo.csv')
+
+
+@skipIf(reposicao.np is None, 'numpy não instalado')
+class ReposicaoTest(TestCase):
+    def test_ponto_de_pedido_pelo_consumo(self):
+        usuario = User.objects.create_user('estoquista', password='senha')
+        categoria = CategoriaPeca.objects.create(nome='Telas')
+        peca = Peca.objects.create(nome='Tela', categoria=categoria)
+        parada = Peca.objects.create(nome='Tela antiga', categoria=categoria)
+        agora = timezone.now()
+        Peca.objects.filter(pk__in=[peca.pk, parada.pk]).update(data_cadastro=agora - timedelta(days=29))
+
+        registrar_movimentos([
+            (peca.pk, 'entrada', 40, Decimal('50.00')),
+            (parada.pk, 'entrada', 1, Decimal('50.00')),
+        ], usuario)
+        for dias in range(10):
+            movimentacao = MovimentacaoEstoque.objects.create(
+                peca=peca, tipo='saida', quantidade=3, valor_unitario=Decimal('80.00'), usuario=usuario
+            )
+            MovimentacaoEstoque.objects.filter(pk=movimentacao.pk).update(data_movimentacao=agora - timedelta(days=dias * 2))
+
+        sugestoes = reposicao.calcular_reposicao(prazo_entrega_dias=7, cobertura_dias=30)
+
+        # 30 unidades em 30 dias: 1/dia; desvio sqrt(10*9/30 - 1) ≈ 1,41
+        self.assertEqual([s['peca_id'] for s in sugestoes], [peca.pk])
+        sugestao = sugestoes[0]
+        self.assertEqual(sugestao['consumo_diario'], 1.0)
+        self.assertEqual(sugestao['estoque_seguranca'], 7)
+        self.assertEqual(sugestao['ponto_pedido'], 14)
+        self.assertEqual(sugestao['quantidade_sugerida'], 14 + 30 - 10)
+
+
+class ReservaEstoqueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('atendente', password='senha')
+        categoria = CategoriaPeca.objects.create(nome='Conectores')
+        cls.peca = Peca.objects.create(nome='Conector de carga', categoria=categoria, preco_venda=Decimal('30.00'))
+        cls.outra = Peca.objects.create(nome='Conector P2', categoria=categoria)
+        registrar_movimentos([(cls.peca.pk, 'entrada', 5, Decimal('10.00')), (cls.outra.pk, 'entrada', 1, Decimal('5.00'))], cls.usuario)
+
+    def _saldo(self):
+        return SaldoEstoque.objects.get(peca=self.peca)
+
+    def test_reserva_tudo_ou_nada(self):
+        reservas.reservar([(self.peca.pk, 3)], self.usuario)
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            reservas.reservar([(self.peca.pk, 1), (self.outra.pk, 2)], self.usuario)
+        self.assertEqual(erro.exception.saldo, 1)
+        # A reserva da primeira peça foi desfeita junto
+        self.assertEqual(self._saldo().reservado, 3)
+        self.assertEqual(ReservaEstoque.objects.count(), 1)
+
+    def test_saida_comum_respeita_reservado(self):
+        reserva, = reservas.reservar([(self.peca.pk, 4)], self.usuario)
+        with self.assertRaises(EstoqueInsuficiente):
+            registrar_movimentos([(self.peca.pk, 'saida', 2, Decimal('30.00'))], self.usuario)
+
+        reservas.baixar([reserva], self.usuario)
+        saldo = self._saldo()
+        self.assertEqual((saldo.quantidade, saldo.reservado), (1, 0))
+        self.assertEqual(self.peca.movimentacoes.filter(tipo='saida').get().valor_unitario, Decimal('30.00'))
+
+    def test_peca_inexistente_no_lote(self):
+        with self.assertRaises(EstoqueInsuficiente) as erro:
+            registrar_movimentos([(self.peca.pk, 'saida', 1, Decimal('30.00')),
+                                  (self.outra.pk + 1000, 'saida', 2, Decimal('30.00'))], self.usuario)
+        self.assertIsInstance(erro.exception, PecaNaoEncontrada)
+        self.assertEqual((erro.exception.peca_id, erro.exception.solicitado), (self.outra.pk + 1000, 2))
+        self.assertFalse(MovimentacaoEstoque.objects.filter(tipo='saida').exists())
+        self.assertEqual(self._saldo().quantidade, 5)
+
+    def test_movimentacao_avulsa_respeita_reservado(self):
+        reservas.reservar([(self.peca.pk, 4)], self.usuario)
+        with self.assertRaises(EstoqueInsuficiente):
+            MovimentacaoEstoque.objects.create(
+                peca=self.peca, tipo='saida', quantidade=2, valor_unitario=Decimal('30.00'), usuario=self.usuario
+            )
+        self.assertFalse(self.peca.movimentacoes.filter(tipo='saida').exists())
+        self.assertEqual((self._saldo().quantidade, self._saldo().reservado), (5, 4))
+
+        MovimentacaoEstoque.objects.create(
+            peca=self.peca, tipo='saida', quantidade=1, valor_unitario=Decimal('30.00'), usuario=self.usuario
+        )
+        self.assertEqual((self._saldo().quantidade, self._saldo().reservado), (4, 4))
+
+    def test_baixa_confere_o_disponivel_no_update(self):
+        # Reserva que chega entre a conferência e o UPDATE do saldo (a trava das peças não a segura)
+        conferir = servicos.disponiveis_pecas
+
+        def conferir_e_reservar(peca_ids):
+            disponiveis = conferir(peca_ids)
+            if not ReservaEstoque.objects.exists():
+                reservas.reservar([(self.peca.pk, 4)], self.usuario)
+            return disponiveis
+
+        with mock.patch('estoque.servicos.disponiveis_pecas', conferir_e_reservar):
+            with self.assertRaises(EstoqueInsuficiente) as erro:
+                registrar_movimentos([(self.outra.pk, 'saida', 1, Decimal('5.00')),
+                                      (self.peca.pk, 'saida', 2, Decimal('30.00'))], self.usuario)
+        self.assertEqual((erro.exception.peca, erro.exception.saldo), (self.peca, 1))
+        self.assertFalse(MovimentacaoEstoque.objects.filter(tipo='saida').exists())
+        self.assertEqual(SaldoEstoque.objects.get(peca=self.outra).quantidade, 1)
+
+    def test_liberar_devolve_ao_disponivel(self):
+        reservas.liberar(reservas.reservar([(self.peca.pk, 5)], self.usuario))
+        self.assertEqual(self._saldo().reservado, 0)
+        self.assertEqual(len(reservas.reservar([(self.peca.pk, 5)], self.usuario)), 1)
+
+    def test_api_reservar(self):
+        self.client.force_login(self.usuario)
+        resposta = self.client.post(
+            reverse('api_reservar'), {'itens': [{'peca': self.peca.pk, 'quantidade': 6}]}, content_type='application/json'
+        )
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.json()['disponivel'], 5)
+
+
+class ReservaConcorrenteTest(TransactionTestCase):
+    """Várias threads disputando o mesmo saldo nunca reservam mais do que existe."""
+
+    def test_reservas_simultaneas(self):
+        usuario = User.objects.create_user('atendente', password='senha')
+        categoria = CategoriaPeca.objects.create(nome='Baterias')
+        peca = Peca.objects.create(nome='Bateria', categoria=categoria)
+        registrar_movimentos([(peca.pk, 'entrada', 10, Decimal('50.00'))], usuario)
+
+        largada = threading.Barrier(8)
+        resultados = []
+
+        def atendente():
+            try:
+                largada.wait()
+                for _ in range(5):
+                    try:
+                        reservas.reservar([(peca.pk, 1)], usuario)
+                        resultados.append('reservou')
+                    except (EstoqueInsuficiente, OperationalError):
+                        # Sem saldo, ou o banco recusou na disputa pela linha: falha na hora
+                        resultados.append('recusado')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=atendente) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        saldo = SaldoEstoque.objects.get(peca=peca)
+        reservado = ReservaEstoque.objects.filter(peca=peca).aggregate(total=Sum('quantidade'))['total'] or 0
+        self.assertEqual(len(resultados), 40)
+        self.assertEqual(resultados.count('reservou'), reservado)
+        self.assertEqual(saldo.reservado, reservado)
+        self.assertLessEqual(saldo.reservado, saldo.quantidade)
+        self.assertGreater(reservado, 0)
@@ -5,13 +5,23 @@ urlpatterns = [
     # Peças
     path('', views.peca_lista, name='peca_lista'),
     path('peca/nova/', views.peca_criar, name='peca_criar'),
+    path('peca/importar/', views.peca_importar, name='peca_importar'),
     path('peca/<int:pk>/', views.peca_detalhe, name='peca_detalhe'),
     path('peca/<int:pk>/editar/', views.peca_editar, name='peca_editar'),
     path('peca/<int:pk>/deletar/', views.peca_deletar, name='peca_deletar'),
+    path('valorizacao/', views.estoque_valorizacao, name='estoque_valorizacao'),
+    path('reposicao/', views.estoque_reposicao, name='estoque_reposicao'),
+    path('api/saldos-diarios/', views.api_saldos_diarios, name='api_saldos_diarios'),
+    path('api/leitura/', views.api_ler_codigo, name='api_ler_codigo'),
     
     # Movimentações
     path('movimentacao/nova/', views.movimentacao_criar, name='movimentacao_criar'),
     
+    # Reservas
+    path('api/reservas/', views.api_reservar, name='api_reservar'),
+    path('api/reservas/<int:pk>/liberar/', views.api_liberar_reserva, name='api_liberar_reserva'),
+    path('api/reservas/<int:pk>/baixar/', views.api_baixar_reserva, name='api_baixar_reserva'),
+    
     # Categorias
     path('categorias/', views.categoria_lista, name='categoria_lista'),
     path('categoria/nova/', views.categoria_criar, name='categoria_criar'),
@@ -1,12 +1,23 @@
+import json
+from datetime import date, timedelta
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, F, Sum, Case, When, IntegerField
-from django.db.models.functions import Coalesce
+from django.db.models import Q, Sum
+from django.http import JsonResponse
 from django.utils import timezone
-from .models import CategoriaPeca, Peca, MovimentacaoEstoque
-from .forms import CategoriaPecaForm, PecaForm, MovimentacaoEstoqueForm
+from django.views.decorators.http import require_POST
+from .models import CategoriaPeca, Peca, MovimentacaoEstoque, SaldoEstoque, ReservaEstoque
+from .forms import CategoriaPecaForm, PecaForm, MovimentacaoEstoqueForm, ImportarPecasForm
+from .importacao import importar_pecas, ArquivoInvalido
+from .reposicao import calcular_reposicao, ReposicaoIndisponivel, PRAZO_ENTREGA_DIAS, COBERTURA_DIAS
+from .servicos import EstoqueInsuficiente
+from .snapshots import saldos_diarios, MAX_DIAS_SERIE, MAX_PECAS_SERIE
+from .leitura import ler_codigo, CodigoAmbiguo
+from . import reservas
 from financeiro.models import Transacao, CategoriaFinanceira
+from ordem_servico.models import OrdemServico
 
 
 @login_required
@@ -15,19 +26,8 @@ def peca_lista(request):
     categoria_id = request.GET.get('categoria', '')
     estoque_baixo = request.GET.get('estoque_baixo', '')
     
-    # Usamos annotate para calcular o saldo no banco de dados, permitindo a filtragem
-    pecas = Peca.objects.annotate(
-        saldo_calculado=Coalesce(
-            Sum(
-                Case(
-                    When(movimentacoes__tipo='entrada', then=F('movimentacoes__quantidade')),
-                    When(movimentacoes__tipo='saida', then=-F('movimentacoes__quantidade')),
-                    When(movimentacoes__tipo='ajuste', then=F('movimentacoes__quantidade')), # Ajuste costuma ser o valor real
-                    output_field=IntegerField(),
-                )
-            ), 0
-        )
-    ).select_related('categoria', 'fornecedor_principal')
+    # O saldo vem da tabela materializada SaldoEstoque (um JOIN, sem somar o livro)
+    pecas = Peca.objects.select_related('categoria', 'fornecedor_principal', 'saldo')
     
     if busca:
         pecas = pecas.filter(
@@ -40,8 +40,7 @@ def peca_lista(request):
         pecas = pecas.filter(categoria_id=categoria_id)
     
     if estoque_baixo:
-        # Agora filtramos pelo campo anotado 'saldo_calculado'
-        pecas = pecas.filter(saldo_calculado__lte=F('quantidade_minima'))
+        pecas = pecas.filter(saldo__estoque_baixo=True)
     
     pecas = pecas.order_by('nome')
     categorias = CategoriaPeca.objects.all().order_by('nome')
@@ -56,9 +55,83 @@ def peca_lista(request):
     return render(request, 'estoque/peca_lista.html', context)
 
 
+@login_required
+def estoque_valorizacao(request):
+    """Valor do estoque pelo custo médio, lido direto da tabela SaldoEstoque"""
+    saldos = SaldoEstoque.objects.filter(quantidade__gt=0)
+    total = saldos.aggregate(valor=Sum('valor_estoque'), unidades=Sum('quantidade'))
+    
+    context = {
+        'saldos': saldos.select_related('peca', 'peca__categoria').order_by('-valor_estoque'),
+        'valor_total': total['valor'] or 0,
+        'unidades_total': total['unidades'] or 0,
+    }
+    return render(request, 'estoque/valorizacao.html', context)
+
+
+@login_required
+def estoque_reposicao(request):
+    """Sugestão de compra pelo consumo real das peças (ponto de pedido dinâmico)"""
+    try:
+        prazo = max(int(request.GET.get('prazo', PRAZO_ENTREGA_DIAS)), 1)
+        cobertura = max(int(request.GET.get('cobertura', COBERTURA_DIAS)), 1)
+    except ValueError:
+        prazo, cobertura = PRAZO_ENTREGA_DIAS, COBERTURA_DIAS
+    
+    sugestoes = []
+    try:
+        sugestoes = [
+            s for s in calcular_reposicao(prazo_entrega_dias=prazo, cobertura_dias=cobertura)
+            if s['quantidade_sugerida'] > 0
+        ]
+    except ReposicaoIndisponivel as e:
+        messages.error(request, str(e))
+    
+    pecas = Peca.objects.select_related('categoria', 'fornecedor_principal').in_bulk([s['peca_id'] for s in sugestoes])
+    for sugestao in sugestoes:
+        sugestao['peca'] = pecas[sugestao['peca_id']]
+    
+    context = {
+        'sugestoes': sugestoes,
+        'prazo': prazo,
+        'cobertura': cobertura,
+    }
+    return render(request, 'estoque/reposicao.html', context)
+
+
+@login_required
+def peca_importar(request):
+    """Importação em lote de peças a partir de um catálogo CSV/XLSX"""
+    resultado = None
+    if request.method == 'POST':
+        form = ImportarPecasForm(request.POST, request.FILES)
+        if form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            simular = form.cleaned_data['simular']
+            try:
+                resultado = importar_pecas(arquivo.file, arquivo.name, simular=simular)
+            except ArquivoInvalido as e:
+                messages.error(request, str(e))
+            else:
+                acao = 'validadas' if simular else 'importadas'
+                messages.success(request, f'{resultado.importadas} peça(s) {acao}.')
+                if resultado.erros:
+                    messages.warning(request, f'{resultado.linhas_com_erro} linha(s) com erro não foram importadas.')
+    else:
+        form = ImportarPecasForm()
+    
+    context = {
+        'form': form,
+        'resultado': resultado,
+        # Evita uma página gigante quando o arquivo inteiro está errado
+        'erros': resultado.erros[:200] if resultado else [],
+    }
+    return render(request, 'estoque/peca_importar.html', context)
+
+
 @login_required
 def peca_detalhe(request, pk):
-    peca = get_object_or_404(Peca, pk=pk)
+    peca = get_object_or_404(Peca.objects.select_related('saldo'), pk=pk)
     movimentacoes = peca.movimentacoes.all().order_by('-data_movimentacao')[:20]
     
     context = {
@@ -125,7 +198,12 @@ def movimentacao_criar(request):
         if form.is_valid():
             movimentacao = form.save(commit=False)
             movimentacao.usuario = request.user
-            movimentacao.save() # O save() do modelo já atualiza o preco_venda se for entrada
+            try:
+                movimentacao.save() # O save() do modelo já atualiza o preco_venda se for entrada
+            except EstoqueInsuficiente as e:
+                messages.error(request, str(e))
+                context = {'form': form, 'titulo': 'Nova Movimentação'}
+                return render(request, 'estoque/movimentacao_form.html', context)
             
             peca = movimentacao.peca
             
@@ -206,4 +284,124 @@ def categoria_editar(request, pk):
         form = CategoriaPecaForm(instance=categoria)
     
     context = {'form': form, 'titulo': 'Editar Categoria', 'categoria': categoria}
-    return render(request, 'estoque/categoria_form.html', context)
\ No newline at end of file
+    return render(request, 'estoque/categoria_form.html', context)
+
+
+def _erro_estoque(e):
+    return JsonResponse(
+        {'erro': str(e), 'peca': e.peca.pk if e.peca else e.peca_id, 'disponivel': e.saldo,
+         'solicitado': e.solicitado},
+        status=409
+    )
+
+
+@login_required
+@require_POST
+def api_reservar(request):
+    """
+    Reserva peças para uma OS (tudo ou nada):
+    {"ordem_servico": 12, "itens": [{"peca": 3, "quantidade": 2}, ...]}
+    Responde 409 se alguma peça não tiver disponível.
+    """
+    try:
+        dados = json.loads(request.body)
+        itens = [(int(item['peca']), int(item['quantidade'])) for item in dados.get('itens', [])]
+        ordem_servico = None
+        if dados.get('ordem_servico'):
+            ordem_servico = OrdemServico.objects.get(pk=dados['ordem_servico'])
+        criadas = reservas.reservar(itens, request.user, ordem_servico=ordem_servico)
+    except EstoqueInsuficiente as e:
+        return _erro_estoque(e)
+    except (ValueError, KeyError, TypeError, AttributeError, OrdemServico.DoesNotExist, Peca.DoesNotExist) as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    
+    return JsonResponse({
+        'reservas': [{'id': r.pk, 'peca': r.peca_id, 'quantidade': r.quantidade} for r in criadas]
+    }, status=201)
+
+
+@login_required
+@require_POST
+def api_liberar_reserva(request, pk):
+    reserva = get_object_or_404(ReservaEstoque, pk=pk)
+    reservas.liberar([reserva])
+    return JsonResponse({'liberada': pk})
+
+
+@login_required
+@require_POST
+def api_baixar_reserva(request, pk):
+    """Converte a reserva em saída do estoque"""
+    reserva = get_object_or_404(ReservaEstoque.objects.select_related('peca', 'ordem_servico'), pk=pk)
+    try:
+        reservas.baixar([reserva], request.user)
+    except EstoqueInsuficiente as e:
+        return _erro_estoque(e)
+    return JsonResponse({'baixada': pk})
+
+
+@login_required
+def api_saldos_diarios(request):
+    """
+    Saldo de fechamento diário de uma ou mais peças:
+    ?pecas=3,7&inicio=2025-01-01&fim=2025-01-31 (padrão: os últimos 30 dias)
+    """
+    try:
+        peca_ids = {int(pk) for pk in request.GET.get('pecas', '').split(',') if pk.strip()}
+        fim = date.fromisoformat(request.GET['fim']) if request.GET.get('fim') else timezone.localdate()
+        inicio = date.fromisoformat(request.GET['inicio']) if request.GET.get('inicio') else fim - timedelta(days=29)
+    except ValueError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    
+    if not peca_ids:
+        return JsonResponse({'erro': 'Informe as peças (pecas=1,2,3).'}, status=400)
+    if len(peca_ids) > MAX_PECAS_SERIE:
+        return JsonResponse({'erro': f'Informe no máximo {MAX_PECAS_SERIE} peças.'}, status=400)
+    if inicio > fim:
+        return JsonResponse({'erro': 'A data inicial é posterior à final.'}, status=400)
+    if (fim - inicio).days >= MAX_DIAS_SERIE:
+        return JsonResponse({'erro': f'O período pode ter no máximo {MAX_DIAS_SERIE} dias.'}, status=400)
+    
+    pecas = list(Peca.objects.filter(pk__in=peca_ids).only('pk', 'codigo_interno', 'nome').order_by('pk'))
+    series = saldos_diarios([peca.pk for peca in pecas], inicio, fim)
+    return JsonResponse({
+        'inicio': inicio.isoformat(),
+        'fim': fim.isoformat(),
+        'dias': [(inicio + timedelta(days=n)).isoformat() for n in range((fim - inicio).days + 1)],
+        'pecas': [
+            {'id': peca.pk, 'codigo_interno': peca.codigo_interno, 'nome': peca.nome, 'saldos': series[peca.pk]}
+            for peca in pecas
+        ],
+    })
+
+
+def _dados_leitura(peca):
+    return {
+        'id': peca.pk,
+        'codigo_interno': peca.codigo_interno,
+        'part_number': peca.part_number,
+        'nome': peca.nome,
+        'preco_venda': str(peca.preco_venda),
+        'localizacao': peca.localizacao,
+        'ativo': peca.ativo,
+        'quantidade': peca.quantidade_estoque,
+        'disponivel': peca.quantidade_disponivel,
+    }
+
+
+@login_required
+def api_ler_codigo(request):
+    """
+    Leitura de etiqueta no balcão: ?codigo=PC-1A2B3C4D ou o part number.
+    Busca exata e indexada; 404 se nenhuma peça tiver o código.
+    """
+    codigo = request.GET.get('codigo', '')
+    if not codigo.strip():
+        return JsonResponse({'erro': 'Informe o código lido.'}, status=400)
+    try:
+        peca = ler_codigo(codigo)
+    except CodigoAmbiguo as e:
+        return JsonResponse({'erro': str(e), 'pecas': [_dados_leitura(p) for p in e.pecas]}, status=409)
+    if peca is None:
+        return JsonResponse({'erro': f'Nenhuma peça com o código {codigo.strip()}.'}, status=404)
+    return JsonResponse(_dados_leitura(peca))
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import CategoriaFinanceira, Transacao, ContaBancaria
+from .models import CategoriaFinanceira, Transacao, ContaBancaria, NotaFiscal, ItemNotaFiscal
 
 
 @admin.register(CategoriaFinanceira)
@@ -24,6 +24,9 @@ class TransacaoAdmin(admin.ModelAdmin):
     list_filter = ['tipo', 'status', 'categoria', 'forma_pagamento', 'data_vencimento']
     search_fields = ['descricao']
     date_hierarchy = 'data_vencimento'
+    list_select_related = ['categoria']
+    autocomplete_fields = ['categoria', 'ordem_servico', 'fornecedor']
+    show_full_result_count = False
     
     fieldsets = (
         ('Informações Básicas', {
@@ -73,4 +76,55 @@ class ContaBancariaAdmin(admin.ModelAdmin):
             cor,
             saldo
         )
-    saldo_atual_display.short_description = 'Saldo Atual'
\ No newline at end of file
+    saldo_atual_display.short_description = 'Saldo Atual'
+
+
+class ItemNotaFiscalInline(admin.TabularInline):
+    model = ItemNotaFiscal
+    extra = 0
+    fields = ['peca', 'quantidade', 'valor_unitario', 'valor_total']
+    autocomplete_fields = ['peca']
+
+
+@admin.register(NotaFiscal)
+class NotaFiscalAdmin(admin.ModelAdmin):
+    list_display = [
+        'numero_nota', 'serie', 'tipo', 'fornecedor', 'data_emissao',
+        'valor_total', 'integrada_estoque', 'integrada_financeiro'
+    ]
+    list_filter = ['tipo', 'integrada_estoque', 'integrada_financeiro', 'data_emissao']
+    search_fields = ['=numero_nota', '=chave_acesso', '^fornecedor__razao_social']
+    date_hierarchy = 'data_emissao'
+    list_select_related = ['fornecedor']
+    autocomplete_fields = ['fornecedor', 'cliente']
+    show_full_result_count = False
+    inlines = [ItemNotaFiscalInline]
+    
+    fieldsets = (
+        ('Identificação', {
+            'fields': ('numero_nota', 'serie', 'chave_acesso', 'tipo')
+        }),
+        ('Emitente / Destinatário', {
+            'fields': ('fornecedor', 'cliente')
+        }),
+        ('Datas', {
+            'fields': ('data_emissao', 'data_entrada')
+        }),
+        ('Valores', {
+            'fields': ('valor_total', 'valor_frete', 'valor_desconto')
+        }),
+        ('Integração', {
+            'fields': ('integrada_estoque', 'integrada_financeiro')
+        }),
+        ('Observações', {
+            'fields': ('observacoes', 'usuario'),
+            'classes': ('collapse',)
+        }),
+    )
+    
+    readonly_fields = ['usuario', 'integrada_estoque', 'integrada_financeiro']
+    
+    def save_model(self, request, obj, form, change):
+        if not obj.pk:
+            obj.usuario = request.user
+        super().save_model(request, obj, form, change)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from financeiro.resumo import reconstruir_resumo
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula o resumo financeiro mensal (base do dashboard) a partir das transações, '
+        'ex: após alterações feitas direto no banco, sem passar pelos signals'
+    )
+
+    def handle(self, *args, **options):
+        linhas = reconstruir_resumo()
+        self.stdout.write(self.style.SUCCESS(f'Resumo financeiro recalculado: {linhas} linhas.'))
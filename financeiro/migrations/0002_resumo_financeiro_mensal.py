@@ -0,0 +1,59 @@
+# Generated by Django 5.1 on 2026-10-18 13:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+
+def preencher_resumo(apps, schema_editor):
+    Transacao = apps.get_model('financeiro', 'Transacao')
+    ResumoFinanceiroMensal = apps.get_model('financeiro', 'ResumoFinanceiroMensal')
+    linhas = Transacao.objects.annotate(
+        mes=TruncMonth(Coalesce('data_pagamento', 'data_vencimento'))
+    ).values('mes', 'tipo', 'status', 'categoria_id').annotate(
+        quantidade=Count('pk'), total=Sum('valor')
+    ).order_by()
+    ResumoFinanceiroMensal.objects.bulk_create(
+        [ResumoFinanceiroMensal(**linha) for linha in linhas], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeiro', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoFinanceiroMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField(verbose_name='Mês')),
+                ('tipo', models.CharField(choices=[('receita', 'Receita'), ('despesa', 'Despesa')], max_length=10)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('pago', 'Pago'), ('cancelado', 'Cancelado')], max_length=20)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Resumo Financeiro Mensal',
+                'verbose_name_plural': 'Resumos Financeiros Mensais',
+                'ordering': ['-mes'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transacao',
+            index=models.Index(fields=['status', 'data_vencimento'], name='transacao_status_venc_idx'),
+        ),
+        migrations.AddField(
+            model_name='resumofinanceiromensal',
+            name='categoria',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos', to='financeiro.categoriafinanceira'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumofinanceiromensal',
+            constraint=models.UniqueConstraint(fields=('mes', 'tipo', 'status', 'categoria'), name='resumo_financeiro_unico'),
+        ),
+        migrations.RunPython(preencher_resumo, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 
@@ -89,10 +89,27 @@ class Transacao(models.Model):
         verbose_name = "Transação"
         verbose_name_plural = "Transações"
         ordering = ['-data_vencimento']
+        indexes = [
+            # Contas pendentes e vencidas do dashboard
+            models.Index(fields=['status', 'data_vencimento'], name='transacao_status_venc_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.descricao} - R$ {self.valor}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Guarda a linha do resumo mensal em que a transação está somada,
+        # para que uma edição mova só a diferença
+        instancia._resumo_original = chave_resumo(instancia)
+        return instancia
+    
+    def save(self, *args, **kwargs):
+        # O resumo mensal é atualizado no post_save, dentro desta mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
     @property
     def esta_vencida(self):
         """Verifica se a transação está vencida"""
@@ -102,6 +119,40 @@ class Transacao(models.Model):
         return False
 
 
+def chave_resumo(transacao):
+    """
+    ((mes, tipo, status, categoria_id), valor) da transação no ResumoFinanceiroMensal.
+    O mês é o do pagamento ou, enquanto não há pagamento, o do vencimento.
+    """
+    data = transacao.data_pagamento or transacao.data_vencimento
+    return (data.replace(day=1), transacao.tipo, transacao.status, transacao.categoria_id), transacao.valor
+
+
+class ResumoFinanceiroMensal(models.Model):
+    """
+    Total e quantidade de transações por (mês, tipo, status, categoria).
+    Mantido pelos signals de Transacao (financeiro.resumo); é o que o dashboard lê
+    no lugar de somar a tabela de transações a cada acesso.
+    """
+    mes = models.DateField(verbose_name="Mês")
+    tipo = models.CharField(max_length=10, choices=Transacao.TIPO_CHOICES)
+    status = models.CharField(max_length=20, choices=Transacao.STATUS_CHOICES)
+    categoria = models.ForeignKey(CategoriaFinanceira, on_delete=models.CASCADE, related_name='resumos')
+    quantidade = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        verbose_name = "Resumo Financeiro Mensal"
+        verbose_name_plural = "Resumos Financeiros Mensais"
+        ordering = ['-mes']
+        constraints = [
+            models.UniqueConstraint(fields=['mes', 'tipo', 'status', 'categoria'], name='resumo_financeiro_unico'),
+        ]
+    
+    def __str__(self):
+        return f"{self.mes:%m/%Y} {self.tipo} {self.status} - {self.categoria_id}: R$ {self.total}"
+
+
 class ContaBancaria(models.Model):
     nome = models.CharField(max_length=100, help_text='Ex: Conta Corrente Banco X')
     banco = models.CharField(max_length=100)
@@ -0,0 +1,60 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import Transacao, ResumoFinanceiroMensal
+
+
+def somar_resumo(deltas, chave, valor, sinal=1):
+    """Acumula uma transação (ou o seu estorno, com sinal=-1) no dict {chave: (quantidade, total)}."""
+    quantidade, total = deltas.get(chave, (0, Decimal('0')))
+    deltas[chave] = (quantidade + sinal, total + sinal * Decimal(valor))
+    return deltas
+
+
+def _somar_linha(chave, quantidade, total):
+    mes, tipo, status, categoria_id = chave
+    return ResumoFinanceiroMensal.objects.filter(
+        mes=mes, tipo=tipo, status=status, categoria_id=categoria_id
+    ).update(quantidade=F('quantidade') + quantidade, total=F('total') + total)
+
+
+def aplicar_resumo(deltas):
+    """
+    Aplica os deltas {(mes, tipo, status, categoria_id): (quantidade, total)} ao
+    ResumoFinanceiroMensal com UPDATE ... = coluna + delta, calculado pelo banco,
+    então gravações concorrentes não perdem incrementos. A linha que ainda não
+    existir é criada (ignorando a criação concorrente) e recebe o delta em seguida.
+    """
+    with transaction.atomic():
+        for chave, (quantidade, total) in deltas.items():
+            if not quantidade and not total:
+                continue
+            if not _somar_linha(chave, quantidade, total):
+                mes, tipo, status, categoria_id = chave
+                ResumoFinanceiroMensal.objects.bulk_create(
+                    [ResumoFinanceiroMensal(mes=mes, tipo=tipo, status=status, categoria_id=categoria_id)],
+                    ignore_conflicts=True
+                )
+                _somar_linha(chave, quantidade, total)
+
+
+def resumo_do_livro(transacoes):
+    """Linhas do resumo mensal recalculadas a partir das transações, em um único GROUP BY."""
+    return transacoes.annotate(
+        mes=TruncMonth(Coalesce('data_pagamento', 'data_vencimento'))
+    ).values('mes', 'tipo', 'status', 'categoria_id').annotate(
+        quantidade=Count('pk'), total=Sum('valor')
+    ).order_by()
+
+
+def reconstruir_resumo():
+    """Refaz o ResumoFinanceiroMensal inteiro a partir da tabela de transações."""
+    with transaction.atomic():
+        ResumoFinanceiroMensal.objects.all().delete()
+        return len(ResumoFinanceiroMensal.objects.bulk_create(
+            [ResumoFinanceiroMensal(**linha) for linha in resumo_do_livro(Transacao.objects.all())],
+            batch_size=1000
+        ))
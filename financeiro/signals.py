@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Transacao, chave_resumo
+from .resumo import aplicar_resumo, somar_resumo
+
+
+@receiver(post_save, sender=Transacao)
+def atualizar_resumo_transacao(sender, instance, **kwargs):
+    """Soma a transação no resumo mensal; numa edição, estorna antes a linha original."""
+    deltas = {}
+    original = getattr(instance, '_resumo_original', None)
+    if original:
+        somar_resumo(deltas, *original, sinal=-1)
+    somar_resumo(deltas, *chave_resumo(instance))
+    aplicar_resumo(deltas)
+    instance._resumo_original = chave_resumo(instance)
+
+
+@receiver(post_delete, sender=Transacao)
+def estornar_resumo_transacao(sender, instance, **kwargs):
+    original = getattr(instance, '_resumo_original', None) or chave_resumo(instance)
+    aplicar_resumo(somar_resumo({}, *original, sinal=-1))
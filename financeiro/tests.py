@@ -1,3 +1,93 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import CategoriaFinanceira, Transacao, ResumoFinanceiroMensal
+from .resumo import resumo_do_livro, reconstruir_resumo
+
+
+class ResumoFinanceiroTest(TestCase):
+    """O resumo mensal acompanha as transações e o dashboard lê só dele (mais os pendentes)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('financeiro', password='senha')
+        cls.servicos = CategoriaFinanceira.objects.create(nome='Serviços', tipo='receita')
+        cls.pecas = CategoriaFinanceira.objects.create(nome='Peças', tipo='despesa')
+        cls.aluguel = CategoriaFinanceira.objects.create(nome='Aluguel', tipo='despesa')
+
+    def _transacao(self, tipo, categoria, valor, status='pago', vencimento=None, pagamento=None):
+        hoje = date.today()
+        return Transacao.objects.create(
+            tipo=tipo, categoria=categoria, descricao=f'{categoria.nome} {valor}', valor=Decimal(valor),
+            data_vencimento=vencimento or hoje,
+            data_pagamento=pagamento or (hoje if status == 'pago' else None),
+            status=status, usuario=self.usuario
+        )
+
+    def _resumo(self):
+        return {
+            (r.mes, r.tipo, r.status, r.categoria_id): (r.quantidade, r.total)
+            for r in ResumoFinanceiroMensal.objects.exclude(quantidade=0)
+        }
+
+    def _livro(self):
+        return {
+            (linha['mes'], linha['tipo'], linha['status'], linha['categoria_id']): (linha['quantidade'], linha['total'])
+            for linha in resumo_do_livro(Transacao.objects.all())
+        }
+
+    def test_resumo_acompanha_inclusao_edicao_e_exclusao(self):
+        hoje = date.today()
+        self._transacao('receita', self.servicos, '100.00')
+        self._transacao('despesa', self.pecas, '40.00')
+        pendente = self._transacao('receita', self.servicos, '50.00', status='pendente',
+                                   vencimento=hoje - timedelta(days=40))
+        aluguel = self._transacao('despesa', self.aluguel, '10.00')
+        self.assertEqual(self._resumo(), self._livro())
+
+        # Pagamento: sai de (mês do vencimento, pendente) e entra em (mês do pagamento, pago)
+        pendente = Transacao.objects.get(pk=pendente.pk)
+        pendente.status = 'pago'
+        pendente.data_pagamento = hoje
+        pendente.save()
+        Transacao.objects.get(pk=aluguel.pk).delete()
+        self.assertEqual(self._resumo(), self._livro())
+        self.assertEqual(
+            self._resumo()[(hoje.replace(day=1), 'receita', 'pago', self.servicos.pk)],
+            (2, Decimal('150.00'))
+        )
+
+        reconstruir_resumo()
+        self.assertEqual(self._resumo(), self._livro())
+
+    def test_dashboard_le_o_resumo(self):
+        hoje = date.today()
+        self._transacao('receita', self.servicos, '100.00')
+        self._transacao('despesa', self.pecas, '40.00')
+        self._transacao('despesa', self.aluguel, '60.00')
+        self._transacao('receita', self.servicos, '50.00', status='pendente', vencimento=hoje - timedelta(days=1))
+        self._transacao('despesa', self.pecas, '30.00', status='pendente', vencimento=hoje + timedelta(days=10))
 
-# Create your tests here.
+        self.client.force_login(self.usuario)
+        with CaptureQueriesContext(connection) as contexto:
+            resposta = self.client.get(reverse('financeiro_dashboard'))
+        self.assertEqual(resposta.status_code, 200)
+        contexto_view = resposta.context
+        self.assertEqual(contexto_view['receitas_mes'], Decimal('100.00'))
+        self.assertEqual(contexto_view['despesas_mes'], Decimal('100.00'))
+        self.assertEqual(contexto_view['a_receber'], Decimal('50.00'))
+        self.assertEqual(contexto_view['a_pagar'], Decimal('30.00'))
+        self.assertEqual(contexto_view['contas_vencidas'], 1)
+        self.assertEqual(
+            [(d['categoria__nome'], d['total']) for d in contexto_view['top_despesas']],
+            [('Aluguel', Decimal('60.00')), ('Peças', Decimal('40.00'))]
+        )
+        # Na tabela de transações: só o aggregate dos pendentes e a lista das últimas
+        consultas = [c for c in contexto.captured_queries if 'financeiro_transacao' in c['sql']]
+        self.assertEqual(len(consultas), 2)
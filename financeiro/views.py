@@ -2,78 +2,70 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Sum, Q, Count
-from django.db.models.functions import TruncMonth
 from django.db import transaction
 from datetime import datetime, date, timedelta
-from .models import CategoriaFinanceira, Transacao, ContaBancaria, NotaFiscal, ItemNotaFiscal
+from decimal import Decimal
+from .models import (CategoriaFinanceira, Transacao, ContaBancaria, NotaFiscal, ItemNotaFiscal,
+                     ResumoFinanceiroMensal)
 from .forms import (CategoriaFinanceiraForm, TransacaoForm, ContaBancariaForm, 
                     NotaFiscalForm, ItemNotaFiscalFormSet)
 from ordem_servico.models import OrdemServico
-from estoque.models import MovimentacaoEstoque
+from estoque.servicos import registrar_movimentos
 
 
 @login_required
 def dashboard_financeiro(request):
     hoje = date.today()
     inicio_mes = hoje.replace(day=1)
-    fim_mes = (inicio_mes + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-    
-    # Receitas e Despesas do mês
-    receitas_mes = Transacao.objects.filter(
-        tipo='receita',
-        status='pago',
-        data_pagamento__gte=inicio_mes,
-        data_pagamento__lte=fim_mes
-    ).aggregate(total=Sum('valor'))['total'] or 0
-    
-    despesas_mes = Transacao.objects.filter(
-        tipo='despesa',
-        status='pago',
-        data_pagamento__gte=inicio_mes,
-        data_pagamento__lte=fim_mes
-    ).aggregate(total=Sum('valor'))['total'] or 0
+    # Primeiro dia do mês, cinco meses atrás: o gráfico mostra seis meses cheios
+    inicio_grafico = inicio_mes
+    for _ in range(5):
+        inicio_grafico = (inicio_grafico - timedelta(days=1)).replace(day=1)
+    
+    # Receitas, despesas, gráfico e top categorias: uma leitura do resumo mensal
+    # (mantido pelos signals de Transacao) em vez de somar as transações
+    resumo = ResumoFinanceiroMensal.objects.filter(
+        status='pago', mes__gte=inicio_grafico, mes__lte=inicio_mes
+    ).values('mes', 'tipo', 'categoria__nome').annotate(total=Sum('total')).order_by('mes')
+    
+    receitas_mes = despesas_mes = Decimal('0')
+    por_mes = {}
+    despesas_categoria = {}
+    for linha in resumo:
+        por_mes[(linha['mes'], linha['tipo'])] = por_mes.get((linha['mes'], linha['tipo']), 0) + linha['total']
+        if linha['mes'] == inicio_mes:
+            if linha['tipo'] == 'receita':
+                receitas_mes += linha['total']
+            else:
+                despesas_mes += linha['total']
+                nome = linha['categoria__nome']
+                despesas_categoria[nome] = despesas_categoria.get(nome, 0) + linha['total']
     
     lucro_mes = receitas_mes - despesas_mes
     
-    # Contas a receber e a pagar
-    a_receber = Transacao.objects.filter(
-        tipo='receita',
-        status='pendente'
-    ).aggregate(total=Sum('valor'))['total'] or 0
-    
-    a_pagar = Transacao.objects.filter(
-        tipo='despesa',
-        status='pendente'
-    ).aggregate(total=Sum('valor'))['total'] or 0
-    
-    # Contas vencidas
-    contas_vencidas = Transacao.objects.filter(
-        status='pendente',
-        data_vencimento__lt=hoje
-    ).count()
+    # Contas a receber, a pagar e vencidas: um único aggregate condicional
+    pendentes = Transacao.objects.filter(status='pendente').aggregate(
+        a_receber=Sum('valor', filter=Q(tipo='receita')),
+        a_pagar=Sum('valor', filter=Q(tipo='despesa')),
+        vencidas=Count('pk', filter=Q(data_vencimento__lt=hoje)),
+    )
+    a_receber = pendentes['a_receber'] or 0
+    a_pagar = pendentes['a_pagar'] or 0
+    contas_vencidas = pendentes['vencidas']
     
     # Últimas transações
     ultimas_transacoes = Transacao.objects.select_related('categoria').order_by('-data_cadastro')[:10]
     
     # Gráfico de receitas x despesas (últimos 6 meses)
-    seis_meses_atras = hoje - timedelta(days=180)
-    dados_grafico = Transacao.objects.filter(
-        status='pago',
-        data_pagamento__gte=seis_meses_atras
-    ).annotate(
-        mes=TruncMonth('data_pagamento')
-    ).values('mes', 'tipo').annotate(
-        total=Sum('valor')
-    ).order_by('mes')
+    dados_grafico = [
+        {'mes': mes, 'tipo': tipo, 'total': total} for (mes, tipo), total in por_mes.items()
+    ]
     
     # Top categorias de despesa
-    top_despesas = Transacao.objects.filter(
-        tipo='despesa',
-        status='pago',
-        data_pagamento__gte=inicio_mes
-    ).values('categoria__nome').annotate(
-        total=Sum('valor')
-    ).order_by('-total')[:5]
+    top_despesas = [
+        {'categoria__nome': nome, 'total': total}
+        for nome, total in sorted(despesas_categoria.items(), key=lambda item: item[1], reverse=True)[:5]
+    ]
     
     context = {
         'receitas_mes': receitas_mes,
@@ -344,6 +336,26 @@ def nota_fiscal_detalhe(request, pk):
     return render(request, 'financeiro/nota_fiscal_detalhe.html', context)
 
 
+def _dar_entrada_nota(nota, usuario):
+    """
+    Entrada no estoque de todos os itens da nota: um bulk_create das
+    movimentações e um único UPDATE para os preços de compra das peças.
+    """
+    return registrar_movimentos(
+        [
+            (peca_id, 'entrada', quantidade, valor_unitario)
+            for peca_id, quantidade, valor_unitario in nota.itens.order_by('pk').values_list(
+                'peca_id', 'quantidade', 'valor_unitario'
+            )
+        ],
+        usuario,
+        observacoes=f'Entrada via NF {nota.numero_nota}',
+        nota_fiscal=nota,
+        fornecedor=nota.fornecedor,
+        atualizar_precos=True
+    )
+
+
 @login_required
 @transaction.atomic
 def nota_fiscal_integrar_estoque(request, pk):
@@ -360,20 +372,8 @@ def nota_fiscal_integrar_estoque(request, pk):
     
     if request.method == 'POST':
         try:
-            # Para cada item da nota, cria uma movimentação de entrada no estoque
-            itens_processados = 0
-            for item in nota.itens.all():
-                MovimentacaoEstoque.objects.create(
-                    peca=item.peca,
-                    tipo='entrada',
-                    quantidade=item.quantidade,
-                    valor_unitario=item.valor_unitario,
-                    nota_fiscal=nota,
-                    fornecedor=nota.fornecedor,
-                    usuario=request.user,
-                    observacoes=f'Entrada via NF {nota.numero_nota}'
-                )
-                itens_processados += 1
+            # Uma movimentação de entrada por item da nota, gravadas em lote
+            itens_processados = len(_dar_entrada_nota(nota, request.user))
             
             # Marca a nota como integrada ao estoque
             nota.integrada_estoque = True
@@ -456,19 +456,7 @@ def nota_fiscal_integrar_completo(request, pk):
         try:
             # Integra ao estoque (se ainda não foi)
             if not nota.integrada_estoque and nota.tipo == 'entrada':
-                itens_processados = 0
-                for item in nota.itens.all():
-                    MovimentacaoEstoque.objects.create(
-                        peca=item.peca,
-                        tipo='entrada',
-                        quantidade=item.quantidade,
-                        valor_unitario=item.valor_unitario,
-                        nota_fiscal=nota,
-                        fornecedor=nota.fornecedor,
-                        usuario=request.user,
-                        observacoes=f'Entrada via NF {nota.numero_nota}'
-                    )
-                    itens_processados += 1
+                _dar_entrada_nota(nota, request.user)
                 nota.integrada_estoque = True
             
             # Integra ao financeiro (se ainda não foi)
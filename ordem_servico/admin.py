@@ -6,6 +6,7 @@ class PecaUtilizadaInline(admin.TabularInline):
     extra = 0
     fields = ['peca', 'quantidade', 'preco_unitario', 'valor_total']
     readonly_fields = ['valor_total']
+    autocomplete_fields = ['peca']
 
 class HistoricoStatusInline(admin.TabularInline):
     model = HistoricoStatusOS # CORREÇÃO
@@ -17,9 +18,14 @@ class HistoricoStatusInline(admin.TabularInline):
 class OrdemServicoAdmin(admin.ModelAdmin):
     list_display = ['id', 'cliente', 'status', 'data_entrada']
     list_filter = ['status', 'prioridade']
-    search_fields = ['id', 'cliente__nome']
+    search_fields = ['=id', 'cliente__nome']
+    list_select_related = ['cliente']
     inlines = [PecaUtilizadaInline, HistoricoStatusInline]
 
+    def get_queryset(self, request):
+        # O __str__ da OS usa o cliente (listagem e autocomplete de outros admins)
+        return super().get_queryset(request).select_related('cliente')
+
 @admin.register(PecaUtilizadaOS) # CORREÇÃO
 class PecaUtilizadaAdmin(admin.ModelAdmin):
     list_display = ['os', 'peca', 'quantidade', 'valor_total']
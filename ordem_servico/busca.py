@@ -0,0 +1,169 @@
+"""
+Índice de busca textual das Ordens de Serviço.
+
+No SQLite usa uma tabela virtual FTS5; no PostgreSQL, uma tabela com tsvector e
+índice GIN. Nos dois casos a tabela guarda um documento por OS (cliente, marca,
+modelo, número de série, defeito e diagnóstico), mantido pelos signals e
+reconstruído pelo comando reindexar_busca_os.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from core.paginacao import MAIOR_ID
+
+TABELA_BUSCA = 'ordem_servico_busca'
+
+# Documento indexado: junta a OS com o nome do cliente
+_SELECT_SQLITE = """
+    SELECT os.id, c.nome, os.marca, os.modelo, COALESCE(os.numero_serie, ''),
+           os.defeito_cliente, COALESCE(os.diagnostico_tecnico, '')
+    FROM ordem_servico_ordemservico os
+    JOIN clientes_cliente c ON c.id = os.cliente_id
+"""
+
+_SELECT_POSTGRES = """
+    SELECT os.id,
+           setweight(to_tsvector('portuguese', c.nome), 'A') ||
+           setweight(to_tsvector('portuguese', os.marca || ' ' || os.modelo), 'A') ||
+           setweight(to_tsvector('simple', COALESCE(os.numero_serie, '')), 'A') ||
+           setweight(to_tsvector('portuguese', os.defeito_cliente), 'B') ||
+           setweight(to_tsvector('portuguese', COALESCE(os.diagnostico_tecnico, '')), 'B')
+    FROM ordem_servico_ordemservico os
+    JOIN clientes_cliente c ON c.id = os.cliente_id
+"""
+
+
+def busca_disponivel():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _termos(texto):
+    return re.findall(r'\w+', texto.lower())
+
+
+def _consulta(texto):
+    """Converte o texto digitado em uma consulta de prefixo (todas as palavras obrigatórias)."""
+    termos = _termos(texto)
+    if not termos:
+        return None
+    if connection.vendor == 'postgresql':
+        return ' & '.join(f'{termo}:*' for termo in termos)
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+def _sql_correspondencias():
+    if connection.vendor == 'postgresql':
+        return (
+            f"SELECT os_id FROM {TABELA_BUSCA} "
+            f"WHERE documento @@ to_tsquery('portuguese', %s)"
+        )
+    return f"SELECT rowid FROM {TABELA_BUSCA} WHERE {TABELA_BUSCA} MATCH %s"
+
+
+def _numero_os(texto):
+    """Número da OS digitado na busca, ou None ("²" é dígito mas não número; ids fora da faixa do banco)."""
+    if not texto.isdecimal():
+        return None
+    try:
+        numero = int(texto)
+    except ValueError:
+        return None
+    return numero if 0 < numero <= MAIOR_ID else None
+
+
+def filtrar_ordens(ordens, texto):
+    """Filtra o queryset pelas OS que casam com o texto (ou pelo número da OS)."""
+    numero = _numero_os(texto)
+    condicao = Q(pk=numero) if numero is not None else Q()
+
+    consulta = _consulta(texto)
+    if consulta is None:
+        return ordens.filter(condicao) if condicao else ordens.none()
+
+    if not busca_disponivel():
+        # Bancos sem índice textual continuam com a busca por LIKE
+        return ordens.filter(
+            condicao |
+            Q(cliente__nome__icontains=texto) |
+            Q(marca__icontains=texto) |
+            Q(modelo__icontains=texto)
+        )
+
+    return ordens.filter(condicao | Q(pk__in=RawSQL(_sql_correspondencias(), [consulta])))
+
+
+def buscar_ordens(texto, limite=20):
+    """Retorna os ids das OS que casam com o texto, da mais para a menos relevante."""
+    consulta = _consulta(texto)
+    if consulta is None or not busca_disponivel():
+        return []
+
+    if connection.vendor == 'postgresql':
+        sql = (
+            f"SELECT os_id FROM {TABELA_BUSCA} "
+            f"WHERE documento @@ to_tsquery('portuguese', %s) "
+            f"ORDER BY ts_rank(documento, to_tsquery('portuguese', %s)) DESC LIMIT %s"
+        )
+        parametros = [consulta, consulta, limite]
+    else:
+        # bm25 do FTS5 retorna valores menores para os resultados mais relevantes
+        sql = (
+            f"SELECT rowid FROM {TABELA_BUSCA} WHERE {TABELA_BUSCA} MATCH %s "
+            f"ORDER BY bm25({TABELA_BUSCA}) LIMIT %s"
+        )
+        parametros = [consulta, limite]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return [linha[0] for linha in cursor.fetchall()]
+
+
+def indexar_ordens(ids):
+    """(Re)grava o documento de busca das OS informadas."""
+    ids = list(ids)
+    if not ids or not busca_disponivel():
+        return
+    marcadores = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"INSERT INTO {TABELA_BUSCA} (os_id, documento) "
+                f"{_SELECT_POSTGRES} WHERE os.id IN ({marcadores}) "
+                f"ON CONFLICT (os_id) DO UPDATE SET documento = EXCLUDED.documento",
+                ids
+            )
+        else:
+            cursor.execute(f"DELETE FROM {TABELA_BUSCA} WHERE rowid IN ({marcadores})", ids)
+            cursor.execute(
+                f"INSERT INTO {TABELA_BUSCA} (rowid, cliente, marca, modelo, numero_serie, "
+                f"defeito_cliente, diagnostico_tecnico) {_SELECT_SQLITE} WHERE os.id IN ({marcadores})",
+                ids
+            )
+
+
+def remover_ordens(ids):
+    ids = list(ids)
+    if not ids or not busca_disponivel():
+        return
+    marcadores = ', '.join(['%s'] * len(ids))
+    coluna = 'os_id' if connection.vendor == 'postgresql' else 'rowid'
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_BUSCA} WHERE {coluna} IN ({marcadores})", ids)
+
+
+def reconstruir_indice():
+    """Apaga e recria o índice inteiro a partir das tabelas de OS e clientes."""
+    if not busca_disponivel():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABELA_BUSCA}")
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"INSERT INTO {TABELA_BUSCA} (os_id, documento) {_SELECT_POSTGRES}")
+        else:
+            cursor.execute(
+                f"INSERT INTO {TABELA_BUSCA} (rowid, cliente, marca, modelo, numero_serie, "
+                f"defeito_cliente, diagnostico_tecnico) {_SELECT_SQLITE}"
+            )
@@ -0,0 +1,50 @@
+from datetime import datetime, time
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import OrdemServico
+
+STATUS_FINALIZADOS = ['pronto', 'entregue', 'cancelado']
+
+CHAVE_CACHE_CONTAGEM = 'ordem_servico:contagem_status'
+# Rede de segurança para alterações feitas sem passar pelos signals (ex: update em lote)
+TEMPO_CACHE_CONTAGEM = 300
+
+
+def _chave_cache(hoje):
+    # A data entra na chave porque "atrasadas" e "do mês" mudam na virada do dia
+    return f'{CHAVE_CACHE_CONTAGEM}:{hoje.isoformat()}'
+
+
+def contagem_status():
+    """
+    Retorna a quantidade de OS por status, além de total, abertas, atrasadas e do mês,
+    calculadas em uma única consulta com agregação condicional.
+    O resultado fica no cache e é compartilhado pela lista de OS e pelo dashboard.
+    """
+    hoje = timezone.localdate()
+    chave = _chave_cache(hoje)
+    contagem = cache.get(chave)
+    if contagem is not None:
+        return contagem
+
+    inicio_mes = timezone.make_aware(datetime.combine(hoje.replace(day=1), time.min))
+    por_status = {
+        status: Count('pk', filter=Q(status=status))
+        for status, _ in OrdemServico.STATUS_CHOICES
+    }
+    contagem = OrdemServico.objects.order_by().aggregate(
+        total=Count('pk'),
+        abertas=Count('pk', filter=~Q(status__in=STATUS_FINALIZADOS)),
+        atrasadas=Count('pk', filter=Q(data_previsao__lt=hoje) & ~Q(status__in=STATUS_FINALIZADOS)),
+        do_mes=Count('pk', filter=Q(data_entrada__gte=inicio_mes)),
+        **por_status
+    )
+    cache.set(chave, contagem, TEMPO_CACHE_CONTAGEM)
+    return contagem
+
+
+def invalidar_contagem_status():
+    cache.delete(_chave_cache(timezone.localdate()))
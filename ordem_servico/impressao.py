@@ -0,0 +1,53 @@
+"""
+Cache do documento de impressão da OS.
+
+O HTML renderizado fica no cache junto com a versão da OS lida antes da
+renderização. A versão é um token no próprio cache, trocado (após o commit)
+sempre que a OS, suas peças, o cadastro dessas peças ou o cliente mudam; uma
+reimpressão custa só a leitura do documento e da versão, sem consultar o banco.
+"""
+import uuid
+
+from django.core.cache import cache
+
+TEMPO_CACHE_IMPRESSAO = 60 * 60 * 24
+
+
+def _chave_documento(os_id):
+    return f'ordem_servico:impressao:{os_id}'
+
+
+def _chave_versao(os_id):
+    return f'ordem_servico:versao:{os_id}'
+
+
+def versao_impressao(os_id):
+    """
+    Versão atual da OS. Deve ser lida ANTES de carregar a OS do banco: se ela mudar
+    durante a renderização, o documento guardado já nasce desatualizado.
+    """
+    chave = _chave_versao(os_id)
+    versao = cache.get(chave)
+    if versao is None:
+        # Versão ausente (nunca criada ou expulsa do cache) ganha um token novo
+        cache.add(chave, uuid.uuid4().hex, None)
+        versao = cache.get(chave)
+    return versao
+
+
+def impressao_em_cache(os_id):
+    """Retorna o HTML guardado da OS, ou None se não houver ou estiver desatualizado."""
+    documento = cache.get(_chave_documento(os_id))
+    if documento is None or documento['versao'] != cache.get(_chave_versao(os_id)):
+        return None
+    return documento['html']
+
+
+def guardar_impressao(os_id, versao, html):
+    cache.set(_chave_documento(os_id), {'versao': versao, 'html': html}, TEMPO_CACHE_IMPRESSAO)
+
+
+def invalidar_impressao(os_ids):
+    os_ids = list(os_ids)
+    if os_ids:
+        cache.set_many({_chave_versao(os_id): uuid.uuid4().hex for os_id in os_ids}, None)
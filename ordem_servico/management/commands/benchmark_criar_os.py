@@ -0,0 +1,96 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from clientes.models import Cliente
+from estoque.models import CategoriaPeca, Peca
+from estoque.servicos import registrar_movimentos
+from ordem_servico.forms import OrdemServicoForm, PecaUtilizadaFormSet
+from ordem_servico.servicos import criar_ordem_servico
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Mede a latência da criação de uma OS com N peças (dados temporários, desfeitos ao final)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pecas', type=int, default=20, help='Peças por OS')
+        parser.add_argument('--repeticoes', type=int, default=30, help='Quantidade de OS criadas')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._executar(options['pecas'], options['repeticoes'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _dados_os(self, cliente, pecas):
+        dados = {
+            'cliente': cliente.pk,
+            'tipo_equipamento': 'Notebook',
+            'marca': 'Benchmark',
+            'modelo': 'B-1',
+            'defeito_cliente': 'Não liga',
+            'status': 'recepcao',
+            'prioridade': 'normal',
+            'garantia_dias': 90,
+            'valor_mao_de_obra': '100.00',
+            'desconto': '0.00',
+            'pecas-TOTAL_FORMS': len(pecas),
+            'pecas-INITIAL_FORMS': 0,
+            'pecas-MIN_NUM_FORMS': 0,
+            'pecas-MAX_NUM_FORMS': 1000,
+        }
+        for i, peca in enumerate(pecas):
+            dados[f'pecas-{i}-peca'] = peca.pk
+            dados[f'pecas-{i}-quantidade'] = 1
+            dados[f'pecas-{i}-preco_unitario'] = '10.00'
+        return dados
+
+    def _executar(self, quantidade_pecas, repeticoes):
+        usuario = User.objects.create(username='benchmark_criar_os')
+        cliente = Cliente.objects.create(
+            nome='Cliente Benchmark', cpf_cnpj='000.000.000-00', telefone_principal='0'
+        )
+        categoria = CategoriaPeca.objects.create(nome='Benchmark OS')
+        pecas = [
+            Peca.objects.create(nome=f'Peça benchmark {i}', categoria=categoria)
+            for i in range(quantidade_pecas)
+        ]
+        registrar_movimentos(
+            [(peca.pk, 'entrada', repeticoes, Decimal('5.00')) for peca in pecas], usuario
+        )
+
+        dados = self._dados_os(cliente, pecas)
+        tempos = []
+        consultas = []
+        for _ in range(repeticoes):
+            form = OrdemServicoForm(dados)
+            formset = PecaUtilizadaFormSet(dados, prefix='pecas')
+            if not (form.is_valid() and formset.is_valid()):
+                self.stderr.write(f'Dados inválidos: {form.errors} {formset.errors}')
+                return
+
+            with CaptureQueriesContext(connection) as contexto:
+                inicio = time.perf_counter()
+                criar_ordem_servico(form, formset, usuario)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(len(contexto.captured_queries))
+
+        tempos.sort()
+        p95 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+        self.stdout.write(
+            f'OS com {quantidade_pecas} peças, {repeticoes} repetições:\n'
+            f'  média {statistics.mean(tempos):.2f} ms | mediana {statistics.median(tempos):.2f} ms | '
+            f'p95 {p95:.2f} ms\n'
+            f'  consultas por OS: {statistics.mean(consultas):.0f}'
+        )
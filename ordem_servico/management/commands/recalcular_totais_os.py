@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from ordem_servico.models import OrdemServico
+
+
+class Command(BaseCommand):
+    help = 'Recalcula e confere as colunas total_pecas/valor_total das OS, em lotes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Quantidade de OS por lote')
+        parser.add_argument(
+            '--verificar', action='store_true',
+            help='Apenas lista as OS com totais divergentes, sem corrigir'
+        )
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        verificar = options['verificar']
+        ultimo_id = 0
+        conferidas = 0
+        divergentes = 0
+
+        while True:
+            # Percorre por faixas de id para não carregar a tabela inteira
+            ids = list(
+                OrdemServico.objects.filter(pk__gt=ultimo_id)
+                .order_by('pk').values_list('pk', flat=True)[:lote]
+            )
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+            conferidas += len(ids)
+
+            erradas = OrdemServico.objects.filter(pk__in=ids).com_totais_calculados().filter(
+                ~Q(total_pecas=F('total_pecas_calculado')) |
+                ~Q(valor_total=F('valor_total_calculado'))
+            )
+            if verificar:
+                for os in erradas.values('pk', 'valor_total', 'valor_total_calculado'):
+                    divergentes += 1
+                    self.stdout.write(
+                        f"OS #{os['pk']}: gravado R$ {os['valor_total']} / calculado R$ {os['valor_total_calculado']}"
+                    )
+            else:
+                divergentes += erradas.recalcular_totais()
+
+        if verificar:
+            estilo = self.style.WARNING if divergentes else self.style.SUCCESS
+            self.stdout.write(estilo(f'{conferidas} OS conferidas, {divergentes} com totais divergentes.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{conferidas} OS conferidas, {divergentes} corrigidas.'))
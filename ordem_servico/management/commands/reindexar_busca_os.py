@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ordem_servico.busca import busca_disponivel, reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de busca textual das Ordens de Serviço'
+
+    def handle(self, *args, **options):
+        if not busca_disponivel():
+            self.stdout.write(self.style.WARNING('Banco de dados sem suporte ao índice de busca textual.'))
+            return
+
+        with transaction.atomic():
+            reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS('Índice de busca das OS reconstruído.'))
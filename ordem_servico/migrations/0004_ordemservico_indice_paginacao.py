@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 12:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0001_initial'),
+        ('ordem_servico', '0003_fotoos_historicostatusos_pecautilizadaos_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ordemservico',
+            index=models.Index(fields=['-data_entrada', '-id'], name='os_data_entrada_id_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-18 12:14
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def preencher_totais(apps, schema_editor):
+    OrdemServico = apps.get_model('ordem_servico', 'OrdemServico')
+    PecaUtilizadaOS = apps.get_model('ordem_servico', 'PecaUtilizadaOS')
+
+    def soma_pecas():
+        soma = PecaUtilizadaOS.objects.filter(
+            os=OuterRef('pk')
+        ).values('os').annotate(total=Sum('valor_total')).values('total')
+        return Coalesce(Subquery(soma), Value(Decimal('0.00')), output_field=models.DecimalField())
+
+    OrdemServico.objects.update(
+        total_pecas=soma_pecas(),
+        valor_total=F('valor_mao_de_obra') + soma_pecas() - F('desconto')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordem_servico', '0004_ordemservico_indice_paginacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordemservico',
+            name='total_pecas',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='ordemservico',
+            name='valor_total',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0.0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(preencher_totais, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1 on 2026-10-18 12:20
+
+from django.db import migrations
+
+
+def criar_indice_busca(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS ordem_servico_busca USING fts5("
+            "cliente, marca, modelo, numero_serie, defeito_cliente, diagnostico_tecnico, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO ordem_servico_busca (rowid, cliente, marca, modelo, numero_serie, "
+            "defeito_cliente, diagnostico_tecnico) "
+            "SELECT os.id, c.nome, os.marca, os.modelo, COALESCE(os.numero_serie, ''), "
+            "os.defeito_cliente, COALESCE(os.diagnostico_tecnico, '') "
+            "FROM ordem_servico_ordemservico os JOIN clientes_cliente c ON c.id = os.cliente_id"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE IF NOT EXISTS ordem_servico_busca ("
+            "os_id bigint PRIMARY KEY REFERENCES ordem_servico_ordemservico (id) ON DELETE CASCADE, "
+            "documento tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS ordem_servico_busca_documento_idx "
+            "ON ordem_servico_busca USING GIN (documento)"
+        )
+        schema_editor.execute(
+            "INSERT INTO ordem_servico_busca (os_id, documento) "
+            "SELECT os.id, "
+            "setweight(to_tsvector('portuguese', c.nome), 'A') || "
+            "setweight(to_tsvector('portuguese', os.marca || ' ' || os.modelo), 'A') || "
+            "setweight(to_tsvector('simple', COALESCE(os.numero_serie, '')), 'A') || "
+            "setweight(to_tsvector('portuguese', os.defeito_cliente), 'B') || "
+            "setweight(to_tsvector('portuguese', COALESCE(os.diagnostico_tecnico, '')), 'B') "
+            "FROM ordem_servico_ordemservico os JOIN clientes_cliente c ON c.id = os.cliente_id"
+        )
+
+
+def remover_indice_busca(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS ordem_servico_busca")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0001_initial'),
+        ('ordem_servico', '0005_ordemservico_totais'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice_busca, remover_indice_busca),
+    ]
@@ -1,12 +1,66 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import Sum, F, OuterRef, Subquery, Value, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce
 
 # Importando modelos externos conforme estrutura existente
 from estoque.models import Peca
 from clientes.models import Cliente
 
+MOEDA = DecimalField(max_digits=12, decimal_places=2)
+# Colunas mantidas por recalcular_totais(), nunca regravadas pelo save() da OS
+CAMPOS_TOTAIS = ('total_pecas', 'valor_total')
+
+
+def _soma_pecas():
+    """Subquery com a soma das peças de cada OS (0.00 quando não há peças)."""
+    soma = PecaUtilizadaOS.objects.filter(
+        os=OuterRef('pk')
+    ).values('os').annotate(total=Sum('valor_total')).values('total')
+    return Coalesce(Subquery(soma), Value(Decimal('0.00')), output_field=MOEDA)
+
+
+class OrdemServicoQuerySet(models.QuerySet):
+    def com_totais_calculados(self):
+        """Anota os totais recalculados a partir das peças, para conferir as colunas gravadas."""
+        return self.annotate(
+            total_pecas_calculado=_soma_pecas(),
+            valor_total_calculado=ExpressionWrapper(
+                F('valor_mao_de_obra') + _soma_pecas() - F('desconto'),
+                output_field=MOEDA
+            )
+        )
+
+    def com_pecas(self):
+        """Carrega cliente, técnico e as peças (com a Peca) para exibir/imprimir a OS."""
+        return self.select_related('cliente', 'tecnico', 'atendente').prefetch_related(
+            models.Prefetch('pecas', queryset=PecaUtilizadaOS.objects.select_related('peca').order_by('pk'))
+        )
+
+    def com_detalhes(self):
+        """Plano completo da tela de detalhe: peças, fotos e histórico com o usuário."""
+        return self.com_pecas().prefetch_related(
+            'fotos',
+            models.Prefetch('historico', queryset=HistoricoStatusOS.objects.select_related('usuario'))
+        )
+
+    def recalcular_totais(self):
+        """
+        Regrava total_pecas e valor_total das OS do queryset em um único UPDATE.
+        As linhas são travadas antes, para que alterações simultâneas de peças
+        na mesma OS não gravem uma soma antiga.
+        """
+        with transaction.atomic():
+            ids = list(self.select_for_update().order_by('pk').values_list('pk', flat=True))
+            return OrdemServico.objects.filter(pk__in=ids).update(
+                total_pecas=_soma_pecas(),
+                valor_total=F('valor_mao_de_obra') + _soma_pecas() - F('desconto')
+            )
+
+
 class OrdemServico(models.Model):
     # --- Configurações de Status (Fluxo Controlado) ---
     STATUS_CHOICES = (
@@ -19,6 +73,17 @@ class OrdemServico(models.Model):
         ('cancelado', '7. Cancelado'),
     )
 
+    # Transições permitidas na mudança de status em lote
+    TRANSICOES_STATUS = {
+        'recepcao': ['analise', 'cancelado'],
+        'analise': ['aprovacao', 'reparo', 'cancelado'],
+        'aprovacao': ['reparo', 'cancelado'],
+        'reparo': ['pronto', 'cancelado'],
+        'pronto': ['entregue', 'reparo'],
+        'entregue': [],
+        'cancelado': [],
+    }
+
     PRIORIDADE_CHOICES = [
         ('baixa', 'Baixa'),
         ('normal', 'Normal'),
@@ -58,32 +123,66 @@ class OrdemServico(models.Model):
     valor_mao_de_obra = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     desconto = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     
+    # Totais desnormalizados, mantidos por recalcular_totais() na mesma transação
+    # de qualquer alteração nas peças, mão de obra ou desconto
+    total_pecas = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, editable=False)
+    valor_total = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, editable=False, db_index=True)
+    
+    objects = OrdemServicoQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-data_entrada']
         verbose_name = "Ordem de Serviço"
         verbose_name_plural = "Ordens de Serviço"
+        indexes = [
+            # Chave da paginação por cursor da lista de OS
+            models.Index(fields=['-data_entrada', '-id'], name='os_data_entrada_id_idx'),
+        ]
 
     def __str__(self):
         return f"OS #{self.pk} - {self.cliente.nome}"
 
     # --- Propriedades Calculadas (Business Logic) ---
 
-    @property
-    def total_pecas(self):
-        """Calcula o valor total das peças somando os itens relacionados."""
-        # O aggregate retorna um dict, ex: {'total': 150.00} ou {'total': None}
-        resultado = self.pecas.aggregate(total=Sum('valor_total'))['total']
-        return resultado if resultado else 0.00
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._valores_originais = instancia._valores()
+        return instancia
 
-    @property
-    def valor_total(self):
-        """Calcula o valor final da OS: Mão de obra + Peças - Desconto."""
-        # Convertemos para float para evitar erros de tipo Decimal vs Float em templates simples,
-        # mas idealmente manteríamos Decimal. Aqui forçamos a conversão para cálculo seguro.
-        mdo = self.valor_mao_de_obra or 0
-        pecas = self.total_pecas or 0
-        desc = self.desconto or 0
-        return mdo + pecas - desc
+    def _valores(self):
+        return (self.__dict__.get('valor_mao_de_obra'), self.__dict__.get('desconto'))
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # Uma OS nova ainda não tem peças: o total é só mão de obra - desconto
+            self.total_pecas = Decimal('0.00')
+            self.valor_total = Decimal(self.valor_mao_de_obra or 0) - Decimal(self.desconto or 0)
+            super().save(*args, **kwargs)
+            self._valores_originais = self._valores()
+            return
+
+        if kwargs.get('update_fields') is None:
+            # Os totais em memória podem estar desatualizados (peças alteradas por
+            # outro caminho): a edição da OS não regrava total_pecas/valor_total
+            adiados = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in CAMPOS_TOTAIS and campo.attname not in adiados
+            ]
+        mudou_valores = self._valores() != getattr(self, '_valores_originais', None)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Só mão de obra e desconto mudam o total pelo lado da OS
+            if mudou_valores:
+                self.recalcular_totais()
+        self._valores_originais = self._valores()
+
+    def recalcular_totais(self):
+        """Atualiza total_pecas e valor_total desta OS a partir das peças utilizadas."""
+        OrdemServico.objects.filter(pk=self.pk).recalcular_totais()
+        self.refresh_from_db(fields=['total_pecas', 'valor_total'])
 
     @property
     def esta_atrasada(self):
@@ -143,10 +242,20 @@ class PecaUtilizadaOS(models.Model):
         verbose_name = "Peça Utilizada"
         verbose_name_plural = "Peças Utilizadas"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # OS em que a linha estava somada: se ela mudar de OS, a antiga também é recalculada
+        instancia._os_id_original = instancia.os_id
+        return instancia
+
     def save(self, *args, **kwargs):
         # Auto-cálculo do total da linha antes de salvar
         self.valor_total = self.quantidade * self.preco_unitario
-        super().save(*args, **kwargs)
+        # O post_save atualiza os totais da OS dentro desta mesma transação
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._os_id_original = self.os_id
 
     def __str__(self):
         return f"{self.peca.nome} (x{self.quantidade})"
@@ -0,0 +1,140 @@
+from django.db import transaction
+
+from estoque.servicos import registrar_saidas, registrar_movimentos
+from .models import OrdemServico, PecaUtilizadaOS, HistoricoStatusOS
+from .estatisticas import invalidar_contagem_status
+from .impressao import invalidar_impressao
+
+
+class TransicaoInvalida(Exception):
+    """Uma ou mais OS não podem ir para o status pedido."""
+
+    def __init__(self, ordens, novo_status):
+        self.ordens = ordens
+        self.novo_status = novo_status
+        numeros = ', '.join(f"#{os.pk} ({os.get_status_display()})" for os in ordens)
+        super().__init__(f"Transição para '{novo_status}' não permitida: {numeros}")
+
+
+def criar_ordem_servico(form, formset, usuario):
+    """
+    Grava uma nova OS com suas peças e a baixa no estoque em uma única transação.
+    Se alguma peça não tiver saldo, nada é gravado (EstoqueInsuficiente) e o
+    form volta a representar uma OS nova, pronto para ser exibido de novo.
+    """
+    pecas = []
+    try:
+        with transaction.atomic():
+            os = form.save(commit=False)
+            os.atendente = usuario
+            os.save()
+
+            # Peças gravadas em lote; os totais da OS são recalculados uma vez só no final
+            formset.instance = os
+            pecas = formset.save(commit=False)
+            for peca_utilizada in pecas:
+                peca_utilizada.os = os
+                peca_utilizada.valor_total = peca_utilizada.quantidade * peca_utilizada.preco_unitario
+            PecaUtilizadaOS.objects.bulk_create(pecas)
+            os.recalcular_totais()
+
+            registrar_saidas(
+                [(p.peca_id, p.quantidade, p.preco_unitario) for p in pecas],
+                usuario,
+                ordem_servico=os,
+                observacoes=f"Saída automática via OS {os.id}"
+            )
+    except Exception:
+        # Transação desfeita: a OS e as peças em memória não podem apontar para linhas que não existem
+        for instancia in [form.instance, *pecas]:
+            instancia.pk = None
+            instancia._state.adding = True
+        raise
+    return os
+
+
+def _pecas_por_quantidade(os):
+    """Quantidade e preço de cada peça nas linhas atuais da OS."""
+    quantidades = {}
+    precos = {}
+    for peca_id, quantidade, preco in os.pecas.values_list('peca_id', 'quantidade', 'preco_unitario'):
+        quantidades[peca_id] = quantidades.get(peca_id, 0) + quantidade
+        precos[peca_id] = preco
+    return quantidades, precos
+
+
+def editar_ordem_servico(form, formset, usuario):
+    """
+    Grava a edição da OS e reconcilia o estoque na mesma transação.
+
+    Compara as peças antes e depois da edição e grava, em um único lote, só as
+    movimentações de diferença: saída para o que foi acrescentado e entrada
+    (devolução) para o que foi removido ou reduzido.
+    """
+    with transaction.atomic():
+        os = form.instance
+        antes, precos_antes = _pecas_por_quantidade(os)
+
+        os = form.save()
+        formset.save()
+
+        depois, precos_depois = _pecas_por_quantidade(os)
+        movimentos = []
+        for peca_id in sorted(antes.keys() | depois.keys()):
+            diferenca = depois.get(peca_id, 0) - antes.get(peca_id, 0)
+            if diferenca > 0:
+                movimentos.append((peca_id, 'saida', diferenca, precos_depois[peca_id]))
+            elif diferenca < 0:
+                preco = precos_depois.get(peca_id, precos_antes[peca_id])
+                movimentos.append((peca_id, 'entrada', -diferenca, preco))
+
+        registrar_movimentos(
+            movimentos,
+            usuario,
+            ordem_servico=os,
+            observacoes=f"Ajuste automático via edição da OS {os.id}"
+        )
+    return os
+
+
+def transicionar_status(os_ids, novo_status, usuario, observacao=''):
+    """
+    Muda o status de várias OS de uma vez (tudo ou nada).
+
+    Valida as transições permitidas, grava os novos status com um bulk_update e
+    o histórico com um bulk_create, na mesma transação. Como o bulk_update não
+    dispara signals, os caches de contagem e de impressão são invalidados aqui.
+    """
+    if novo_status not in dict(OrdemServico.STATUS_CHOICES):
+        raise ValueError(f"Status inválido: {novo_status}")
+
+    with transaction.atomic():
+        ordens = list(
+            OrdemServico.objects.select_for_update()
+            .filter(pk__in=set(os_ids)).only('pk', 'status').order_by('pk')
+        )
+        invalidas = [
+            os for os in ordens
+            if novo_status not in OrdemServico.TRANSICOES_STATUS[os.status]
+        ]
+        if invalidas:
+            raise TransicaoInvalida(invalidas, novo_status)
+
+        historico = []
+        for os in ordens:
+            historico.append(HistoricoStatusOS(
+                os=os,
+                status_anterior=os.status,
+                novo_status=novo_status,
+                usuario=usuario,
+                observacao=observacao or None
+            ))
+            os.status = novo_status
+
+        OrdemServico.objects.bulk_update(ordens, ['status'])
+        HistoricoStatusOS.objects.bulk_create(historico)
+
+        ids = [os.pk for os in ordens]
+        transaction.on_commit(invalidar_contagem_status)
+        transaction.on_commit(lambda: invalidar_impressao(ids))
+    return ordens
@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from clientes.models import Cliente
+from estoque.models import Peca
+from .models import OrdemServico, PecaUtilizadaOS
+from .estatisticas import invalidar_contagem_status
+from .impressao import invalidar_impressao
+from . import busca
+
+
+@receiver(post_save, sender=PecaUtilizadaOS)
+@receiver(post_delete, sender=PecaUtilizadaOS)
+def atualizar_totais_os(sender, instance, **kwargs):
+    """Mantém os totais desnormalizados da OS quando uma peça é gravada ou removida."""
+    # Filtra pelo id para não buscar a OS (que pode estar sendo excluída em cascata);
+    # uma peça movida para outra OS recalcula também a OS de origem
+    OrdemServico.objects.filter(pk__in=_os_da_peca(instance)).recalcular_totais()
+
+
+def _os_da_peca(instance):
+    return {instance.os_id, getattr(instance, '_os_id_original', None) or instance.os_id}
+
+
+@receiver(post_save, sender=OrdemServico)
+@receiver(post_delete, sender=OrdemServico)
+def limpar_contagem_status(sender, **kwargs):
+    # Só depois do commit: antes disso, outra requisição recalcularia e guardaria a contagem antiga
+    transaction.on_commit(invalidar_contagem_status)
+
+
+@receiver(post_save, sender=OrdemServico)
+def indexar_ordem_busca(sender, instance, **kwargs):
+    busca.indexar_ordens([instance.pk])
+
+
+@receiver(post_delete, sender=OrdemServico)
+def remover_ordem_busca(sender, instance, **kwargs):
+    busca.remover_ordens([instance.pk])
+
+
+@receiver(post_save, sender=Cliente)
+def reindexar_ordens_cliente(sender, instance, created, **kwargs):
+    # O nome do cliente faz parte do documento de busca das suas OS
+    if not created:
+        busca.indexar_ordens(instance.ordens.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=OrdemServico)
+@receiver(post_delete, sender=OrdemServico)
+@receiver(post_save, sender=PecaUtilizadaOS)
+@receiver(post_delete, sender=PecaUtilizadaOS)
+def invalidar_impressao_os(sender, instance, **kwargs):
+    os_ids = [instance.pk] if sender is OrdemServico else list(_os_da_peca(instance))
+    # Só depois do commit: antes disso, quem reimprimir ainda lê os dados antigos
+    transaction.on_commit(lambda: invalidar_impressao(os_ids))
+
+
+@receiver(post_save, sender=Cliente)
+def invalidar_impressao_cliente(sender, instance, created, **kwargs):
+    if not created:
+        os_ids = list(instance.ordens.values_list('pk', flat=True))
+        transaction.on_commit(lambda: invalidar_impressao(os_ids))
+
+
+@receiver(post_save, sender=Peca)
+def invalidar_impressao_peca(sender, instance, created, **kwargs):
+    # O nome da peça aparece na impressão das OS que a utilizam
+    if not created:
+        os_ids = list(
+            PecaUtilizadaOS.objects.filter(peca=instance).values_list('os_id', flat=True).distinct()
+        )
+        transaction.on_commit(lambda: invalidar_impressao(os_ids))
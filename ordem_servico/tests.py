@@ -1,3 +1,689 @@
-from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from clientes.models import Cliente
+from estoque.models import CategoriaPeca, Peca, MovimentacaoEstoque, SaldoEstoque
+from estoque.servicos import EstoqueInsuficiente, registrar_saidas
+from clientes.autocomplete import indice_clientes
+from core.paginacao import codificar_cursor
+from estoque.autocomplete import indice_pecas, buscar_pecas
+from .forms import OrdemServicoForm, PecaUtilizadaFormSet
+from .models import OrdemServico, PecaUtilizadaOS, HistoricoStatusOS, FotoOS
+from .servicos import criar_ordem_servico
+from .estatisticas import contagem_status
+from .busca import buscar_ordens, filtrar_ordens, TABELA_BUSCA
+
+
+class OrdemServicoConsultasTest(TestCase):
+    """Garante que detalhe e impressão não voltam a fazer uma consulta por item."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('tecnico', password='senha')
+        cliente = Cliente.objects.create(
+            nome='Cliente Teste', cpf_cnpj='123.456.789-00', telefone_principal='(11) 99999-9999'
+        )
+        categoria = CategoriaPeca.objects.create(nome='Telas')
+        cls.os = OrdemServico.objects.create(
+            cliente=cliente, tecnico=cls.usuario, atendente=cls.usuario,
+            tipo_equipamento='Notebook', marca='Dell', modelo='Inspiron',
+            defeito_cliente='Não liga', valor_mao_de_obra=Decimal('100.00')
+        )
+        for i in range(5):
+            peca = Peca.objects.create(nome=f'Peça {i}', categoria=categoria)
+            PecaUtilizadaOS.objects.create(os=cls.os, peca=peca, quantidade=2, preco_unitario=Decimal('10.00'))
+        for status in ['analise', 'aprovacao', 'reparo']:
+            HistoricoStatusOS.objects.create(os=cls.os, novo_status=status, usuario=cls.usuario)
+        for i in range(3):
+            FotoOS.objects.create(os=cls.os, imagem=f'os_fotos/teste_{i}.jpg')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_detalhe_quantidade_de_consultas(self):
+        # sessão + usuário + OS (com cliente/técnico) + peças + fotos + histórico
+        with self.assertNumQueries(6):
+            resposta = self.client.get(reverse('ordem_servico_detalhe', args=[self.os.pk]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Peça 4')
+        self.assertContains(resposta, 'R$ 200,00')
+
+    def test_imprimir_quantidade_de_consultas(self):
+        # sessão + usuário + OS (com cliente/técnico) + peças
+        with self.assertNumQueries(4):
+            resposta = self.client.get(reverse('ordem_servico_imprimir', args=[self.os.pk]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Peça 4')
+
+    def test_reimpressao_vem_do_cache(self):
+        url = reverse('ordem_servico_imprimir', args=[self.os.pk])
+        self.client.get(url)
+        # Só sessão + usuário: o documento e a versão vêm do cache
+        with self.assertNumQueries(2):
+            resposta = self.client.get(url)
+        self.assertContains(resposta, 'Peça 4')
+
+    def test_impressao_invalidada_ao_alterar_peca(self):
+        url = reverse('ordem_servico_imprimir', args=[self.os.pk])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.os.pecas.first()
+            item.quantidade = 7
+            item.save()
+        with self.assertNumQueries(4):
+            resposta = self.client.get(url)
+        self.assertContains(resposta, 'R$ 70,00')
+
+    def test_impressao_invalidada_ao_renomear_peca(self):
+        url = reverse('ordem_servico_imprimir', args=[self.os.pk])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            peca = Peca.objects.get(nome='Peça 4')
+            peca.nome = 'Tela 15.6 LED'
+            peca.save()
+        with self.assertNumQueries(4):
+            resposta = self.client.get(url)
+        self.assertContains(resposta, 'Tela 15.6 LED')
+        self.assertNotContains(resposta, 'Peça 4')
+
+
+class StatusEmLoteTest(TestCase):
+    """Mudança de status em lote: tudo ou nada, com histórico gravado junto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('atendente', password='senha')
+        cliente = Cliente.objects.create(
+            nome='Cliente Lote', cpf_cnpj='987.654.321-00', telefone_principal='(11) 98888-8888'
+        )
+        cls.ordens = [
+            OrdemServico.objects.create(
+                cliente=cliente, atendente=cls.usuario, tipo_equipamento='Celular',
+                marca='Samsung', modelo=f'A{i}', defeito_cliente='Tela quebrada', status='reparo'
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_api_transiciona_e_grava_historico(self):
+        ids = [os.pk for os in self.ordens]
+        resposta = self.client.post(
+            reverse('api_status_lote'),
+            {'ordens': ids, 'status': 'pronto', 'observacao': 'Bancada concluída'},
+            content_type='application/json'
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(sorted(resposta.json()['atualizadas']), ids)
+        self.assertEqual(OrdemServico.objects.filter(pk__in=ids, status='pronto').count(), 3)
+        self.assertEqual(
+            HistoricoStatusOS.objects.filter(os__in=ids, status_anterior='reparo', novo_status='pronto').count(), 3
+        )
+
+    def test_transicao_invalida_nao_altera_nenhuma(self):
+        OrdemServico.objects.filter(pk=self.ordens[0].pk).update(status='entregue')
+        resposta = self.client.post(
+            reverse('api_status_lote'),
+            {'ordens': [os.pk for os in self.ordens], 'status': 'pronto'},
+            content_type='application/json'
+        )
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['invalidas'], [self.ordens[0].pk])
+        self.assertFalse(OrdemServico.objects.filter(status='pronto').exists())
+        self.assertFalse(HistoricoStatusOS.objects.exists())
+
+    def test_api_recusa_corpo_malformado(self):
+        for corpo in [
+            {'ordens': 5, 'status': 'pronto'}, {'ordens': ['1'], 'status': 'pronto'},
+            {'ordens': [True], 'status': 'pronto'}, {'ordens': [self.ordens[0].pk], 'status': ['pronto']},
+            [self.ordens[0].pk], 'pronto',
+        ]:
+            resposta = self.client.post(reverse('api_status_lote'), corpo, content_type='application/json')
+            self.assertEqual(resposta.status_code, 400, corpo)
+            self.assertIn('erro', resposta.json())
+        resposta = self.client.post(reverse('api_status_lote'), b'{', content_type='application/json')
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(OrdemServico.objects.filter(status='pronto').exists())
+
+    def test_formulario_volta_para_a_lista_filtrada(self):
+        lista = reverse('ordem_servico_lista') + '?status=reparo&busca=samsung'
+        resposta = self.client.post(reverse('ordem_servico_status_lote'), {
+            'ordens': [self.ordens[0].pk], 'novo_status': 'pronto', 'proximo': lista
+        })
+        self.assertRedirects(resposta, lista, fetch_redirect_response=False)
+        self.assertEqual(OrdemServico.objects.get(pk=self.ordens[0].pk).status, 'pronto')
+
+    def test_formulario_nao_redireciona_para_fora_do_site(self):
+        for proximo in ['https://exemplo.com/phishing', '//exemplo.com', 'javascript:alert(1)']:
+            resposta = self.client.post(reverse('ordem_servico_status_lote'), {'ordens': [], 'proximo': proximo})
+            self.assertRedirects(resposta, reverse('ordem_servico_lista'), fetch_redirect_response=False)
+
+
+@override_settings(INDICE_PREFIXOS_ATIVO=False)
+class BuscaPecasApiTest(TestCase):
+    """Autocomplete de peças pelo banco: prefixo indexado e saldo na mesma consulta."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('balcao', password='senha')
+        categoria = CategoriaPeca.objects.create(nome='Telas')
+        for nome in ['Tela iPhone 11', 'Tela Galáxia A10', 'Bateria Moto G', 'Película de tela']:
+            Peca.objects.create(nome=nome, categoria=categoria)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def test_prefixo_sem_acento_e_uma_consulta(self):
+        # sessão + usuário + peças (com saldo)
+        with self.assertNumQueries(3):
+            resposta = self.client.get(reverse('api_buscar_pecas_json'), {'q': 'téla'})
+        nomes = [peca['nome'] for peca in resposta.json()]
+        self.assertEqual(nomes, ['Tela Galáxia A10', 'Tela iPhone 11'])
+        self.assertEqual(resposta.json()[0]['estoque'], 0)
+
+
+class AutocompleteIndiceTest(TestCase):
+    """Autocompletes respondidos pelo índice de prefixos em memória."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('recepcao', password='senha')
+        categoria = CategoriaPeca.objects.create(nome='Telas')
+        cls.tela = Peca.objects.create(nome='Tela Galáxia A10', categoria=categoria)
+        Peca.objects.create(nome='Película de tela', categoria=categoria)
+        Peca.objects.create(nome='Tela antiga', categoria=categoria, ativo=False)
+        Cliente.objects.create(nome='João da Silva', cpf_cnpj='111.222.333-44', telefone_principal='1')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+        indice_pecas.carregar()
+        indice_clientes.carregar()
+
+    def tearDown(self):
+        indice_pecas.invalidar()
+        indice_clientes.invalidar()
+
+    def test_pecas_por_palavra_e_codigo(self):
+        # sessão + usuário + saldos (por chave primária)
+        with self.assertNumQueries(3):
+            resposta = self.client.get(reverse('api_buscar_pecas_json'), {'q': 'tela'})
+        self.assertEqual(
+            sorted(peca['nome'] for peca in resposta.json()), ['Película de tela', 'Tela Galáxia A10']
+        )
+        resposta = self.client.get(reverse('api_buscar_pecas_json'), {'q': self.tela.codigo_interno[:6]})
+        self.assertEqual([peca['id'] for peca in resposta.json()], [self.tela.pk])
+
+    def test_clientes_por_nome_e_cpf(self):
+        for termo in ['silv', 'joão', '111.22', '11122']:
+            with self.assertNumQueries(2):
+                resposta = self.client.get(reverse('buscar_clientes_ajax'), {'termo': termo})
+            self.assertEqual([cliente['nome'] for cliente in resposta.json()['clientes']], ['João da Silva'])
+
+    def test_alteracao_atualiza_indice_apos_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tela.nome = 'Display Galáxia A10'
+            self.tela.save()
+        self.assertEqual([peca['nome'] for peca in buscar_pecas('display')], ['Display Galáxia A10'])
+        self.assertEqual([peca['nome'] for peca in buscar_pecas('tela')], ['Película de tela'])
+
+    def test_banco_acha_o_inicio_e_o_indice_tambem_o_meio_do_nome(self):
+        Cliente.objects.create(nome='Maria Silveira Souza', cpf_cnpj='12.345.678/0001-90', telefone_principal='2')
+        Cliente.objects.create(nome='Oficina do Zé', cpf_cnpj='555.111.222-33', telefone_principal='3')
+        indice_clientes.carregar()
+        # Começo do nome, do código ou do documento: mesmo resultado pelos dois caminhos
+        inicio = [
+            ('api_buscar_pecas_json', 'q', ['TÉLA GAL', 'pelic', 'antiga', self.tela.codigo_interno[:5]]),
+            ('buscar_clientes_ajax', 'termo', ['joão da', 'MARIA', 'ofic', '111.2', '12345', 'ilva']),
+        ]
+        # Palavra do meio do nome: só o índice em memória acha
+        meio = [
+            ('api_buscar_pecas_json', 'q', ['gal', 'a10', 'de t']),
+            ('buscar_clientes_ajax', 'termo', ['silv', 'SOUZA', 'da s', 'ze']),
+        ]
+
+        def resultados(consultas):
+            respostas = {}
+            for url, parametro, termos in consultas:
+                for termo in termos:
+                    dados = self.client.get(reverse(url), {parametro: termo}).json()
+                    itens = dados['clientes'] if url == 'buscar_clientes_ajax' else dados
+                    respostas[termo] = sorted(item['id'] for item in itens)
+            return respostas
+
+        pelo_indice = resultados(inicio)
+        pelo_indice_meio = resultados(meio)
+        with override_settings(INDICE_PREFIXOS_ATIVO=False):
+            self.assertEqual(resultados(inicio), pelo_indice)
+            pelo_banco_meio = resultados(meio)
+        self.assertEqual(pelo_indice['ilva'], [])
+        self.assertEqual(len(pelo_indice_meio['silv']), 2)
+        self.assertTrue(all(pelo_indice_meio.values()))
+        self.assertFalse(any(pelo_banco_meio.values()))
+
+
+@mock.patch('ordem_servico.views.TAMANHO_PAGINA_OS', 2)
+class PaginacaoOrdensTest(TestCase):
+    """Paginação por cursor (data_entrada, id) da lista de OS."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('atendente', password='senha')
+        cliente = Cliente.objects.create(
+            nome='Cliente Cursor', cpf_cnpj='222.333.444-55', telefone_principal='(11) 97777-7777'
+        )
+        cls.ordens = [
+            OrdemServico.objects.create(
+                cliente=cliente, atendente=cls.usuario, tipo_equipamento='Celular',
+                marca='Samsung' if i % 2 else 'Motorola', modelo=f'M{i}', defeito_cliente='Não carrega',
+                status='reparo' if i < 6 else 'analise'
+            )
+            for i in range(7)
+        ]
+        # Várias OS com a mesma data de entrada: a ordem entre elas vem do id
+        mesma_data = timezone.now()
+        OrdemServico.objects.filter(pk__in=[os.pk for os in cls.ordens[1:6]]).update(data_entrada=mesma_data)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def _percorrer(self, **filtros):
+        ids, cursor = [], None
+        while True:
+            parametros = dict(filtros, **({'cursor': cursor} if cursor else {}))
+            dados = self.client.get(reverse('api_ordens_json'), parametros).json()
+            ids += [ordem['id'] for ordem in dados['ordens']]
+            cursor = dados['proximo_cursor']
+            if not cursor:
+                return ids
+
+    def test_paginas_continuas_com_datas_iguais(self):
+        esperado = list(OrdemServico.objects.order_by('-data_entrada', '-pk').values_list('pk', flat=True))
+        self.assertEqual(self._percorrer(), esperado)
+
+    def test_cursor_com_busca_e_status(self):
+        esperado = list(
+            OrdemServico.objects.filter(marca='Samsung', status='reparo')
+            .order_by('-data_entrada', '-pk').values_list('pk', flat=True)
+        )
+        self.assertEqual(len(esperado), 3)
+        self.assertEqual(self._percorrer(busca='samsung', status='reparo'), esperado)
+
+    def test_cursor_invalido_responde_400(self):
+        agora = timezone.now()
+        for cursor in ['lixo!', codificar_cursor(agora.replace(tzinfo=None), 1), codificar_cursor(agora, 2 ** 70)]:
+            resposta = self.client.get(reverse('api_ordens_json'), {'cursor': cursor})
+            self.assertEqual(resposta.status_code, 400)
+            self.assertIn('erro', resposta.json())
+        self.assertEqual(self.client.get(reverse('ordem_servico_lista'), {'cursor': 'lixo!'}).status_code, 400)
+
+
+class TotaisOrdemServicoTest(TestCase):
+    """total_pecas e valor_total acompanham peças, mão de obra e desconto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('tecnico', password='senha')
+        cls.cliente = Cliente.objects.create(
+            nome='Cliente Totais', cpf_cnpj='333.444.555-66', telefone_principal='(11) 96666-6666'
+        )
+        cls.peca = Peca.objects.create(nome='Conector de carga', categoria=CategoriaPeca.objects.create(nome='Conectores'))
+
+    def _nova_os(self):
+        return OrdemServico.objects.create(
+            cliente=self.cliente, atendente=self.usuario, tipo_equipamento='Celular', marca='Xiaomi',
+            modelo='Redmi', defeito_cliente='Não carrega',
+            valor_mao_de_obra=Decimal('100.00'), desconto=Decimal('10.00')
+        )
+
+    def _totais(self, os):
+        return tuple(OrdemServico.objects.filter(pk=os.pk).values_list('total_pecas', 'valor_total').get())
+
+    def test_totais_acompanham_pecas_e_valores(self):
+        os = self._nova_os()
+        self.assertEqual(self._totais(os), (Decimal('0.00'), Decimal('90.00')))
+
+        item = PecaUtilizadaOS.objects.create(os=os, peca=self.peca, quantidade=2, preco_unitario=Decimal('15.00'))
+        self.assertEqual(self._totais(os), (Decimal('30.00'), Decimal('120.00')))
+        item.quantidade = 3
+        item.save()
+        self.assertEqual(self._totais(os), (Decimal('45.00'), Decimal('135.00')))
+
+        os.refresh_from_db()
+        os.valor_mao_de_obra = Decimal('150.00')
+        os.desconto = Decimal('0.00')
+        os.save()
+        self.assertEqual(self._totais(os), (Decimal('45.00'), Decimal('195.00')))
+        self.assertEqual(os.valor_total, Decimal('195.00'))
+
+        item.delete()
+        self.assertEqual(self._totais(os), (Decimal('0.00'), Decimal('150.00')))
+
+    def test_edicao_sem_mudar_valores_nao_recalcula_nem_sobrescreve(self):
+        os = OrdemServico.objects.get(pk=self._nova_os().pk)
+        # Peça gravada por outro caminho: a OS em memória fica com os totais antigos
+        PecaUtilizadaOS.objects.create(os=os, peca=self.peca, quantidade=1, preco_unitario=Decimal('20.00'))
+        os.diagnostico_tecnico = 'Conector oxidado'
+        with CaptureQueriesContext(connection) as contexto:
+            os.save()
+        self.assertFalse([c for c in contexto.captured_queries if 'total_pecas' in c['sql']])
+        self.assertEqual(self._totais(os), (Decimal('20.00'), Decimal('110.00')))
+
+    def test_peca_movida_recalcula_as_duas_os(self):
+        origem, destino = self._nova_os(), self._nova_os()
+        item = PecaUtilizadaOS.objects.create(os=origem, peca=self.peca, quantidade=1, preco_unitario=Decimal('20.00'))
+        item = PecaUtilizadaOS.objects.get(pk=item.pk)
+        item.os = destino
+        item.save()
+        self.assertEqual(self._totais(origem), (Decimal('0.00'), Decimal('90.00')))
+        self.assertEqual(self._totais(destino), (Decimal('20.00'), Decimal('110.00')))
+
+    def test_comando_corrige_totais_divergentes(self):
+        os = self._nova_os()
+        PecaUtilizadaOS.objects.create(os=os, peca=self.peca, quantidade=2, preco_unitario=Decimal('10.00'))
+        OrdemServico.objects.filter(pk=os.pk).update(total_pecas=0, valor_total=0)
+
+        saida = StringIO()
+        call_command('recalcular_totais_os', '--verificar', stdout=saida)
+        self.assertIn('1 com totais divergentes', saida.getvalue())
+        self.assertEqual(self._totais(os), (Decimal('0.00'), Decimal('0.00')))
+
+        call_command('recalcular_totais_os', stdout=StringIO())
+        self.assertEqual(self._totais(os), (Decimal('20.00'), Decimal('110.00')))
+
+
+class ContagemStatusTest(TestCase):
+    """Lista de OS e dashboard dividem a mesma contagem em cache, invalidada após o commit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('gerente', password='senha')
+        cliente = Cliente.objects.create(
+            nome='Cliente Contagem', cpf_cnpj='444.555.666-77', telefone_principal='(11) 95555-5555'
+        )
+        cls.os = OrdemServico.objects.create(
+            cliente=cliente, atendente=cls.usuario, tipo_equipamento='TV', marca='LG',
+            modelo='55UN', defeito_cliente='Sem imagem', status='aprovacao'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def _consultas_contagem(self, contexto):
+        return [c for c in contexto.captured_queries if '"atrasadas"' in c['sql']]
+
+    def test_lista_e_dashboard_usam_uma_consulta(self):
+        with CaptureQueriesContext(connection) as contexto:
+            lista = self.client.get(reverse('ordem_servico_lista'))
+            dashboard = self.client.get(reverse('dashboard'))
+        self.assertEqual(len(self._consultas_contagem(contexto)), 1)
+        self.assertEqual(lista.context['aguardando_aprovacao'], 1)
+        self.assertEqual(dashboard.context['os_aguardando_aprovacao'], 1)
+
+    def test_contagem_atualizada_apos_salvar_os(self):
+        contagem_status()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.os.status = 'reparo'
+            self.os.save()
+            # Antes do commit a contagem em cache continua a anterior
+            self.assertEqual(contagem_status()['aprovacao'], 1)
+        for callback in callbacks:
+            callback()
+
+        resposta = self.client.get(reverse('ordem_servico_lista'))
+        self.assertEqual(resposta.context['aguardando_aprovacao'], 0)
+        self.assertEqual(resposta.context['em_reparo'], 1)
+        self.assertEqual(self.client.get(reverse('dashboard')).context['os_em_reparo'], 1)
+
+
+class BuscaOrdensTest(TestCase):
+    """Índice textual das OS: mantido pelos signals e consultado por prefixo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('recepcionista', password='senha')
+        cls.cliente = Cliente.objects.create(
+            nome='Maria Oliveira', cpf_cnpj='555.666.777-88', telefone_principal='(11) 94444-4444'
+        )
+        cls.samsung = OrdemServico.objects.create(
+            cliente=cls.cliente, atendente=cls.usuario, tipo_equipamento='Celular', marca='Samsung',
+            modelo='Galaxy S20', defeito_cliente='Tela trincada'
+        )
+        cls.lenovo = OrdemServico.objects.create(
+            cliente=cls.cliente, atendente=cls.usuario, tipo_equipamento='Notebook', marca='Lenovo',
+            modelo='Ideapad', defeito_cliente='Não liga'
+        )
+
+    def _filtrar(self, texto):
+        return sorted(filtrar_ordens(OrdemServico.objects.all(), texto).values_list('pk', flat=True))
+
+    def test_busca_por_prefixo(self):
+        self.assertEqual(buscar_ordens('sams'), [self.samsung.pk])
+        self.assertEqual(buscar_ordens('galax trinc'), [self.samsung.pk])
+        self.assertEqual(self._filtrar('ideap'), [self.lenovo.pk])
+        self.assertEqual(self._filtrar('olive'), sorted([self.samsung.pk, self.lenovo.pk]))
+        self.assertEqual(self._filtrar(str(self.lenovo.pk)), [self.lenovo.pk])
+
+    def test_numero_invalido_nao_quebra_a_lista(self):
+        # "²" é dígito para o Python, mas não número; ids maiores que o BIGINT não vão ao banco
+        self.assertEqual(self._filtrar('²'), [])
+        self.assertEqual(self._filtrar('9' * 40), [])
+        self.client.force_login(self.usuario)
+        for busca in ['²', '9' * 40]:
+            resposta = self.client.get(reverse('ordem_servico_lista'), {'busca': busca})
+            self.assertEqual(resposta.status_code, 200)
+
+    def test_signals_mantem_o_indice(self):
+        self.lenovo.diagnostico_tecnico = 'Bateria estufada'
+        self.lenovo.save()
+        self.assertEqual(buscar_ordens('estuf'), [self.lenovo.pk])
+
+        self.cliente.nome = 'Maria Pereira'
+        self.cliente.save()
+        self.assertEqual(sorted(buscar_ordens('pereira')), sorted([self.samsung.pk, self.lenovo.pk]))
+        self.assertEqual(buscar_ordens('oliveira'), [])
+
+        pk = self.samsung.pk
+        self.samsung.delete()
+        self.assertEqual(buscar_ordens('samsung'), [])
+        self.assertNotIn(pk, self._filtrar('pereira'))
+
+    def test_comando_reindexa(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABELA_BUSCA}")
+        self.assertEqual(buscar_ordens('samsung'), [])
+        call_command('reindexar_busca_os', stdout=StringIO())
+        self.assertEqual(buscar_ordens('samsung'), [self.samsung.pk])
+
+
+
+class CriarOrdemServicoTest(TestCase):
+    """A OS nova, as peças e a baixa no estoque são gravadas juntas ou nada é gravado."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('atendente', password='senha')
+        cls.cliente = Cliente.objects.create(
+            nome='Cliente Criação', cpf_cnpj='444.555.666-77', telefone_principal='(11) 95555-5555'
+        )
+        categoria = CategoriaPeca.objects.create(nome='Placas')
+        cls.pecas = [Peca.objects.create(nome=f'Placa {i}', categoria=categoria) for i in range(4)]
+        for peca in cls.pecas:
+            MovimentacaoEstoque.objects.create(
+                peca=peca, tipo='entrada', quantidade=5, valor_unitario=Decimal('10.00'), usuario=cls.usuario
+            )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def _dados(self, quantidades):
+        dados = {
+            'cliente': self.cliente.pk, 'tipo_equipamento': 'Notebook', 'marca': 'Acer', 'modelo': 'Aspire',
+            'defeito_cliente': 'Não liga', 'status': 'recepcao', 'prioridade': 'normal', 'garantia_dias': 90,
+            'valor_mao_de_obra': '80.00', 'desconto': '0.00',
+            'pecas-TOTAL_FORMS': len(quantidades), 'pecas-INITIAL_FORMS': 0,
+            'pecas-MIN_NUM_FORMS': 0, 'pecas-MAX_NUM_FORMS': 1000,
+        }
+        for i, quantidade in enumerate(quantidades):
+            dados[f'pecas-{i}-peca'] = self.pecas[i].pk
+            dados[f'pecas-{i}-quantidade'] = quantidade
+            dados[f'pecas-{i}-preco_unitario'] = '25.00'
+        return dados
+
+    def _forms(self, quantidades):
+        dados = self._dados(quantidades)
+        form = OrdemServicoForm(dados)
+        formset = PecaUtilizadaFormSet(dados, instance=OrdemServico(), prefix='pecas')
+        self.assertTrue(form.is_valid() and formset.is_valid())
+        return form, formset
+
+    def _saldos(self):
+        return list(SaldoEstoque.objects.filter(peca__in=self.pecas).order_by('peca').values_list('quantidade', flat=True))
+
+    def test_falta_na_ultima_peca_nao_grava_nada(self):
+        resposta = self.client.post(reverse('ordem_servico_criar'), self._dados([2, 3, 1, 6]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Placa 3')
+        self.assertIsNone(resposta.context['form'].instance.pk)
+        self.assertFalse(OrdemServico.objects.exists())
+        self.assertFalse(PecaUtilizadaOS.objects.exists())
+        self.assertFalse(MovimentacaoEstoque.objects.filter(tipo='saida').exists())
+        self.assertEqual(self._saldos(), [5, 5, 5, 5])
+
+    def test_form_volta_a_ser_de_os_nova_apos_falta(self):
+        form, formset = self._forms([1, 9])
+        with self.assertRaises(EstoqueInsuficiente):
+            criar_ordem_servico(form, formset, self.usuario)
+        self.assertIsNone(form.instance.pk)
+        self.assertTrue(form.instance._state.adding)
+        self.assertTrue(all(peca.pk is None for peca in formset.new_objects))
+
+    def test_criacao_em_lote_nao_depende_da_quantidade_de_pecas(self):
+        # OS + índice de busca + peças em um INSERT + totais + trava/saldo das peças + movimentações
+        # em um INSERT + saldos + preços: a contagem é a mesma para 1 ou 4 peças
+        contagens = []
+        for quantidades in ([1], [1, 2, 3, 4]):
+            form, formset = self._forms(quantidades)
+            with CaptureQueriesContext(connection) as contexto:
+                os = criar_ordem_servico(form, formset, self.usuario)
+            contagens.append(len(contexto.captured_queries))
+            self.assertEqual(os.pecas.count(), len(quantidades))
+        self.assertEqual(contagens[0], contagens[1])
+
+        form, formset = self._forms([1, 1, 1])
+        with self.assertNumQueries(contagens[0]):
+            criar_ordem_servico(form, formset, self.usuario)
+        self.assertEqual(self._saldos(), [2, 2, 1, 1])
+
+
+class EditarOrdemServicoTest(TestCase):
+    """A edição da OS grava só as movimentações de diferença, na mesma transação do form."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('tecnico', password='senha')
+        cls.cliente = Cliente.objects.create(
+            nome='Cliente Edição', cpf_cnpj='555.666.777-88', telefone_principal='(11) 94444-4444'
+        )
+        categoria = CategoriaPeca.objects.create(nome='Memórias')
+        cls.pecas = [Peca.objects.create(nome=f'Memória {i}', categoria=categoria) for i in range(3)]
+        for peca in cls.pecas:
+            # Custo médio 12,00: 4 a 10,00 + 4 a 14,00
+            for valor in ('10.00', '14.00'):
+                MovimentacaoEstoque.objects.create(
+                    peca=peca, tipo='entrada', quantidade=4, valor_unitario=Decimal(valor), usuario=cls.usuario
+                )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+        self.os = OrdemServico.objects.create(
+            cliente=self.cliente, atendente=self.usuario, tipo_equipamento='Desktop', marca='Positivo',
+            modelo='Master', defeito_cliente='Travando', valor_mao_de_obra=Decimal('60.00')
+        )
+        itens = [(self.pecas[0].pk, 3, Decimal('30.00')), (self.pecas[1].pk, 2, Decimal('30.00'))]
+        for peca_id, quantidade, preco in itens:
+            PecaUtilizadaOS.objects.create(os=self.os, peca_id=peca_id, quantidade=quantidade, preco_unitario=preco)
+        registrar_saidas(itens, self.usuario, ordem_servico=self.os)
+        self.itens = list(self.os.pecas.order_by('peca'))
+
+    def _editar(self, quantidades, novas=(), **campos):
+        """Posta a edição: quantidades das peças atuais (None remove) e novas (peca, quantidade)."""
+        dados = {
+            'cliente': self.cliente.pk, 'tipo_equipamento': 'Desktop', 'marca': 'Positivo', 'modelo': 'Master',
+            'defeito_cliente': 'Travando', 'status': self.os.status, 'prioridade': 'normal',
+            'garantia_dias': 90, 'valor_mao_de_obra': '60.00', 'desconto': '0.00',
+            'pecas-TOTAL_FORMS': len(self.itens) + len(novas), 'pecas-INITIAL_FORMS': len(self.itens),
+            'pecas-MIN_NUM_FORMS': 0, 'pecas-MAX_NUM_FORMS': 1000,
+        }
+        dados.update(campos)
+        for i, (item, quantidade) in enumerate(zip(self.itens, quantidades)):
+            dados.update({
+                f'pecas-{i}-id': item.pk, f'pecas-{i}-os': self.os.pk, f'pecas-{i}-peca': item.peca_id,
+                f'pecas-{i}-quantidade': quantidade or item.quantidade, f'pecas-{i}-preco_unitario': '30.00',
+            })
+            if quantidade is None:
+                dados[f'pecas-{i}-DELETE'] = 'on'
+        for i, (peca, quantidade) in enumerate(novas, start=len(self.itens)):
+            dados.update({
+                f'pecas-{i}-os': self.os.pk, f'pecas-{i}-peca': peca.pk,
+                f'pecas-{i}-quantidade': quantidade, f'pecas-{i}-preco_unitario': '30.00',
+            })
+        return self.client.post(reverse('ordem_servico_editar', args=[self.os.pk]), dados)
+
+    def _ajustes(self):
+        return list(
+            MovimentacaoEstoque.objects.filter(observacoes__startswith='Ajuste automático')
+            .order_by('peca').values_list('peca__nome', 'tipo', 'quantidade')
+        )
+
+    def _saldo(self, peca):
+        return tuple(SaldoEstoque.objects.filter(peca=peca).values_list('quantidade', 'custo_medio').get())
+
+    def test_peca_acrescentada_gera_saida(self):
+        resposta = self._editar([3, 2], novas=[(self.pecas[2], 5)])
+        self.assertRedirects(
+            resposta, reverse('ordem_servico_detalhe', args=[self.os.pk]), fetch_redirect_response=False
+        )
+        self.assertEqual(self._ajustes(), [('Memória 2', 'saida', 5)])
+        self.assertEqual(self._saldo(self.pecas[2]), (3, Decimal('12.0000')))
+
+    def test_peca_reduzida_ou_removida_volta_pelo_custo_medio(self):
+        self.assertEqual(self._saldo(self.pecas[0]), (5, Decimal('12.0000')))
+        resposta = self._editar([1, None])
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(self._ajustes(), [('Memória 0', 'entrada', 2), ('Memória 1', 'entrada', 2)])
+        # A devolução não entra pelo preço de venda (30,00): o custo médio continua 12,00
+        self.assertEqual(self._saldo(self.pecas[0]), (7, Decimal('12.0000')))
+        self.assertEqual(self._saldo(self.pecas[1]), (8, Decimal('12.0000')))
+        self.assertEqual(list(self.os.pecas.values_list('peca', 'quantidade')), [(self.pecas[0].pk, 1)])
+
+    def test_falta_de_estoque_desfaz_a_edicao_inteira(self):
+        resposta = self._editar([9, 1], marca='Lenovo', valor_mao_de_obra='99.00')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Memória 0')
+        self.os.refresh_from_db()
+        self.assertEqual((self.os.marca, self.os.valor_mao_de_obra), ('Positivo', Decimal('60.00')))
+        self.assertEqual(
+            list(self.os.pecas.order_by('peca').values_list('quantidade', flat=True)), [3, 2]
+        )
+        self.assertEqual(self._ajustes(), [])
+        self.assertEqual(self._saldo(self.pecas[0]), (5, Decimal('12.0000')))
+        self.assertEqual(self._saldo(self.pecas[1]), (6, Decimal('12.0000')))
+
+    def test_edicao_sem_mudar_pecas_nao_gera_movimentacao(self):
+        total = MovimentacaoEstoque.objects.count()
+        resposta = self._editar([3, 2], observacoes_internas='Cliente avisado')
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(MovimentacaoEstoque.objects.count(), total)
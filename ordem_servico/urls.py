@@ -7,8 +7,12 @@ urlpatterns = [
     path('<int:pk>/', views.ordem_servico_detalhe, name='ordem_servico_detalhe'),
     path('<int:pk>/editar/', views.ordem_servico_editar, name='ordem_servico_editar'),
     path('<int:pk>/imprimir/', views.ordem_servico_imprimir, name='ordem_servico_imprimir'),
+    path('status-lote/', views.ordem_servico_status_lote, name='ordem_servico_status_lote'),
     
     # Rotas AJAX
     path('buscar-clientes/', views.buscar_clientes_ajax, name='buscar_clientes_ajax'),
+    path('api/status-lote/', views.api_status_lote, name='api_status_lote'),
+    path('api/ordens-json/', views.api_ordens_json, name='api_ordens_json'),
+    path('api/buscar-os-json/', views.api_buscar_os_json, name='api_buscar_os_json'),
     path('api/buscar-pecas-json/', views.api_buscar_pecas_json, name='api_buscar_pecas_json'),
 ]
\ No newline at end of file
@@ -1,43 +1,99 @@
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.views.decorators.http import require_POST
+from django.template.loader import render_to_string
+from django.utils.http import url_has_allowed_host_and_scheme
 
 from .models import OrdemServico, PecaUtilizadaOS
 from .forms import OrdemServicoForm, PecaUtilizadaFormSet
-from estoque.models import Peca, MovimentacaoEstoque
+from .estatisticas import contagem_status
+from .busca import filtrar_ordens, buscar_ordens
+from .servicos import criar_ordem_servico, editar_ordem_servico, transicionar_status, TransicaoInvalida
+from .impressao import impressao_em_cache, versao_impressao, guardar_impressao
+from estoque.models import Peca
+from estoque.servicos import EstoqueInsuficiente, saldos_pecas
+from estoque.autocomplete import buscar_pecas, filtro_pecas
+from clientes.autocomplete import buscar_clientes, filtro_clientes
+from core.paginacao import paginar_por_cursor, CursorInvalido
+
+TAMANHO_PAGINA_OS = 50
+
+
+def _filtrar_ordens(busca, status_filtro):
+    ordens = OrdemServico.objects.select_related('cliente', 'tecnico')
+    
+    if busca:
+        # Índice textual (FTS5/tsvector) sobre cliente, equipamento, defeito e diagnóstico.
+        # A lista só filtra: a ordem continua (data_entrada, id), que é a chave do
+        # cursor de paginação; a ordenação por relevância fica na busca rápida
+        ordens = filtrar_ordens(ordens, busca)
+    
+    if status_filtro:
+        ordens = ordens.filter(status=status_filtro)
+    
+    return ordens
 
 @login_required
 def ordem_servico_lista(request):
     busca = request.GET.get('busca', '')
     status_filtro = request.GET.get('status', '')
     
-    ordens = OrdemServico.objects.select_related('cliente', 'tecnico').all().order_by('-data_entrada')
-    
-    if busca:
-        ordens = ordens.filter(
-            Q(id__icontains=busca) |
-            Q(cliente__nome__icontains=busca) |
-            Q(marca__icontains=busca) |
-            Q(modelo__icontains=busca)
+    contagem = contagem_status()
+    try:
+        ordens, proximo_cursor = paginar_por_cursor(
+            _filtrar_ordens(busca, status_filtro),
+            request.GET.get('cursor'),
+            TAMANHO_PAGINA_OS,
+            'data_entrada'
         )
-    
-    if status_filtro:
-        ordens = ordens.filter(status=status_filtro)
+    except CursorInvalido as e:
+        return HttpResponseBadRequest(str(e))
     
     context = {
         'ordens': ordens,
+        'proximo_cursor': proximo_cursor,
         'STATUS_CHOICES': OrdemServico.STATUS_CHOICES,
-        'total': OrdemServico.objects.count(),
-        'aguardando_aprovacao': OrdemServico.objects.filter(status='aprovacao').count(),
-        'em_reparo': OrdemServico.objects.filter(status='reparo').count(),
+        'total': contagem['total'],
+        'aguardando_aprovacao': contagem['aprovacao'],
+        'em_reparo': contagem['reparo'],
         'busca': busca,
         'status_filtro': status_filtro
     }
     return render(request, 'ordem_servico/ordem_servico_lista.html', context)
 
+@login_required
+def api_ordens_json(request):
+    """Versão JSON da lista de OS para rolagem infinita (mesmos filtros e cursor)."""
+    try:
+        ordens, proximo_cursor = paginar_por_cursor(
+            _filtrar_ordens(request.GET.get('busca', ''), request.GET.get('status', '')),
+            request.GET.get('cursor'),
+            TAMANHO_PAGINA_OS,
+            'data_entrada'
+        )
+    except CursorInvalido as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    data = [{
+        'id': os.id,
+        'cliente': os.cliente.nome,
+        'tipo_equipamento': os.tipo_equipamento,
+        'marca': os.marca,
+        'modelo': os.modelo,
+        'defeito': os.defeito_cliente,
+        'status': os.status,
+        'status_display': os.get_status_display(),
+        'data_entrada': os.data_entrada.isoformat(),
+        'data_previsao': os.data_previsao.isoformat() if os.data_previsao else None,
+        'atrasada': os.esta_atrasada,
+        'valor_total': str(os.valor_total),
+    } for os in ordens]
+    return JsonResponse({'ordens': data, 'proximo_cursor': proximo_cursor})
+
 @login_required
 def ordem_servico_criar(request):
     if request.method == 'POST':
@@ -64,32 +120,12 @@ def ordem_servico_criar(request):
         
         if form.is_valid() and formset.is_valid():
             try:
-                os = form.save(commit=False)
-                os.atendente = request.user
-                os.save()
-                print(f"OS criada: {os.id}")
-                
-                # Salvar peças
-                formset.instance = os
-                pecas_salvas = formset.save()
-                print(f"Peças salvas: {len(pecas_salvas)}")
-                
-                # Baixa no estoque
-                for peca_obj in pecas_salvas:
-                    print(f"Criando movimentação para: {peca_obj.peca.nome}")
-                    MovimentacaoEstoque.objects.create(
-                        peca=peca_obj.peca,
-                        tipo='saida',
-                        quantidade=peca_obj.quantidade,
-                        valor_unitario=peca_obj.preco_unitario,
-                        ordem_servico=os,
-                        usuario=request.user,
-                        observacoes=f"Saída automática via OS {os.id}"
-                    )
-                
+                os = criar_ordem_servico(form, formset, request.user)
                 messages.success(request, f'Ordem de Serviço #{os.id} criada com sucesso!')
                 return redirect('ordem_servico_detalhe', pk=os.pk)
                 
+            except EstoqueInsuficiente as e:
+                messages.error(request, str(e))
             except Exception as e:
                 print(f"ERRO ao salvar: {e}")
                 import traceback
@@ -133,10 +169,11 @@ def ordem_servico_editar(request, pk):
         
         if form.is_valid() and formset.is_valid():
             try:
-                form.save()
-                formset.save()
+                editar_ordem_servico(form, formset, request.user)
                 messages.success(request, 'Ordem de Serviço atualizada com sucesso!')
                 return redirect('ordem_servico_detalhe', pk=os.pk)
+            except EstoqueInsuficiente as e:
+                messages.error(request, str(e))
             except Exception as e:
                 print(f"ERRO ao salvar: {e}")
                 import traceback
@@ -156,35 +193,112 @@ def ordem_servico_editar(request, pk):
 
 @login_required
 def ordem_servico_detalhe(request, pk):
-    os = get_object_or_404(OrdemServico, pk=pk)
-    pecas = os.pecas.select_related('peca').all()
+    # Tudo que o template percorre vem de um único plano de prefetch
+    os = get_object_or_404(OrdemServico.objects.com_detalhes(), pk=pk)
     
     context = {
         'ordem': os,
-        'pecas_utilizadas': pecas,
-        'historico': os.historico.all().order_by('-data_alteracao')
+        'pecas_utilizadas': os.pecas.all(),
+        'historico': os.historico.all()
     }
     return render(request, 'ordem_servico/ordem_servico_detalhe.html', context)
 
 @login_required
 def ordem_servico_imprimir(request, pk):
-    os = get_object_or_404(OrdemServico, pk=pk)
-    pecas = os.pecas.select_related('peca').all()
-    context = {'ordem': os, 'pecas_utilizadas': pecas}
-    return render(request, 'ordem_servico/ordem_servico_imprimir.html', context)
+    # Reimpressões saem do cache enquanto a OS, as peças e o cliente não mudarem
+    html = impressao_em_cache(pk)
+    if html is None:
+        versao = versao_impressao(pk)
+        os = get_object_or_404(OrdemServico.objects.com_pecas(), pk=pk)
+        context = {'ordem': os, 'pecas_utilizadas': os.pecas.all()}
+        html = render_to_string('ordem_servico/ordem_servico_imprimir.html', context, request)
+        guardar_impressao(pk, versao, html)
+    return HttpResponse(html)
+
+@login_required
+@require_POST
+def ordem_servico_status_lote(request):
+    """Muda o status das OS marcadas na lista (ex: bancada inteira de 'reparo' para 'pronto')."""
+    ids = request.POST.getlist('ordens')
+    novo_status = request.POST.get('novo_status', '')
+    
+    if not ids:
+        messages.warning(request, 'Nenhuma OS selecionada.')
+    else:
+        try:
+            ordens = transicionar_status(ids, novo_status, request.user, request.POST.get('observacao', ''))
+            messages.success(request, f'{len(ordens)} OS atualizada(s) para "{dict(OrdemServico.STATUS_CHOICES)[novo_status]}".')
+        except (TransicaoInvalida, ValueError) as e:
+            messages.error(request, str(e))
+    
+    # Volta para a lista com os filtros de onde veio; só aceita endereços deste site
+    proximo = request.POST.get('proximo', '')
+    if not url_has_allowed_host_and_scheme(
+        proximo, allowed_hosts={request.get_host()}, require_https=request.is_secure()
+    ):
+        proximo = 'ordem_servico_lista'
+    return redirect(proximo)
+
+@login_required
+@require_POST
+def api_status_lote(request):
+    """Versão JSON: {"ordens": [1, 2, 3], "status": "pronto", "observacao": "..."}"""
+    try:
+        dados = json.loads(request.body)
+        if not isinstance(dados, dict):
+            raise ValueError('O corpo deve ser um objeto JSON.')
+        ids = dados.get('ordens', [])
+        # bool é subclasse de int no Python, mas true/false não são números de OS
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise ValueError('"ordens" deve ser uma lista de números de OS.')
+        novo_status, observacao = dados.get('status', ''), dados.get('observacao', '')
+        if not isinstance(novo_status, str) or not isinstance(observacao, str):
+            raise ValueError('"status" e "observacao" devem ser textos.')
+        ordens = transicionar_status(ids, novo_status, request.user, observacao)
+    except TransicaoInvalida as e:
+        return JsonResponse({'erro': str(e), 'invalidas': [os.pk for os in e.ordens]}, status=400)
+    except ValueError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    
+    return JsonResponse({'atualizadas': [os.pk for os in ordens]})
+
+@login_required
+def api_buscar_os_json(request):
+    """Busca rápida de OS pelo índice textual, ordenada por relevância."""
+    termo = request.GET.get('q', '')
+    ids = buscar_ordens(termo, limite=20)
+    ordens = OrdemServico.objects.select_related('cliente').in_bulk(ids)
+    data = [{
+        'id': pk,
+        'cliente': ordens[pk].cliente.nome,
+        'equipamento': f"{ordens[pk].tipo_equipamento} {ordens[pk].marca} {ordens[pk].modelo}",
+        'status': ordens[pk].get_status_display(),
+    } for pk in ids if pk in ordens]
+    return JsonResponse(data, safe=False)
 
 @login_required
 def buscar_clientes_ajax(request):
     termo = request.GET.get('termo', '')
     if len(termo) < 2: return JsonResponse({'clientes': []})
-    from clientes.models import Cliente
-    clientes = Cliente.objects.filter(Q(nome__icontains=termo) | Q(cpf_cnpj__icontains=termo)).values('id', 'nome', 'cpf_cnpj')[:10]
+    # Responde pelo índice de prefixos em memória; com ele frio (ainda carregando), vai ao banco
+    clientes = buscar_clientes(termo)
+    if clientes is None:
+        from clientes.models import Cliente
+        clientes = Cliente.objects.filter(filtro_clientes(termo)).values('id', 'nome', 'cpf_cnpj')[:10]
     return JsonResponse({'clientes': list(clientes)})
 
 @login_required
 def api_buscar_pecas_json(request):
     termo = request.GET.get('q', '')
     if not termo: return JsonResponse([], safe=False)
-    pecas = Peca.objects.filter(Q(nome__icontains=termo)|Q(codigo_interno__icontains=termo), ativo=True)[:20]
-    data = [{'id': p.id, 'codigo': p.codigo_interno, 'nome': p.nome, 'estoque': getattr(p, 'quantidade_estoque', 0), 'preco': str(p.preco_venda)} for p in pecas]
+    # Responde pelo índice de prefixos em memória; só o saldo vem do banco (por chave primária)
+    encontradas = buscar_pecas(termo)
+    if encontradas is not None:
+        saldos = saldos_pecas([peca['id'] for peca in encontradas])
+        data = [dict(peca, estoque=saldos[peca['id']]) for peca in encontradas]
+        return JsonResponse(data, safe=False)
+    # Índice frio: busca por prefixo em faixas indexadas (nome normalizado e código interno);
+    # o saldo vem junto pelo JOIN com SaldoEstoque, tudo em uma consulta
+    pecas = Peca.objects.filter(filtro_pecas(termo), ativo=True).select_related('saldo').order_by('nome_busca')[:20]
+    data = [{'id': p.id, 'codigo': p.codigo_interno, 'nome': p.nome, 'estoque': p.quantidade_estoque, 'preco': str(p.preco_venda)} for p in pecas]
     return JsonResponse(data, safe=False)
\ No newline at end of file